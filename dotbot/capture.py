@@ -0,0 +1,141 @@
+"""Module implementing the capture and replay of the serial byte stream."""
+
+import asyncio
+import struct
+import time
+
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import BinaryIO, Callable, Iterator
+
+from dotbot.logger import LOGGER
+
+
+CAPTURE_MAGIC = b"DBCAP\x01"
+# timestamp (s since the capture start), direction, length of data
+CAPTURE_RECORD_HEADER = struct.Struct("<dBI")
+
+
+class CaptureDirection(IntEnum):
+    """Direction of the bytes captured."""
+
+    RX = 0
+    TX = 1
+    # Start of a capture session appended to the file, timestamps restart at 0
+    SESSION = 2
+
+
+@dataclass
+class CaptureRecord:
+    """Chunk of bytes received or transmitted on serial."""
+
+    timestamp: float
+    direction: CaptureDirection
+    data: bytes
+
+
+class CaptureWriter:
+    """Append-only writer of timestamped serial chunks.
+
+    Each writer starts a new session in the file, the timestamps of its
+    records are relative to the session start.
+    """
+
+    def __init__(self, path: str):
+        self._file: BinaryIO = open(path, "ab")  # pylint: disable=consider-using-with
+        if self._file.tell() == 0:
+            self._file.write(CAPTURE_MAGIC)
+        self._start = time.monotonic()
+        self.write(CaptureDirection.SESSION, b"")
+
+    def write(self, direction: CaptureDirection, data: bytes):
+        """Appends a chunk of bytes to the capture."""
+        self._file.write(
+            CAPTURE_RECORD_HEADER.pack(
+                time.monotonic() - self._start, direction, len(data)
+            )
+        )
+        self._file.write(data)
+
+    def close(self):
+        """Flushes and closes the capture file."""
+        self._file.close()
+
+
+def read_capture(path: str) -> Iterator[CaptureRecord]:
+    """Iterates over the records of a capture file."""
+    with open(path, "rb") as capture:
+        if capture.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"Invalid capture file: {path}")
+        while 1:
+            header = capture.read(CAPTURE_RECORD_HEADER.size)
+            if len(header) < CAPTURE_RECORD_HEADER.size:
+                # End of file, or record truncated by an interrupted capture
+                return
+            timestamp, direction, length = CAPTURE_RECORD_HEADER.unpack(header)
+            data = capture.read(length)
+            if len(data) < length:
+                return
+            yield CaptureRecord(timestamp, CaptureDirection(direction), data)
+
+
+class ReplayInterface:
+    """Stands in for a serial interface by replaying the bytes of a capture.
+
+    Received chunks are passed to the callback from the event loop at the
+    capture pace divided by speed, or as fast as possible when speed is 0.
+    Bytes written are discarded.
+    """
+
+    def __init__(self, path: str, callback: Callable, speed: float = 1.0):
+        self.path = path
+        self.callback = callback
+        self.speed = speed
+        self.chunks_replayed = 0
+        self._logger = LOGGER.bind(context=__name__, path=path)
+        loop = asyncio.get_running_loop()
+        self.closed = loop.create_future()
+        self._task = loop.create_task(self._replay())
+
+    async def _replay(self):
+        start = time.monotonic()
+        try:
+            for record in read_capture(self.path):
+                if record.direction == CaptureDirection.SESSION:
+                    # Timestamps of the next records restart at 0
+                    start = time.monotonic()
+                    continue
+                if record.direction != CaptureDirection.RX:
+                    continue
+                if self.speed > 0:
+                    delay = start + record.timestamp / self.speed - time.monotonic()
+                    await asyncio.sleep(max(0, delay))
+                else:
+                    # Let other tasks run between chunks
+                    await asyncio.sleep(0)
+                self.callback(record.data)
+                self.chunks_replayed += 1
+        except (OSError, ValueError) as exc:
+            self._logger.error(f"{exc}")
+            if not self.closed.done():
+                self.closed.set_exception(exc)
+            return
+        self._logger.info(
+            "Replay done",
+            chunks=self.chunks_replayed,
+            duration=time.monotonic() - start,
+        )
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+    def write(self, bytes_) -> asyncio.Future:
+        """Discards the bytes, returns a resolved future."""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(len(bytes_))
+        return future
+
+    def close(self):
+        """Stops the replay."""
+        self._task.cancel()
+        if not self.closed.done():
+            self.closed.set_result(None)
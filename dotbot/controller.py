@@ -1,6 +1,8 @@
 """Interface of the Dotbot controller."""
 
 import asyncio
+import dataclasses
+import functools
 import json
 import math
 import time
@@ -8,8 +10,9 @@ import webbrowser
 
 from abc import ABC, abstractmethod
 from binascii import hexlify
+from concurrent.futures import Future
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 
 import serial
 import websockets
@@ -22,9 +25,12 @@ from rich.live import Live
 from rich.table import Table
 
 from dotbot import GATEWAY_ADDRESS_DEFAULT
-from dotbot.hdlc import HDLCHandler, HDLCState, hdlc_encode
+from dotbot.gateway import Gateway
+from dotbot.hdlc import HDLCStatistics
 from dotbot.logger import LOGGER
 from dotbot.protocol import (
+    HeaderCache,
+    ProtocolFrame,
     ProtocolPayload,
     ProtocolHeader,
     PROTOCOL_VERSION,
@@ -33,7 +39,9 @@ from dotbot.protocol import (
     ApplicationType,
     LH2Location,
 )
-from dotbot.serial_interface import SerialInterface, SerialInterfaceException
+from dotbot.serial_interface import SerialInterfaceException
+from dotbot.scheduler import TransmitStatistics
+from dotbot.tracker import LinkStatistics, RequestTracker
 
 # from dotbot.models import (
 #     DotBotModel,
@@ -43,6 +51,7 @@ from dotbot.serial_interface import SerialInterface, SerialInterfaceException
 # )
 
 from dotbot.models import (
+    DotBotGatewayModel,
     DotBotModel,
     DotBotQueryModel,
     DotBotStatus,
@@ -62,6 +71,8 @@ LOST_DELAY = 5  # seconds
 DEAD_DELAY = 60  # seconds
 LH2_POSITION_DISTANCE_THRESHOLD = 0.01
 GPS_POSITION_DISTANCE_THRESHOLD = 5  # meters
+# Controller is not interested by command messages received
+IGNORED_PAYLOAD_TYPES = (PayloadType.CMD_MOVE_RAW, PayloadType.CMD_RGB_LED)
 
 
 class ControllerException(Exception):
@@ -72,7 +83,7 @@ class ControllerException(Exception):
 class ControllerSettings:
     """Data class that holds controller settings."""
 
-    port: str
+    port: Union[str, List[str]]
     baudrate: int
     dotbot_address: str
     gw_address: str
@@ -81,6 +92,27 @@ class ControllerSettings:
     table: bool = False
     handshake: bool = False
     verbose: bool = False
+    serial_transport: str = "thread"
+    frame_rate: float = 0
+    capture: Optional[str] = None
+    replay_speed: float = 1.0
+
+
+def _sum_statistics(cls, statistics):
+    """Returns the sum of several statistics dataclasses."""
+    return cls(
+        **{
+            field.name: sum(getattr(stats, field.name) for stats in statistics)
+            for field in dataclasses.fields(cls)
+        }
+    )
+
+
+def _capture_path(capture: Optional[str], index: int, count: int) -> Optional[str]:
+    """Returns the capture file of a gateway, numbered if there are several."""
+    if capture is None or count == 1:
+        return capture
+    return f"{capture}.{index}"
 
 
 def lh2_distance(last: DotBotLH2Position, new: DotBotLH2Position) -> float:
@@ -131,13 +163,63 @@ class ControllerBase(ABC):
             application=ApplicationType.DotBot,
             version=PROTOCOL_VERSION,
         )
+        self.headers = HeaderCache(self.header.source, self.header.swarm_id)
+        # Outgoing msg_id sequences and requests waiting for a reply
+        self.tracker = RequestTracker()
         self.settings = settings
-        self.hdlc_handler = HDLCHandler()
-        self.serial = None
+        ports = [settings.port] if isinstance(settings.port, str) else settings.port
+        self.gateways: List[Gateway] = [
+            Gateway(
+                port,
+                settings.baudrate,
+                settings.serial_transport,
+                settings.frame_rate,
+                _capture_path(settings.capture, index, len(ports)),
+                settings.replay_speed,
+                self.tracker,
+            )
+            for index, port in enumerate(ports)
+        ]
+        # Gateway that last heard each dotbot, used to route payloads
+        self.routes: Dict[str, Gateway] = {}
+        self._tx_batch: Optional[List[ProtocolPayload]] = None
         self.websockets = []
         self.lh2_manager = LighthouseManager()
         self.logger = LOGGER.bind(context=__name__)
 
+    @property
+    def serial(self):
+        """Serial interface of the first gateway."""
+        return self.gateways[0].serial
+
+    @serial.setter
+    def serial(self, value):
+        self.gateways[0].serial = value
+
+    @property
+    def hdlc_statistics(self) -> HDLCStatistics:
+        """Returns the statistics of the HDLC receivers of all gateways."""
+        return _sum_statistics(
+            HDLCStatistics,
+            [gateway.hdlc_handler.statistics for gateway in self.gateways],
+        )
+
+    @property
+    def transmit_statistics(self) -> TransmitStatistics:
+        """Returns the statistics of the transmit schedulers of all gateways."""
+        return _sum_statistics(
+            TransmitStatistics,
+            [gateway.tx_scheduler.statistics for gateway in self.gateways],
+        )
+
+    @property
+    def link_statistics(self) -> Dict[str, LinkStatistics]:
+        """Returns the acknowledgment statistics of the requests, per dotbot."""
+        return {
+            f"{destination:016x}": statistics
+            for destination, statistics in self.tracker.statistics.items()
+        }
+
     @abstractmethod
     def init(self):
         """Abstract method to initialize a controller."""
@@ -147,37 +229,37 @@ class ControllerBase(ABC):
         """Abstract method to start a controller."""
 
     async def _start_serial(self):
-        """Starts the serial listener thread in a coroutine."""
-        queue = asyncio.Queue()
-        event_loop = asyncio.get_event_loop()
-
-        def on_byte_received(byte):
-            """Callback called on byte received."""
-            event_loop.call_soon_threadsafe(queue.put_nowait, byte)
-
-        async def _wait_for_handshake(queue):
-            """Waits for handshake reply and checks it."""
-            try:
-                byte = await queue.get()
-            except asyncio.exceptions.CancelledError as exc:
-                raise SerialInterfaceException("Handshake timeout") from exc
-            if int.from_bytes(byte, byteorder="little") != PROTOCOL_VERSION:
-                raise SerialInterfaceException("Handshake failed")
-
-        self.serial = SerialInterface(
-            self.settings.port, self.settings.baudrate, on_byte_received
+        """Starts the serial gateways and waits until they are closed."""
+        await asyncio.gather(
+            *[
+                gateway.run(
+                    functools.partial(self.handle_byte, gateway=gateway),
+                    self.settings.handshake,
+                    self._on_gateway_link_change,
+                )
+                for gateway in self.gateways
+            ]
         )
 
-        self.serial.write(
-            int(PROTOCOL_VERSION).to_bytes(length=1, byteorder="little", signed=False)
+    def _on_gateway_link_change(self, gateway: Gateway):
+        """Notifies the clients that the link with a gateway went up or down."""
+        asyncio.create_task(
+            self.notify_clients(
+                DotBotNotificationModel(
+                    cmd=DotBotNotificationCommand.GATEWAY,
+                    data=DotBotGatewayModel(
+                        port=gateway.port, connected=gateway.connected
+                    ),
+                )
+            )
         )
-        if self.settings.handshake is True:
-            await asyncio.wait_for(_wait_for_handshake(queue), timeout=0.2)
-            self.logger.info("Serial handshake success")
 
-        while 1:
-            byte = await queue.get()
-            self.handle_byte(byte)
+    def get_gateways(self) -> List[DotBotGatewayModel]:
+        """Returns the gateways and the state of their link."""
+        return [
+            DotBotGatewayModel(port=gateway.port, connected=gateway.connected)
+            for gateway in self.gateways
+        ]
 
     async def _open_webbrowser(self):
         """Wait until the server is ready before opening a web browser."""
@@ -217,6 +299,7 @@ class ControllerBase(ABC):
                         previous_status=previous_status.name,
                         status=dotbot.status.name,
                     )
+            self.tracker.expire()
             if needs_refresh is True:
                 await self.notify_clients(
                     DotBotNotificationModel(cmd=DotBotNotificationCommand.RELOAD)
@@ -264,30 +347,49 @@ class ControllerBase(ABC):
             return None
         return self.lh2_manager.compute_position(payload.values)
 
-    def handle_byte(self, byte):
-        """Called on each byte received over UART."""
-        self.hdlc_handler.handle_byte(byte)
-        if self.hdlc_handler.state == HDLCState.READY:
-            payload = self.hdlc_handler.payload
-            if payload:
+    def handle_byte(self, byte, gateway: Optional[Gateway] = None):
+        """Called on each chunk of bytes received over UART."""
+        if gateway is None:
+            gateway = self.gateways[0]
+        # Replies to the payloads of a chunk are sent in a single write
+        self._tx_batch = []
+        try:
+            for data in gateway.hdlc_handler.feed(byte):
                 try:
-                    payload = ProtocolPayload.from_bytes(payload)
+                    # Only the header is decoded for frames dropped below
+                    frame = ProtocolFrame(data)
+                    source = f"{frame.source:016x}"
+                    if source != GATEWAY_ADDRESS_DEFAULT:
+                        self.routes[source] = gateway
+                    # Replies come from the destination, echoes go to it
+                    peer = (
+                        frame.destination
+                        if frame.source == self.headers.source
+                        else frame.source
+                    )
+                    self.tracker.received(peer, frame.msg_id, frame.payload_type)
+                    if frame.payload_type in IGNORED_PAYLOAD_TYPES:
+                        continue
+                    if source == GATEWAY_ADDRESS_DEFAULT:
+                        self.logger.warning("Invalid source in payload")
+                        continue
+                    payload = frame.to_payload()
                 except ProtocolPayloadParserException:
                     self.logger.warning("Cannot parse payload")
                     if self.settings.verbose is True:
-                        print(payload)
-                    return
+                        print(bytes(data))
+                    continue
                 self.handle_received_payload(payload)
+        finally:
+            batch, self._tx_batch = self._tx_batch, None
+            if batch:
+                self.send_payloads(batch)
 
     def handle_received_payload(
         self, payload: ProtocolPayload
     ):  # pylint:disable=too-many-branches,too-many-statements
         """Handle a received payload."""
-        # Controller is not interested by command messages received
-        if payload.payload_type in [
-            PayloadType.CMD_MOVE_RAW,
-            PayloadType.CMD_RGB_LED,
-        ]:
+        if payload.payload_type in IGNORED_PAYLOAD_TYPES:
             return
         source = hexlify(int(payload.header.source).to_bytes(8, "big")).decode()
         logger = self.logger.bind(
@@ -350,16 +452,9 @@ class ControllerBase(ABC):
             if len(dotbot.position_history) > MAX_POSITION_HISTORY_SIZE:
                 dotbot.position_history.pop(0)
             # Send the computed position back to the dotbot
-            header = ProtocolHeader(
-                destination=int(source, 16),
-                source=int(self.settings.gw_address, 16),
-                swarm_id=int(self.settings.swarm_id, 16),
-                application=dotbot.application,
-                version=PROTOCOL_VERSION,
-            )
             self.send_payload(
                 ProtocolPayload(
-                    header,
+                    self.headers.get(source, dotbot.application),
                     PayloadType.LH2_LOCATION,
                     LH2Location(
                         int(dotbot.lh2_position.x * 1e6),
@@ -426,23 +521,74 @@ class ControllerBase(ABC):
             ]
         )
 
-    def send_payload(self, payload: ProtocolPayload):
-        """Sends a command in an HDLC frame over serial."""
-        destination = hexlify(
-            int(payload.header.destination).to_bytes(8, "big")
-        ).decode()
+    def send_payload(self, payload: ProtocolPayload) -> Optional[Future]:
+        """Sends a command in an HDLC frame over serial.
+
+        Returns a future resolved when the frame is written, or None if nothing
+        was sent immediately.
+        """
+        if self._tx_batch is not None:
+            self._tx_batch.append(payload)
+            return None
+        return self.send_payloads([payload])
+
+    def send_request(self, payload: ProtocolPayload) -> Optional[Future]:
+        """Sends a command and tracks the reply of its destination.
+
+        Returns a future resolved with the round-trip time in seconds when a
+        frame with the same msg_id is received from, or echoed to, the
+        destination, or None if the destination is unknown.
+        """
+        gateway = self._route(payload)
+        if gateway is None:
+            return None
+        future = self.tracker.expect(
+            payload.header.destination, payload.header.msg_id, payload.payload_type
+        )
+        gateway.send_payloads([payload])
+        return future
+
+    def _route(self, payload: ProtocolPayload) -> Optional[Gateway]:
+        """Stamps a payload with the next msg_id of its destination.
+
+        Returns the gateway that last heard the destination, or None if the
+        payload cannot be sent.
+        """
+        destination = f"{payload.header.destination:016x}"
         if destination not in self.dotbots:
-            return
+            return None
+        gateway = self.routes.get(destination, self.gateways[0])
+        if gateway.serial is None:
+            return None
+        header = payload.header
         # make sure the application in the payload matches the bot application
-        payload.header.application = self.dotbots[destination].application
-        if self.serial is not None:
-            self.serial.write(hdlc_encode(payload.to_bytes()))
-            self.logger.debug(
-                "Payload sent",
-                application=payload.header.application.name,
-                destination=destination,
-                payload_type=payload.payload_type.name,
-            )
+        application = self.dotbots[destination].application
+        if header.application is not application:
+            # Headers can be shared, never modify them in place
+            header = dataclasses.replace(header, application=application)
+        payload.header = header.with_msg_id(
+            self.tracker.next_msg_id(header.destination)
+        )
+        return gateway
+
+    def send_payloads(self, payloads: List[ProtocolPayload]) -> Optional[Future]:
+        """Sends several commands in HDLC frames with a single serial write.
+
+        Each payload goes through the gateway that last heard its destination.
+        Payloads are queued in the gateway transmit scheduler while a previous
+        write is in progress, a queued move, LED or LH2 location command is
+        replaced by a newer one. Returns the future of the last payload queued.
+        """
+        to_send: Dict[Gateway, List[ProtocolPayload]] = {}
+        for payload in payloads:
+            gateway = self._route(payload)
+            if gateway is None:
+                continue
+            to_send.setdefault(gateway, []).append(payload)
+        future = None
+        for gateway, gateway_payloads in to_send.items():
+            future = gateway.send_payloads(gateway_payloads)
+        return future
 
     def get_dotbots(self, query: DotBotQueryModel) -> List[DotBotModel]:
         """Returns the list of dotbots matching the query."""
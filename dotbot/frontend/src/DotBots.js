@@ -9,7 +9,7 @@ import { DotBotsMap } from "./DotBotsMap";
 import { SailBotsMap } from "./SailBotsMap";
 import {
   apiUpdateActiveDotbotAddress, apiFetchActiveDotbotAddress,
-  apiFetchDotbots, apiUpdateRgbLed, apiUpdateMoveRaw,
+  apiFetchDotbots, apiFetchGateways, apiUpdateRgbLed, apiUpdateMoveRaw,
   apiUpdateWaypoints, apiClearPositionsHistory, inactiveAddress,
 } from "./rest";
 import { ApplicationType, gps_distance_threshold, lh2_distance_threshold, maxWaypoints, NotificationType, maxPositionHistory } from "./constants";
@@ -270,6 +270,7 @@ const DotBots = () => {
   const [ showDotBotHistory, setShowDotBotHistory ] = useState(true);
   const [ dotbotHistorySize, setDotbotHistorySize ] = useState(maxPositionHistory);
   const [ showSailBotHistory, setShowSailBotHistory ] = useState(true);
+  const [ gateways, setGateways ] = useState([]);
 
   const control = useKeyPress("Control");
   const enter = useKeyPress("Enter")
@@ -297,6 +298,14 @@ const DotBots = () => {
   }, [setDotbots, setActiveDotbot]
   );
 
+  const fetchGateways = useCallback(async () => {
+    const data = await apiFetchGateways().catch(error => console.log(error));
+    if (data) {
+      setGateways(data);
+    }
+  }, [setGateways]
+  );
+
   const mapClicked = useCallback((x, y) => {
     if (!dotbots || dotbots.length === 0) {
       return;
@@ -398,6 +407,7 @@ const DotBots = () => {
   const onWsOpen = () => {
     console.log('websocket opened');
     fetchDotBots();
+    fetchGateways();
   };
 
   const onWsMessage = (event) => {
@@ -405,6 +415,10 @@ const DotBots = () => {
     if (message.cmd === NotificationType.Reload) {
       fetchDotBots();
     }
+    if (message.cmd === NotificationType.Gateway) {
+      const others = gateways.filter(gateway => gateway.port !== message.data.port);
+      setGateways([...others, message.data].sort((a, b) => a.port.localeCompare(b.port)));
+    }
     if (message.cmd === NotificationType.Update && dotbots && dotbots.length > 0) {
       let dotbotsTmp = dotbots.slice();
       for (let idx = 0; idx < dotbots.length; idx++) {
@@ -494,6 +508,11 @@ const DotBots = () => {
       </div>
     </nav>
     <div className="container">
+      {gateways.filter(gateway => !gateway.connected).map(gateway =>
+        <div key={gateway.port} className="alert alert-warning m-1" role="alert">
+          Gateway {gateway.port} disconnected
+        </div>
+      )}
       {dotbots && dotbots.length > 0 && (
       <>
       {dotbots.filter(dotbot => dotbot.application === ApplicationType.DotBot).length > 0 &&
@@ -81,6 +81,9 @@ const server = setupServer(
         });
         return res();
     }),
+    rest.get('/controller/gateways', (req, res, ctx) => {
+        return res(ctx.json([{port: "/dev/ttyACM0", connected: true}]));
+    }),
     rest.get('/controller/lh2/calibration', (req, res, ctx) => {
         return res(ctx.json({state: "done"}));
     }),
@@ -120,3 +123,15 @@ test('DotBots main page', async () => {
     await new Promise(r => setTimeout(r, 100));
     expect(currentActive).toEqual("3131");
 });
+
+test('DotBots gateway link notifications', async () => {
+    render(<DotBots />);
+    await waitFor(() => expect(screen.getByText("Available DotBots")).toBeVisible());
+    expect(screen.queryByText("Gateway /dev/ttyACM0 disconnected")).toBeNull();
+
+    await waitFor(() => wsServer.send('{"cmd":3,"data":{"port":"/dev/ttyACM0","connected":false}}'));
+    await waitFor(() => expect(screen.getByText("Gateway /dev/ttyACM0 disconnected")).toBeVisible());
+
+    await waitFor(() => wsServer.send('{"cmd":3,"data":{"port":"/dev/ttyACM0","connected":true}}'));
+    await waitFor(() => expect(screen.queryByText("Gateway /dev/ttyACM0 disconnected")).toBeNull());
+});
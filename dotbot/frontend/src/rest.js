@@ -22,6 +22,12 @@ export const apiFetchDotbot = async (address) => {
     ).then(res => res.data);
   }
 
+export const apiFetchGateways = async () => {
+  return await axios.get(
+    `${process.env.REACT_APP_DOTBOTS_BASE_URL}/controller/gateways`,
+  ).then(res => res.data);
+}
+
 export const apiFetchActiveDotbotAddress = async () => {
   return await axios.get(
     `${process.env.REACT_APP_DOTBOTS_BASE_URL}/controller/dotbot_address`,
@@ -0,0 +1,247 @@
+"""Module implementing a serial gateway attached to the controller."""
+
+import asyncio
+
+from binascii import hexlify
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+import serial
+
+from dotbot.capture import CaptureDirection, CaptureWriter, ReplayInterface
+from dotbot.hdlc import HDLCHandler, hdlc_encode_many
+from dotbot.logger import LOGGER
+from dotbot.protocol import PROTOCOL_VERSION, ProtocolPayload
+from dotbot.scheduler import TransmitScheduler
+from dotbot.serial_interface import (
+    AsyncSerialInterface,
+    SerialInterface,
+    SerialInterfaceException,
+    SocketInterface,
+    parse_socket_url,
+)
+from dotbot.tracker import RequestTracker
+
+
+RECONNECT_DELAY_MIN = 0.5
+RECONNECT_DELAY_MAX = 10.0
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class Gateway:  # pylint: disable=too-many-instance-attributes
+    """Serial gateway with its own receiver and transmit scheduler.
+
+    With the "replay" transport, port is the path of a capture file replayed
+    at replay_speed (0 means as fast as possible).
+    """
+
+    def __init__(
+        self,
+        port: str,
+        baudrate: int,
+        serial_transport: str = "thread",
+        frame_rate: float = 0,
+        capture: Optional[str] = None,
+        replay_speed: float = 1.0,
+        tracker: Optional[RequestTracker] = None,
+    ):  # pylint: disable=too-many-arguments
+        self.port = port
+        self.baudrate = baudrate
+        self.serial_transport = serial_transport
+        self.capture = capture
+        self.replay_speed = replay_speed
+        self.tracker = tracker
+        self.serial = None
+        self.connected = False
+        self.link_ups = 0
+        self.on_link_change: Optional[Callable[["Gateway"], None]] = None
+        self._capture_writer: Optional[CaptureWriter] = None
+        self.hdlc_handler = HDLCHandler()
+        self.tx_scheduler = TransmitScheduler(frame_rate)
+        self._tx_in_flight = False
+        self._tx_timer: Optional[asyncio.TimerHandle] = None
+        self.logger = LOGGER.bind(context=__name__, port=port)
+
+    async def start(self, callback: Callable[[bytes], None], handshake: bool = False):
+        """Starts the serial interface and waits until it is closed."""
+        event_loop = asyncio.get_running_loop()
+        handshake_reply = event_loop.create_future()
+
+        def on_data_received(data):
+            """Callback called on chunk of bytes received."""
+            if self._capture_writer is not None:
+                self._capture_writer.write(CaptureDirection.RX, data)
+            if handshake is True and not handshake_reply.done():
+                handshake_reply.set_result(data[0])
+                # Bytes received right after the handshake reply
+                data = data[1:]
+            callback(data)
+
+        if self.capture is not None:
+            self._capture_writer = CaptureWriter(self.capture)
+        try:
+            self.serial = await self._open(on_data_received)
+            self._write(
+                int(PROTOCOL_VERSION).to_bytes(
+                    length=1, byteorder="little", signed=False
+                )
+            )
+            if handshake is True:
+                try:
+                    version = await asyncio.wait_for(handshake_reply, timeout=0.2)
+                except asyncio.TimeoutError as exc:
+                    raise SerialInterfaceException("Handshake timeout") from exc
+                if version != PROTOCOL_VERSION:
+                    raise SerialInterfaceException("Handshake failed")
+                self.logger.info("Serial handshake success")
+
+            self._set_connected(True)
+            await asyncio.wrap_future(self.serial.closed)
+        finally:
+            self._set_connected(False)
+            if self._capture_writer is not None:
+                self._capture_writer.close()
+                self._capture_writer = None
+
+    async def run(
+        self,
+        callback: Callable[[bytes], None],
+        handshake: bool = False,
+        on_link_change: Optional[Callable[["Gateway"], None]] = None,
+    ):
+        """Starts the gateway and reopens the serial port when the link is lost.
+
+        Errors are raised as long as the link was never established, the serial
+        port is then reopened with an exponential backoff until it is closed on
+        purpose.
+        """
+        self.on_link_change = on_link_change
+        delay = RECONNECT_DELAY_MIN
+        while 1:
+            link_ups = self.link_ups
+            try:
+                await self.start(callback, handshake)
+                return
+            except (SerialInterfaceException, serial.serialutil.SerialException) as exc:
+                if self.link_ups == 0:
+                    raise
+                if self.link_ups > link_ups:
+                    # The link was up until now, retry quickly
+                    delay = RECONNECT_DELAY_MIN
+                self.logger.warning(
+                    "Serial link lost, reconnecting", error=f"{exc}", delay=delay
+                )
+                if self.serial is not None:
+                    self.serial.close()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
+                # Drop the partial frame received before the link was lost
+                self.hdlc_handler.reset()
+                self._tx_in_flight = False
+
+    def _set_connected(self, connected: bool):
+        """Updates the link state and notifies it if it changed."""
+        if connected == self.connected:
+            return
+        self.connected = connected
+        if connected is True:
+            self.link_ups += 1
+        self.logger.info("Serial link up" if connected else "Serial link down")
+        if self.on_link_change is not None:
+            self.on_link_change(self)
+
+    async def _open(self, callback: Callable[[bytes], None]):
+        """Opens the interface matching the port and the serial transport."""
+        if parse_socket_url(self.port) is not None:
+            return await SocketInterface.open(self.port, callback)
+        if self.serial_transport == "replay":
+            return ReplayInterface(self.port, callback, self.replay_speed)
+        if self.serial_transport == "asyncio":
+            return AsyncSerialInterface(self.port, self.baudrate, callback)
+        event_loop = asyncio.get_running_loop()
+        return SerialInterface(
+            self.port,
+            self.baudrate,
+            lambda data: event_loop.call_soon_threadsafe(callback, data),
+        )
+
+    def _write(self, data: bytes):
+        """Writes bytes to serial and to the capture file if any."""
+        if self._capture_writer is not None:
+            self._capture_writer.write(CaptureDirection.TX, data)
+        return self.serial.write(data)
+
+    def send_payloads(self, payloads: List[ProtocolPayload]) -> Optional[Future]:
+        """Queues payloads for transmission, returns the future of the last one."""
+        future = None
+        for payload in payloads:
+            future = self.tx_scheduler.push(payload)
+        if future is not None:
+            self._transmit()
+        return future
+
+    def _transmit(self):
+        """Writes the queued payloads to serial unless a write is in progress."""
+        if self._tx_in_flight or self.serial is None or not self.tx_scheduler:
+            return
+        event_loop = _running_loop()
+        entries = self.tx_scheduler.pop_ready()
+        if not entries:
+            # Airtime budget exhausted, retry when it is replenished
+            if self.tx_scheduler and event_loop and self._tx_timer is None:
+                self._tx_timer = event_loop.call_later(
+                    self.tx_scheduler.delay(), self._on_transmit_timer
+                )
+            return
+        write_future = self._write(
+            hdlc_encode_many(payload.to_bytes() for payload, _ in entries)
+        )
+        for payload, _ in entries:
+            if self.tracker is not None:
+                self.tracker.sent(payload.header.destination, payload.header.msg_id)
+            self.logger.debug(
+                "Payload sent",
+                application=payload.header.application.name,
+                destination=hexlify(
+                    int(payload.header.destination).to_bytes(8, "big")
+                ).decode(),
+                payload_type=payload.payload_type.name,
+            )
+        if not isinstance(write_future, (Future, asyncio.Future)):
+            # Synchronous write, the payloads are already on the wire
+            for _, future in entries:
+                future.set_result(write_future)
+            self._transmit()
+            return
+
+        def on_written(write_future):
+            """Resolves the payload futures and sends what was queued meanwhile."""
+            self._tx_in_flight = False
+            for _, future in entries:
+                if write_future.cancelled():
+                    future.cancel()
+                elif write_future.exception() is not None:
+                    future.set_exception(write_future.exception())
+                else:
+                    future.set_result(write_future.result())
+            self._transmit()
+
+        self._tx_in_flight = True
+        if isinstance(write_future, Future) and event_loop is not None:
+            # Concurrent futures are resolved from the serial writer thread
+            write_future.add_done_callback(
+                lambda f: event_loop.call_soon_threadsafe(on_written, f)
+            )
+        else:
+            write_future.add_done_callback(on_written)
+
+    def _on_transmit_timer(self):
+        """Called when the airtime budget allows sending queued payloads."""
+        self._tx_timer = None
+        self._transmit()
@@ -1,6 +1,12 @@
 """Module implementing HDLC protocol primitives."""
 
+import os
+import sys
+
+from ctypes import CDLL, c_char_p, c_size_t, c_uint16, create_string_buffer
+from dataclasses import dataclass
 from enum import Enum
+from typing import Iterable, List, Optional
 
 from dotbot.logger import LOGGER
 
@@ -11,6 +17,16 @@ HDLC_ESCAPE = b"\x7D"
 HDLC_ESCAPE_ESCAPED = b"\x5D"
 HDLC_FCS_INIT = 0xFFFF
 HDLC_FCS_OK = 0xF0B8
+HDLC_FRAME_MAX_SIZE = 3089  # Largest payload (255 LH2 waypoints) + FCS
+
+if sys.platform == "win32":
+    LIB_EXT = "dll"
+elif sys.platform == "darwin":
+    LIB_EXT = "dylib"
+else:
+    LIB_EXT = "so"
+
+HDLC_LIB_PATH = os.path.join(os.path.dirname(__file__), "lib", f"lh2.{LIB_EXT}")
 
 # fmt: off
 FCS16TAB = (
@@ -58,21 +74,98 @@ def _fcs_update(fcs, byte):
     return (fcs >> 8) ^ FCS16TAB[((fcs ^ ord(byte)) & 0xFF)]
 
 
-def _to_byte(value):
-    return int(value).to_bytes(1, "little")
+def _fcs_compute_python(fcs, data) -> int:
+    """Update the frame check sequence with all bytes in data."""
+    table = FCS16TAB
+    for byte in data:
+        fcs = (fcs >> 8) ^ table[(fcs ^ byte) & 0xFF]
+    return fcs
+
+
+def _escape_python(data: bytes) -> bytes:
+    """Escape all flag and escape bytes contained in data."""
+    if HDLC_ESCAPE not in data and HDLC_FLAG not in data:
+        return data
+    return data.replace(HDLC_ESCAPE, HDLC_ESCAPE + HDLC_ESCAPE_ESCAPED).replace(
+        HDLC_FLAG, HDLC_ESCAPE + HDLC_FLAG_ESCAPED
+    )
 
 
-def _escape_byte(byte) -> bytes:
-    result = bytearray()
-    if byte == HDLC_ESCAPE:
-        result += HDLC_ESCAPE
-        result += HDLC_ESCAPE_ESCAPED
-    elif byte == HDLC_FLAG:
-        result += HDLC_ESCAPE
-        result += HDLC_FLAG_ESCAPED
-    else:
-        result += byte
-    return result
+def _unescape_python(data: bytes) -> bytes:
+    """Revert the escaping of flag and escape bytes contained in data.
+
+    Unknown escape sequences and trailing escape bytes are dropped.
+
+    >>> _unescape_python(b"}^test}]")
+    b'~test}'
+    >>> _unescape_python(b"a}\\x03b}}^c}")
+    b'ab~c'
+    """
+    if HDLC_ESCAPE not in data:
+        return data
+    parts = data.split(HDLC_ESCAPE)
+    output = [parts[0]]
+    for part in parts[1:]:
+        if not part:
+            # Consecutive escape bytes, only the last one is used
+            continue
+        if part[0] == HDLC_FLAG_ESCAPED[0]:
+            output.append(HDLC_FLAG)
+        elif part[0] == HDLC_ESCAPE_ESCAPED[0]:
+            output.append(HDLC_ESCAPE)
+        output.append(part[1:])
+    return b"".join(output)
+
+
+def _load_native_lib() -> Optional[CDLL]:
+    """Load the native HDLC functions, returns None if not available."""
+    try:
+        lib = CDLL(HDLC_LIB_PATH)
+        lib.hdlc_fcs_update.argtypes = [c_uint16, c_char_p, c_size_t]
+        lib.hdlc_fcs_update.restype = c_uint16
+        lib.hdlc_escape.argtypes = [c_char_p, c_size_t, c_char_p]
+        lib.hdlc_escape.restype = c_size_t
+        lib.hdlc_unescape.argtypes = [c_char_p, c_size_t, c_char_p]
+        lib.hdlc_unescape.restype = c_size_t
+    except (OSError, AttributeError):
+        return None
+    return lib
+
+
+HDLC_LIB = _load_native_lib()
+
+
+def _fcs_compute_native(fcs, data) -> int:
+    """Update the frame check sequence with all bytes in data."""
+    return HDLC_LIB.hdlc_fcs_update(fcs, bytes(data), len(data))
+
+
+def _escape_native(data: bytes) -> bytes:
+    """Escape all flag and escape bytes contained in data."""
+    if HDLC_ESCAPE not in data and HDLC_FLAG not in data:
+        return data
+    output = create_string_buffer(2 * len(data))
+    length = HDLC_LIB.hdlc_escape(bytes(data), len(data), output)
+    return output.raw[:length]
+
+
+def _unescape_native(data: bytes) -> bytes:
+    """Revert the escaping of flag and escape bytes contained in data."""
+    if HDLC_ESCAPE not in data:
+        return data
+    output = create_string_buffer(len(data))
+    length = HDLC_LIB.hdlc_unescape(bytes(data), len(data), output)
+    return output.raw[:length]
+
+
+if HDLC_LIB is not None:
+    _fcs_compute = _fcs_compute_native
+    _escape = _escape_native
+    _unescape = _unescape_native
+else:
+    _fcs_compute = _fcs_compute_python
+    _escape = _escape_python
+    _unescape = _unescape_python
 
 
 def hdlc_encode(payload: bytes) -> bytes:
@@ -94,29 +187,28 @@ def hdlc_encode(payload: bytes) -> bytes:
     >>> hdlc_encode(b"'$W\\x82")
     bytearray(b"~\\'$W\\x82\\x13}]~")
     """
-    # initialize output buffer
-    hdlc_frame = bytearray()
-
-    # initialize frame check sequence
-    fcs = HDLC_FCS_INIT
-
-    # add start flag
+    fcs = 0xFFFF - _fcs_compute(HDLC_FCS_INIT, payload)
+    hdlc_frame = bytearray(HDLC_FLAG)
+    hdlc_frame += _escape(bytes(payload) + fcs.to_bytes(2, "little"))
     hdlc_frame += HDLC_FLAG
+    return hdlc_frame
 
-    # write payload in frame
-    for byte in payload:
-        fcs = _fcs_update(fcs, _to_byte(byte))
-        hdlc_frame += _escape_byte(_to_byte(byte))
-    fcs = 0xFFFF - fcs
-
-    # add FCS
-    hdlc_frame += _escape_byte(_to_byte(fcs & 0xFF))
-    hdlc_frame += _escape_byte(_to_byte((fcs & 0xFF00) >> 8))
 
-    # add end flag
-    hdlc_frame += HDLC_FLAG
+def hdlc_encode_many(payloads: Iterable[bytes]) -> bytes:
+    """Encodes several payloads in HDLC frames stored one after the other.
 
-    return hdlc_frame
+    >>> hdlc_encode_many([b"test", b"~test}"])
+    bytearray(b'~test\\x88\\x07~~}^test}]\\x06\\x94~')
+    >>> hdlc_encode_many([])
+    bytearray(b'')
+    """
+    frames = bytearray()
+    for payload in payloads:
+        fcs = 0xFFFF - _fcs_compute(HDLC_FCS_INIT, payload)
+        frames += HDLC_FLAG
+        frames += _escape(bytes(payload) + fcs.to_bytes(2, "little"))
+        frames += HDLC_FLAG
+    return frames
 
 
 def hdlc_decode(frame: bytes) -> bytes:
@@ -144,28 +236,14 @@ def hdlc_decode(frame: bytes) -> bytes:
     >>> hdlc_decode(b"~\\x00~")
     Traceback (most recent call last):
     dotbot.hdlc.HDLCDecodeException: Invalid payload
+    >>> hdlc_decode(b"~}\\x03~")
+    Traceback (most recent call last):
+    dotbot.hdlc.HDLCDecodeException: Invalid payload
     """
-    output = bytearray()
-    fcs = HDLC_FCS_INIT
-    escape_byte = False
-    for byte in frame[1:-1]:
-        byte = _to_byte(byte)
-        if byte == HDLC_ESCAPE:
-            escape_byte = True
-        elif escape_byte is True:
-            if byte == HDLC_ESCAPE_ESCAPED:
-                output += HDLC_ESCAPE
-                fcs = _fcs_update(fcs, HDLC_ESCAPE)
-            elif byte == HDLC_FLAG_ESCAPED:
-                output += HDLC_FLAG
-                fcs = _fcs_update(fcs, HDLC_FLAG)
-            escape_byte = False
-        else:
-            output += byte
-            fcs = _fcs_update(fcs, byte)
+    output = bytearray(_unescape(frame[1:-1]))
     if len(output) < 2:
         raise HDLCDecodeException("Invalid payload")
-    if fcs != HDLC_FCS_OK:
+    if _fcs_compute(HDLC_FCS_INIT, output) != HDLC_FCS_OK:
         raise HDLCDecodeException("Invalid FCS")
     return output[:-2]
 
@@ -178,16 +256,46 @@ class HDLCState(Enum):
     READY = 2
 
 
+@dataclass
+class HDLCStatistics:
+    """Cumulative counters of an HDLC handler."""
+
+    bytes_received: int = 0
+    bytes_discarded: int = 0
+    frames_ok: int = 0
+    fcs_errors: int = 0
+    short_frames: int = 0
+    oversize_frames: int = 0
+    aborted_frames: int = 0
+
+
 class HDLCHandler:
-    """Handles the reception of an HDLC frame byte by byte."""
+    """Handles the reception of an HDLC frame byte by byte.
 
-    def __init__(self):
+    Frames are unescaped in a preallocated buffer and payloads are returned as
+    memoryview slices of this buffer: they are only valid until the next call
+    to handle_byte or feed.
+
+    Frames larger than max_frame_size (payload + FCS) and aborted frames (escape
+    byte followed by a flag) are discarded.
+    """
+
+    def __init__(self, max_frame_size: int = HDLC_FRAME_MAX_SIZE):
         self.state = HDLCState.IDLE
         self.fcs = HDLC_FCS_INIT
-        self.output = bytearray()
         self.escape_byte = False
+        self.max_frame_size = max_frame_size
+        self.statistics = HDLCStatistics()
+        self._buffer = bytearray(max_frame_size)
+        self._start = 0
+        self._length = 0
         self._logger = LOGGER.bind(context=__name__)
 
+    @property
+    def output(self) -> memoryview:
+        """Returns the content of the frame being received."""
+        return memoryview(self._buffer)[self._start : self._length]
+
     @property
     def payload(self):
         """Returns the payload contained in a frame."""
@@ -195,22 +303,74 @@ class HDLCHandler:
             raise HDLCDecodeException("Incomplete HDLC frame")
 
         self.state = HDLCState.IDLE
-        if len(self.output) < 2:
+        if self._length - self._start < 2:
+            self.statistics.short_frames += 1
             self._logger.error("Invalid payload")
             return bytearray()
         if self.fcs != HDLC_FCS_OK:
+            self.statistics.fcs_errors += 1
             self._logger.error("Invalid FCS")
             return bytearray()
+        self.statistics.frames_ok += 1
+        self.fcs = HDLC_FCS_INIT
+        return memoryview(self._buffer)[self._start : self._length - 2]
+
+    def reset(self):
+        """Drop any frame being received and wait for the next flag."""
+        self.state = HDLCState.IDLE
         self.fcs = HDLC_FCS_INIT
-        return self.output[:-2]
+        self.escape_byte = False
+        self._start = 0
+        self._length = 0
+
+    def _start_frame(self, start):
+        self._start = start
+        self._length = start
+        self.fcs = HDLC_FCS_INIT
+        self.escape_byte = False
+        self.state = HDLCState.RECEIVING
+
+    def _write(self, data):
+        """Append unescaped bytes to the frame being received."""
+        end = self._length + len(data)
+        if end - self._start > self.max_frame_size:
+            self.statistics.oversize_frames += 1
+            self._logger.warning(
+                "Frame too large, discarded", max_frame_size=self.max_frame_size
+            )
+            self._length = self._start
+            self.state = HDLCState.IDLE
+            return
+        if end > len(self._buffer):
+            # Payloads returned before keep a reference on the previous buffer
+            buffer = bytearray(self.max_frame_size)
+            buffer[0 : self._length - self._start] = self._buffer[
+                self._start : self._length
+            ]
+            self._buffer = buffer
+            self._length -= self._start
+            self._start = 0
+            end = self._length + len(data)
+        self._buffer[self._length : end] = data
+        self._length = end
 
     def handle_byte(self, byte):
         """Handle new byte received."""
+        self.statistics.bytes_received += 1
         if self.state in [HDLCState.IDLE, HDLCState.READY] and byte == HDLC_FLAG:
-            self.output = bytearray()
-            self.fcs = HDLC_FCS_INIT
-            self.state = HDLCState.RECEIVING
-        elif self.output and self.state == HDLCState.RECEIVING and byte == HDLC_FLAG:
+            self._start_frame(0)
+        elif (
+            self.state == HDLCState.RECEIVING and self.escape_byte and byte == HDLC_FLAG
+        ):
+            # Abort sequence, the flag starts a new frame
+            self.statistics.aborted_frames += 1
+            self._logger.warning("Frame aborted")
+            self._start_frame(0)
+        elif (
+            self._length > self._start
+            and self.state == HDLCState.RECEIVING
+            and byte == HDLC_FLAG
+        ):
             # End of frame
             self.state = HDLCState.READY
         elif self.state == HDLCState.RECEIVING and byte != HDLC_FLAG:
@@ -219,12 +379,91 @@ class HDLCHandler:
                 self.escape_byte = True
             elif self.escape_byte is True:
                 if byte == HDLC_ESCAPE_ESCAPED:
-                    self.output += HDLC_ESCAPE
+                    self._write(HDLC_ESCAPE)
                     self.fcs = _fcs_update(self.fcs, HDLC_ESCAPE)
                 elif byte == HDLC_FLAG_ESCAPED:
-                    self.output += HDLC_FLAG
+                    self._write(HDLC_FLAG)
                     self.fcs = _fcs_update(self.fcs, HDLC_FLAG)
                 self.escape_byte = False
             else:
-                self.output += byte
+                self._write(byte)
                 self.fcs = _fcs_update(self.fcs, byte)
+        elif self.state != HDLCState.RECEIVING:
+            self.statistics.bytes_discarded += 1
+
+    def _receive(self, data):
+        """Unescape a chunk of frame content and append it to the output."""
+        if not data:
+            return
+        if self.escape_byte is True:
+            # The escape sequence started in the previous chunk
+            data = HDLC_ESCAPE + data
+        # A trailing escape byte is dropped by _unescape and applies to the
+        # first byte of the next chunk
+        self.escape_byte = data.endswith(HDLC_ESCAPE)
+        data = _unescape(data)
+        self._write(data)
+        self.fcs = _fcs_compute(self.fcs, data)
+
+    def feed(self, data: bytes) -> List[memoryview]:
+        """Handle a chunk of received bytes and return all complete payloads.
+
+        Incomplete frames are kept between calls, invalid frames are dropped.
+        Payloads of the same chunk are stored one after the other in the
+        receive buffer.
+
+        >>> handler = HDLCHandler()
+        >>> [bytes(p) for p in handler.feed(b"~test\\x88\\x07~~}^test}]")]
+        [b'test']
+        >>> [bytes(p) for p in handler.feed(b"\\x06\\x94~")]
+        [b'~test}']
+        """
+        payloads = []
+        if self.state == HDLCState.RECEIVING:
+            # Move the incomplete frame at the beginning of the buffer
+            length = self._length - self._start
+            self._buffer[0:length] = self._buffer[self._start : self._length]
+            self._start = 0
+            self._length = length
+        else:
+            self._length = 0
+        pos = 0
+        length = len(data)
+        self.statistics.bytes_received += length
+        while pos < length:
+            flag_pos = data.find(HDLC_FLAG, pos)
+            if self.state != HDLCState.RECEIVING:
+                if flag_pos < 0:
+                    # Bytes outside of a frame are ignored
+                    self.statistics.bytes_discarded += length - pos
+                    break
+                self.statistics.bytes_discarded += flag_pos - pos
+                self._start_frame(self._length)
+                pos = flag_pos + 1
+                continue
+            if flag_pos < 0:
+                self._receive(data[pos:])
+                break
+            self._receive(data[pos:flag_pos])
+            if self.state != HDLCState.RECEIVING:
+                # Frame too large, the flag starts a new frame
+                pos = flag_pos
+                continue
+            pos = flag_pos + 1
+            if self.escape_byte is True:
+                # Abort sequence, the flag starts a new frame
+                self.statistics.aborted_frames += 1
+                self._logger.warning("Frame aborted")
+                self._start_frame(self._start)
+                continue
+            if self._length == self._start:
+                # Consecutive flags, still waiting for the frame content
+                continue
+            self.state = HDLCState.READY
+            payload = self.payload
+            if payload:
+                payloads.append(payload)
+            else:
+                # Invalid frame, reuse its space in the buffer
+                self._length = self._start
+        return payloads
@@ -53,7 +53,7 @@ class JoystickController(ControllerBase):
             if -JOYSTICK_HYSTERERIS_THRES < axis <= JOYSTICK_HYSTERERIS_THRES:
                 axis = 0.0
             # from [-1;1] to [-127;127]
-            positions.append(axis * 127)
+            positions.append(int(axis * 127))
         return positions
 
     async def start(self):
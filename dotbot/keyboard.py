@@ -165,22 +165,22 @@ class KeyboardController(ControllerBase):
                 keyboard.Key.up in self.active_keys
                 and keyboard.Key.left in self.active_keys
             ):
-                return speed.value * 0.75, speed.value
+                return int(speed.value * 0.75), speed.value
             if (
                 keyboard.Key.up in self.active_keys
                 and keyboard.Key.right in self.active_keys
             ):
-                return speed.value, speed.value * 0.75
+                return speed.value, int(speed.value * 0.75)
             if (
                 keyboard.Key.down in self.active_keys
                 and keyboard.Key.left in self.active_keys
             ):
-                return -speed.value * 0.75, -speed.value
+                return int(-speed.value * 0.75), -speed.value
             if (
                 keyboard.Key.down in self.active_keys
                 and keyboard.Key.right in self.active_keys
             ):
-                return -speed.value, -speed.value * 0.75
+                return -speed.value, int(-speed.value * 0.75)
             if keyboard.Key.up in self.active_keys:
                 return speed.value, speed.value
             if keyboard.Key.down in self.active_keys:
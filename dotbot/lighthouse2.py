@@ -5,7 +5,6 @@
 import math
 import os
 import pickle
-import sys
 
 from ctypes import CDLL
 from dataclasses import dataclass
@@ -16,18 +15,12 @@ from typing import List, Optional
 import cv2
 import numpy as np
 
+from dotbot.hdlc import LIB_EXT
 from dotbot.logger import LOGGER
 from dotbot.models import DotBotLH2Position, DotBotCalibrationStateModel
 from dotbot.protocol import Lh2RawData
 
 
-if sys.platform == "win32":
-    LIB_EXT = "dll"
-elif sys.platform == "darwin":
-    LIB_EXT = "dylib"
-else:
-    LIB_EXT = "so"
-
 LH2_LIB_PATH = os.path.join(os.path.dirname(__file__), "lib", f"lh2.{LIB_EXT}")
 LH2_LIB = CDLL(LH2_LIB_PATH)
 REFERENCE_POINTS_DEFAULT = [
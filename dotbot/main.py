@@ -47,8 +47,9 @@ DEFAULT_CONTROLLERS = {
     "-p",
     "--port",
     type=str,
-    default=SERIAL_PORT_DEFAULT,
-    help=f"Linux users: path to port in '/dev' folder ; Windows users: COM port. Defaults to '{SERIAL_PORT_DEFAULT}'",
+    multiple=True,
+    default=[SERIAL_PORT_DEFAULT],
+    help=f"Linux users: path to port in '/dev' folder ; Windows users: COM port ; tcp://host:port or unix:///path for a gateway bridged on a socket. Repeat the option to attach several gateways. Defaults to '{SERIAL_PORT_DEFAULT}'",
 )
 @click.option(
     "-b",
@@ -111,6 +112,29 @@ DEFAULT_CONTROLLERS = {
     default=os.path.join(os.getcwd(), "pydotbot.log"),
     help="Filename where logs are redirected",
 )
+@click.option(
+    "--serial-transport",
+    type=click.Choice(["thread", "asyncio", "replay"]),
+    default="thread",
+    help="Serial transport implementation, 'asyncio' requires a POSIX system, 'replay' replays the capture file given as port. Defaults to 'thread'",
+)
+@click.option(
+    "--capture",
+    type=click.Path(dir_okay=False),
+    help="Append the bytes received and sent on serial to this capture file",
+)
+@click.option(
+    "--replay-speed",
+    type=float,
+    default=1.0,
+    help="Speed factor of the 'replay' transport, 0 replays as fast as possible. Defaults to 1",
+)
+@click.option(
+    "--frame-rate",
+    type=float,
+    default=0,
+    help="Maximum number of frames per second sent to each gateway, 0 means no limit. Defaults to 0",
+)
 @click.option(
     "--handshake",
     is_flag=True,
@@ -129,6 +153,10 @@ def main(
     verbose,
     log_level,
     log_output,
+    serial_transport,
+    capture,
+    replay_speed,
+    frame_rate,
     handshake,
 ):  # pylint: disable=redefined-builtin,too-many-arguments
     """BotController, universal SailBot and DotBot controller."""
@@ -143,7 +171,7 @@ def main(
         controller = controller_factory(
             type,
             ControllerSettings(
-                port,
+                list(port),
                 baudrate,
                 dotbot_address,
                 gw_address,
@@ -152,6 +180,10 @@ def main(
                 table,
                 handshake,
                 verbose,
+                serial_transport,
+                frame_rate,
+                capture,
+                replay_speed,
             ),
         )
         asyncio.run(controller.run())
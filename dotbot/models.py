@@ -17,6 +17,39 @@ class DotBotAddressModel(BaseModel):
     address: str
 
 
+class DotBotHDLCStatisticsModel(BaseModel):
+    """Model that holds the controller HDLC receiver statistics."""
+
+    bytes_received: int
+    bytes_discarded: int
+    frames_ok: int
+    fcs_errors: int
+    short_frames: int
+    oversize_frames: int
+    aborted_frames: int
+
+
+class DotBotTransmitStatisticsModel(BaseModel):
+    """Model that holds the controller transmit scheduler statistics."""
+
+    frames_sent: int
+    coalesced: int
+    shed: int
+
+
+class DotBotLinkStatisticsModel(BaseModel):
+    """Model that holds the acknowledgment statistics of a DotBot link."""
+
+    address: str
+    sent: int
+    acknowledged: int
+    lost: int
+    loss: float  # percent
+    rtt_p50: Optional[float] = None  # seconds
+    rtt_p90: Optional[float] = None
+    rtt_p99: Optional[float] = None
+
+
 class DotBotCalibrationStateModel(BaseModel):
     """Model that holds the controller LH2 calibration state."""
 
@@ -92,6 +125,7 @@ class DotBotNotificationCommand(IntEnum):
     NONE: int = 0
     RELOAD: int = 1
     UPDATE: int = 2
+    GATEWAY: int = 3
 
 
 class DotBotNotificationUpdate(BaseModel):
@@ -103,11 +137,18 @@ class DotBotNotificationUpdate(BaseModel):
     gps_position: Optional[DotBotGPSPosition] = None
 
 
+class DotBotGatewayModel(BaseModel):
+    """Model that holds the state of the link with a gateway."""
+
+    port: str
+    connected: bool
+
+
 class DotBotNotificationModel(BaseModel):
     """Model class used to send controller notifications."""
 
     cmd: DotBotNotificationCommand
-    data: Optional[DotBotNotificationUpdate] = None
+    data: Optional[Union[DotBotNotificationUpdate, DotBotGatewayModel]] = None
 
 
 class DotBotModel(BaseModel):
@@ -1,17 +1,41 @@
 """Module for the Dotbot protocol API."""
+# pylint: disable=too-many-lines
 
+import copy
 import dataclasses
+import operator
+import struct
+import sys
 
 from abc import ABC, abstractmethod
 from binascii import hexlify
 from enum import Enum, IntEnum
 from itertools import chain
-from typing import List
+from typing import (
+    Callable,
+    ClassVar,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
 from dataclasses import dataclass
 
+import numpy as np
+
+
+# Objects of the protocol dataclasses have no __dict__ when supported, several
+# of them are created for each frame
+_DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
 PROTOCOL_VERSION = 8
+# Largest frame sent to a robot, longer waypoints lists are fragmented
+PAYLOAD_MAX_LENGTH = 255
 
 
 class PayloadType(Enum):
@@ -28,7 +52,9 @@ class PayloadType(Enum):
     LH2_WAYPOINTS = 8
     GPS_WAYPOINTS = 9
     SAILBOT_DATA = 10
-    INVALID_PAYLOAD = 11  # Increase each time a new payload type is added
+    LH2_WAYPOINTS_FRAGMENT = 11
+    GPS_WAYPOINTS_FRAGMENT = 12
+    INVALID_PAYLOAD = 13  # Increase each time a new payload type is added
 
 
 class ApplicationType(IntEnum):
@@ -49,7 +75,7 @@ class ProtocolPayloadParserException(Exception):
     """Exception raised on invalid or unsupported payload."""
 
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class ProtocolField:
     """Data class that describes a payload field."""
 
@@ -59,22 +85,95 @@ class ProtocolField:
     signed: bool = False
 
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class ProtocolData(ABC):
-    """Base class for protocol payload data classes."""
+    """Base class for protocol payload data classes.
+
+    Classes with a STRUCT layout (see struct_layout) are packed and unpacked
+    with it, the others are packed from their fields.
+    """
+
+    STRUCT: ClassVar[Optional[struct.Struct]] = None
+    _struct_values: ClassVar[Optional[Callable[["ProtocolData"], Tuple]]] = None
 
     @property
     @abstractmethod
     def fields(self) -> List[ProtocolField]:
         """Returns the list of fields in this data."""
 
-    @staticmethod
-    @abstractmethod
-    def from_bytes(bytes_):
+    @property
+    def size(self) -> int:
+        """Returns the length in bytes of the packed data."""
+        if self.STRUCT is None:
+            return sum(field.length for field in self.fields)
+        return self.STRUCT.size
+
+    def pack_into(self, buffer: bytearray, offset: int = 0) -> int:
+        """Packs the data in buffer at offset, returns the offset following it."""
+        if self.STRUCT is None:
+            for field in self.fields:
+                buffer[offset : offset + field.length] = int(field.value).to_bytes(
+                    length=field.length, byteorder="little", signed=field.signed
+                )
+                offset += field.length
+            return offset
+        values = self._struct_values(self)  # pylint: disable=not-callable
+        self.STRUCT.pack_into(buffer, offset, *values)
+        return offset + self.STRUCT.size
+
+    def to_bytes(self) -> bytes:
+        """Returns the packed data."""
+        buffer = bytearray(self.size)
+        self.pack_into(buffer)
+        return bytes(buffer)
+
+    @classmethod
+    def unpack_from(cls, bytes_, offset: int = 0) -> "ProtocolData":
+        """Returns a ProtocolData instance read from bytes_ at offset."""
+        return cls(*cls.STRUCT.unpack_from(bytes_, offset))
+
+    @classmethod
+    def from_bytes(cls, bytes_) -> "ProtocolData":
         """Returns a ProtocolData instance from a bytearray."""
+        return cls.unpack_from(bytes_)
+
+
+def struct_layout(layout: str):
+    """Class decorator precompiling the struct layout of a ProtocolData class.
+
+    The layout packs the dataclass fields in their declaration order.
+    """
+
+    def decorator(cls):
+        names = [field.name for field in dataclasses.fields(cls)]
+        if len(names) > 1:
+            getter = operator.attrgetter(*names)
+        else:
+            # attrgetter only returns a tuple with several attributes
+
+            def getter(data):
+                return tuple(getattr(data, name) for name in names)
+
+        cls.STRUCT = struct.Struct(layout)
+        cls._struct_values = staticmethod(getter)  # pylint: disable=protected-access
+        return cls
+
+    return decorator
+
+
+def _pack_array(items: Sequence[ProtocolData], buffer, offset: int) -> int:
+    for item in items:
+        offset = item.pack_into(buffer, offset)
+    return offset
+
 
+def _unpack_array(cls, bytes_, offset: int, count: int) -> List[ProtocolData]:
+    size = cls.STRUCT.size
+    return [cls.unpack_from(bytes_, offset + index * size) for index in range(count)]
 
-@dataclass
+
+@struct_layout("<QQHBBI")
+@dataclass(**_DATACLASS_SLOTS)
 class ProtocolHeader(ProtocolData):
     """Dataclass that holds header fields."""
 
@@ -96,19 +195,114 @@ class ProtocolHeader(ProtocolData):
             ProtocolField(self.msg_id, name="msg id", length=4),
         ]
 
-    @staticmethod
-    def from_bytes(bytes_) -> ProtocolData:
-        return ProtocolHeader(
-            int.from_bytes(bytes_[0:8], "little"),  # destination
-            int.from_bytes(bytes_[8:16], "little"),  # source
-            int.from_bytes(bytes_[16:18], "little"),  # swarm_id
-            ApplicationType(int.from_bytes(bytes_[18:19], "little")),  # application
-            int.from_bytes(bytes_[19:20], "little"),  # version
-            int.from_bytes(bytes_[20:24], "little"),  # msg id
+    @classmethod
+    def unpack_from(cls, bytes_, offset: int = 0) -> ProtocolData:
+        (
+            destination,
+            source,
+            swarm_id,
+            application,
+            version,
+            msg_id,
+        ) = cls.STRUCT.unpack_from(bytes_, offset)
+        return cls(
+            destination,
+            source,
+            swarm_id,
+            ApplicationType(application),
+            version,
+            msg_id,
+        )
+
+    def with_msg_id(self, msg_id: int) -> "ProtocolHeader":
+        """Returns a copy of the header with another msg_id."""
+        header = copy.copy(self)
+        header.msg_id = msg_id
+        return header
+
+
+# Header fields before msg_id, encoded once by CachedHeader
+HEADER_PREFIX = struct.Struct("<QQHBB")
+HEADER_MSG_ID = struct.Struct("<I")
+
+
+@dataclass(eq=False)
+class CachedHeader(ProtocolHeader):
+    """Header with the fields before msg_id encoded once.
+
+    Only msg_id is packed on each use. Assignments are rejected since they
+    would not update the encoded fields, use with_msg_id() or
+    dataclasses.replace() instead.
+    """
+
+    __slots__ = ("_prefix",)
+
+    def __setattr__(self, name, value):
+        if hasattr(self, "_prefix"):
+            raise dataclasses.FrozenInstanceError(f"cannot assign to field '{name}'")
+        super().__setattr__(name, value)
+
+    def __copy__(self):
+        header = object.__new__(type(self))
+        for field in dataclasses.fields(self):
+            object.__setattr__(header, field.name, getattr(self, field.name))
+        object.__setattr__(header, "_prefix", self._prefix)
+        return header
+
+    def __post_init__(self):
+        self._prefix = HEADER_PREFIX.pack(
+            self.destination,
+            self.source,
+            self.swarm_id,
+            self.application,
+            self.version,
         )
 
+    def __eq__(self, other):
+        if not isinstance(other, ProtocolHeader):
+            return NotImplemented
+        # pylint: disable-next=protected-access,not-callable
+        return self._struct_values(self) == other._struct_values(other)
+
+    def pack_into(self, buffer: bytearray, offset: int = 0) -> int:
+        end = offset + HEADER_PREFIX.size
+        buffer[offset:end] = self._prefix
+        HEADER_MSG_ID.pack_into(buffer, end, self.msg_id)
+        return end + HEADER_MSG_ID.size
+
+    def with_msg_id(self, msg_id: int) -> "CachedHeader":
+        header = copy.copy(self)
+        object.__setattr__(header, "msg_id", msg_id)
+        return header
+
+
+class HeaderCache:  # pylint: disable=too-few-public-methods
+    """Headers of the payloads sent by the controller, per destination."""
+
+    def __init__(self, source: int, swarm_id: int):
+        self.source = source
+        self.swarm_id = swarm_id
+        self._headers: Dict[Tuple[str, int], CachedHeader] = {}
+
+    def get(
+        self, address: str, application: ApplicationType = ApplicationType.DotBot
+    ) -> CachedHeader:
+        """Returns the header of payloads sent to the hex address."""
+        header = self._headers.get((address, application))
+        if header is None:
+            header = CachedHeader(
+                destination=int(address, 16),
+                source=self.source,
+                swarm_id=self.swarm_id,
+                application=ApplicationType(application),
+                version=PROTOCOL_VERSION,
+            )
+            self._headers[(address, application)] = header
+        return header
 
-@dataclass
+
+@struct_layout("<bbbb")
+@dataclass(**_DATACLASS_SLOTS)
 class CommandMoveRaw(ProtocolData):
     """Dataclass that holds move raw command data fields."""
 
@@ -126,12 +320,9 @@ class CommandMoveRaw(ProtocolData):
             ProtocolField(self.right_y, name="ry", length=1, signed=True),
         ]
 
-    @staticmethod
-    def from_bytes(bytes_) -> ProtocolData:
-        return CommandMoveRaw(*bytes_[0:4])
-
 
-@dataclass
+@struct_layout("<BBB")
+@dataclass(**_DATACLASS_SLOTS)
 class CommandRgbLed(ProtocolData):
     """Dataclass that holds a complete rgb led command fields."""
 
@@ -147,12 +338,9 @@ class CommandRgbLed(ProtocolData):
             ProtocolField(self.blue, name="blue"),
         ]
 
-    @staticmethod
-    def from_bytes(bytes_) -> ProtocolData:
-        return CommandRgbLed(*bytes_[0:3])
 
-
-@dataclass
+@struct_layout("<QBb")
+@dataclass(**_DATACLASS_SLOTS)
 class Lh2RawLocation(ProtocolData):
     """Dataclass that holds LH2 raw location data."""
 
@@ -168,16 +356,8 @@ class Lh2RawLocation(ProtocolData):
             ProtocolField(self.offset, name="off.", length=1, signed=True),
         ]
 
-    @staticmethod
-    def from_bytes(bytes_) -> ProtocolData:
-        return Lh2RawLocation(
-            int.from_bytes(bytes_[0:8], "little"),
-            int.from_bytes(bytes_[8:9], "little"),
-            int.from_bytes(bytes_[9:10], "little", signed=True),
-        )
 
-
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class Lh2RawData(ProtocolData):
     """Dataclass that holds LH2 raw data."""
 
@@ -187,17 +367,20 @@ class Lh2RawData(ProtocolData):
     def fields(self) -> List[ProtocolField]:
         return list(chain(*[location.fields for location in self.locations]))
 
-    @staticmethod
-    def from_bytes(bytes_) -> ProtocolData:
-        return Lh2RawData(
-            [
-                Lh2RawLocation.from_bytes(bytes_[0:10]),
-                Lh2RawLocation.from_bytes(bytes_[10:20]),
-            ]
-        )
+    @property
+    def size(self) -> int:
+        return len(self.locations) * Lh2RawLocation.STRUCT.size
+
+    def pack_into(self, buffer: bytearray, offset: int = 0) -> int:
+        return _pack_array(self.locations, buffer, offset)
+
+    @classmethod
+    def unpack_from(cls, bytes_, offset: int = 0) -> ProtocolData:
+        return cls(_unpack_array(Lh2RawLocation, bytes_, offset, 2))
 
 
-@dataclass
+@struct_layout("<III")
+@dataclass(**_DATACLASS_SLOTS)
 class LH2Location(ProtocolData):
     """Dataclass that holds LH2 computed location data."""
 
@@ -213,19 +396,13 @@ class LH2Location(ProtocolData):
             ProtocolField(self.pos_z, name="z", length=4),
         ]
 
-    @staticmethod
-    def from_bytes(bytes_) -> ProtocolData:
-        return LH2Location(
-            int.from_bytes(bytes_[0:4], "little"),
-            int.from_bytes(bytes_[4:8], "little"),
-            int.from_bytes(bytes_[8:12], "little"),
-        )
-
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class DotBotData(ProtocolData):
     """Dataclass that holds direction and LH2 raw data from DotBot application."""
 
+    STRUCT: ClassVar[struct.Struct] = struct.Struct("<h")
+
     direction: int = 0xFFFF
     locations: List[Lh2RawLocation] = dataclasses.field(default_factory=lambda: [])
 
@@ -235,18 +412,27 @@ class DotBotData(ProtocolData):
         _fields += list(chain(*[location.fields for location in self.locations]))
         return _fields
 
-    @staticmethod
-    def from_bytes(bytes_) -> ProtocolData:
-        return DotBotData(
-            direction=int.from_bytes(bytes_[0:2], "little", signed=True),
-            locations=[
-                Lh2RawLocation.from_bytes(bytes_[2:12]),
-                Lh2RawLocation.from_bytes(bytes_[12:22]),
-            ],
+    @property
+    def size(self) -> int:
+        return self.STRUCT.size + len(self.locations) * Lh2RawLocation.STRUCT.size
+
+    def pack_into(self, buffer: bytearray, offset: int = 0) -> int:
+        self.STRUCT.pack_into(buffer, offset, self.direction)
+        return _pack_array(self.locations, buffer, offset + self.STRUCT.size)
+
+    @classmethod
+    def unpack_from(cls, bytes_, offset: int = 0) -> ProtocolData:
+        (direction,) = cls.STRUCT.unpack_from(bytes_, offset)
+        return cls(
+            direction=direction,
+            locations=_unpack_array(
+                Lh2RawLocation, bytes_, offset + cls.STRUCT.size, 2
+            ),
         )
 
 
-@dataclass
+@struct_layout("<ii")
+@dataclass(**_DATACLASS_SLOTS)
 class GPSPosition(ProtocolData):
     """Dataclass that holds GPS positions."""
 
@@ -260,15 +446,9 @@ class GPSPosition(ProtocolData):
             ProtocolField(self.longitude, name="longitude", length=4, signed=True),
         ]
 
-    @staticmethod
-    def from_bytes(bytes_) -> ProtocolData:
-        return GPSPosition(
-            latitude=int.from_bytes(bytes_[0:4], "little", signed=True),
-            longitude=int.from_bytes(bytes_[4:8], "little", signed=True),
-        )
-
 
-@dataclass
+@struct_layout("<Hii")
+@dataclass(**_DATACLASS_SLOTS)
 class SailBotData(ProtocolData):
     """Dataclass that holds direction and GPS data and heading from SailBot application."""
 
@@ -284,16 +464,9 @@ class SailBotData(ProtocolData):
             ProtocolField(self.longitude, name="longitude", length=4, signed=True),
         ]
 
-    @staticmethod
-    def from_bytes(bytes_) -> ProtocolData:
-        return SailBotData(
-            direction=int.from_bytes(bytes_[0:2], "little"),
-            latitude=int.from_bytes(bytes_[2:6], "little", signed=True),
-            longitude=int.from_bytes(bytes_[6:10], "little", signed=True),
-        )
-
 
-@dataclass
+@struct_layout("<")
+@dataclass(**_DATACLASS_SLOTS)
 class Advertisement(ProtocolData):
     """Dataclass that holds an advertisement (emtpy)."""
 
@@ -301,12 +474,9 @@ class Advertisement(ProtocolData):
     def fields(self) -> List[ProtocolField]:
         return []
 
-    @staticmethod
-    def from_bytes(_: bytes) -> ProtocolData:
-        return Advertisement()
-
 
-@dataclass
+@struct_layout("<B")
+@dataclass(**_DATACLASS_SLOTS)
 class ControlMode(ProtocolData):
     """Dataclass that holds a control mode message."""
 
@@ -318,59 +488,302 @@ class ControlMode(ProtocolData):
             ProtocolField(self.mode, "mode"),
         ]
 
-    @staticmethod
-    def from_bytes(bytes_) -> ProtocolData:
-        return ControlMode(bytes_[0])
 
+class WaypointsData(ProtocolData):
+    """Base class for lists of waypoints.
 
-@dataclass
-class LH2Waypoints(ProtocolData):
-    """Dataclass that holds a list of LH2 waypoints."""
+    STRUCT packs the number of waypoints followed by the PREFIX_FIELDS, the
+    waypoints are packed with their own struct afterwards.
+    """
+
+    __slots__ = ()
+
+    WAYPOINT_CLASS: ClassVar[Type[ProtocolData]]
+    PREFIX_FIELDS: ClassVar[Tuple[Tuple[str, str], ...]] = (("threshold", "thr."),)
+    STRUCT: ClassVar[struct.Struct] = struct.Struct("<BB")
 
     threshold: int
-    waypoints: List[LH2Location] = dataclasses.field(default_factory=lambda: [])
+    waypoints: List[ProtocolData]
 
     @property
     def fields(self) -> List[ProtocolField]:
         _fields = [ProtocolField(len(self.waypoints), name="len.")]
-        _fields += [ProtocolField(value=self.threshold, name="thr.")]
+        _fields += [
+            ProtocolField(value=getattr(self, name), name=label)
+            for name, label in self.PREFIX_FIELDS
+        ]
         _fields += list(chain(*[waypoint.fields for waypoint in self.waypoints]))
         return _fields
 
-    @staticmethod
-    def from_bytes(_) -> ProtocolData:
-        return LH2Waypoints(threshold=0, waypoints=[])
+    @property
+    def size(self) -> int:
+        return self.STRUCT.size + len(self.waypoints) * self.WAYPOINT_CLASS.STRUCT.size
+
+    def pack_into(self, buffer: bytearray, offset: int = 0) -> int:
+        self.STRUCT.pack_into(
+            buffer,
+            offset,
+            len(self.waypoints),
+            *[getattr(self, name) for name, _ in self.PREFIX_FIELDS],
+        )
+        return _pack_array(self.waypoints, buffer, offset + self.STRUCT.size)
+
+    @classmethod
+    def unpack_from(cls, bytes_, offset: int = 0) -> ProtocolData:
+        length, *values = cls.STRUCT.unpack_from(bytes_, offset)
+        end = offset + cls.STRUCT.size + length * cls.WAYPOINT_CLASS.STRUCT.size
+        if len(bytes_) > end:
+            raise ValueError(f"{len(bytes_) - end} bytes after the {length} waypoints")
+        return cls(
+            waypoints=_unpack_array(
+                cls.WAYPOINT_CLASS, bytes_, offset + cls.STRUCT.size, length
+            ),
+            **{name: value for (name, _), value in zip(cls.PREFIX_FIELDS, values)},
+        )
+
+
+@dataclass(**_DATACLASS_SLOTS)
+class LH2Waypoints(WaypointsData):
+    """Dataclass that holds a list of LH2 waypoints."""
+
+    WAYPOINT_CLASS = LH2Location
+
+    threshold: int
+    waypoints: List[LH2Location] = dataclasses.field(default_factory=lambda: [])
 
 
-@dataclass
-class GPSWaypoints(ProtocolData):
+@dataclass(**_DATACLASS_SLOTS)
+class GPSWaypoints(WaypointsData):
     """Dataclass that holds a list of GPS waypoints."""
 
+    WAYPOINT_CLASS = GPSPosition
+
     threshold: int
     waypoints: List[GPSPosition] = dataclasses.field(default_factory=lambda: [])
 
-    @property
-    def fields(self) -> List[ProtocolField]:
-        _fields = [ProtocolField(len(self.waypoints), name="len.")]
-        _fields += [ProtocolField(value=self.threshold, name="thr.")]
-        _fields += list(chain(*[waypoint.fields for waypoint in self.waypoints]))
-        return _fields
 
-    @staticmethod
-    def from_bytes(_) -> ProtocolData:
-        return GPSWaypoints(threshold=0, waypoints=[])
+# Fragments add their index and the number of fragments of the list
+FRAGMENT_PREFIX_FIELDS = (("threshold", "thr."), ("index", "idx."), ("count", "cnt."))
+FRAGMENT_STRUCT = struct.Struct("<BBBB")
+
+
+@dataclass(**_DATACLASS_SLOTS)
+class LH2WaypointsFragment(LH2Waypoints):
+    """Dataclass that holds a fragment of a list of LH2 waypoints."""
+
+    PREFIX_FIELDS = FRAGMENT_PREFIX_FIELDS
+    STRUCT = FRAGMENT_STRUCT
+
+    index: int = 0
+    count: int = 1
+
+
+@dataclass(**_DATACLASS_SLOTS)
+class GPSWaypointsFragment(GPSWaypoints):
+    """Dataclass that holds a fragment of a list of GPS waypoints."""
+
+    PREFIX_FIELDS = FRAGMENT_PREFIX_FIELDS
+    STRUCT = FRAGMENT_STRUCT
+
+    index: int = 0
+    count: int = 1
+
+
+PAYLOAD_TYPE_OFFSET = ProtocolHeader.STRUCT.size
+PAYLOAD_VALUES_OFFSET = PAYLOAD_TYPE_OFFSET + 1
+
+
+@dataclass(frozen=True, **_DATACLASS_SLOTS)
+class CustomPayloadType:
+    """Payload type defined outside of PayloadType."""
+
+    value: int
+    name: str
+
+
+@dataclass(frozen=True, **_DATACLASS_SLOTS)
+class PayloadTypeEntry:
+    """Registered payload type, with the length and decoder of its values.
+
+    With variable_length, length is the minimum length of the values.
+    """
+
+    payload_type: Union[PayloadType, CustomPayloadType]
+    values_class: Type[ProtocolData]
+    length: int
+    variable_length: bool = False
+    decoder: Optional[Callable[[bytes, int], ProtocolData]] = None
+
+    def decode(self, bytes_, offset: int) -> ProtocolData:
+        """Returns the values read from bytes_ at offset."""
+        if self.decoder is not None:
+            return self.decoder(bytes_, offset)
+        return self.values_class.unpack_from(bytes_, offset)
+
+
+PAYLOAD_TYPES: Dict[int, PayloadTypeEntry] = {}
+
+
+def register_payload_type(
+    payload_type: Union[PayloadType, CustomPayloadType],
+    values_class: Type[ProtocolData],
+    length: int,
+    variable_length: bool = False,
+    decoder: Optional[Callable[[bytes, int], ProtocolData]] = None,
+) -> PayloadTypeEntry:
+    """Registers the values decoded for a payload type.
+
+    decoder is called with the frame and the offset of the values, it
+    defaults to values_class.unpack_from.
+    """
+    if payload_type.value in PAYLOAD_TYPES:
+        raise ValueError(f"Payload type '{payload_type.value}' already registered")
+    entry = PayloadTypeEntry(
+        payload_type, values_class, length, variable_length, decoder
+    )
+    PAYLOAD_TYPES[payload_type.value] = entry
+    return entry
+
+
+register_payload_type(PayloadType.CMD_MOVE_RAW, CommandMoveRaw, 4)
+register_payload_type(PayloadType.CMD_RGB_LED, CommandRgbLed, 3)
+register_payload_type(PayloadType.LH2_RAW_DATA, Lh2RawData, 20)
+register_payload_type(PayloadType.LH2_LOCATION, LH2Location, 12)
+register_payload_type(PayloadType.ADVERTISEMENT, Advertisement, 0)
+register_payload_type(PayloadType.GPS_POSITION, GPSPosition, 8)
+register_payload_type(PayloadType.DOTBOT_DATA, DotBotData, 22)
+register_payload_type(PayloadType.CONTROL_MODE, ControlMode, 1)
+register_payload_type(PayloadType.LH2_WAYPOINTS, LH2Waypoints, 2, True)
+register_payload_type(PayloadType.GPS_WAYPOINTS, GPSWaypoints, 2, True)
+register_payload_type(PayloadType.SAILBOT_DATA, SailBotData, 10)
+register_payload_type(PayloadType.LH2_WAYPOINTS_FRAGMENT, LH2WaypointsFragment, 4, True)
+register_payload_type(PayloadType.GPS_WAYPOINTS_FRAGMENT, GPSWaypointsFragment, 4, True)
+
+# Payload type of the fragments of waypoints payloads
+WAYPOINTS_FRAGMENT_TYPES = {
+    PayloadType.LH2_WAYPOINTS: PayloadType.LH2_WAYPOINTS_FRAGMENT,
+    PayloadType.GPS_WAYPOINTS: PayloadType.GPS_WAYPOINTS_FRAGMENT,
+}
+
+
+# NumPy layouts of the header and of fixed size values, used for batch decoding
+HEADER_DTYPE = np.dtype(
+    [
+        ("destination", "<u8"),
+        ("source", "<u8"),
+        ("swarm_id", "<u2"),
+        ("application", "u1"),
+        ("version", "u1"),
+        ("msg_id", "<u4"),
+    ]
+)
+LH2_RAW_LOCATION_DTYPE = np.dtype(
+    [("bits", "<u8"), ("polynomial_index", "u1"), ("offset", "i1")]
+)
+VALUES_DTYPES: Dict[PayloadType, np.dtype] = {
+    PayloadType.CMD_MOVE_RAW: np.dtype(
+        [("left_x", "i1"), ("left_y", "i1"), ("right_x", "i1"), ("right_y", "i1")]
+    ),
+    PayloadType.CMD_RGB_LED: np.dtype([("red", "u1"), ("green", "u1"), ("blue", "u1")]),
+    PayloadType.LH2_RAW_DATA: np.dtype([("locations", LH2_RAW_LOCATION_DTYPE, (2,))]),
+    PayloadType.LH2_LOCATION: np.dtype(
+        [("pos_x", "<u4"), ("pos_y", "<u4"), ("pos_z", "<u4")]
+    ),
+    PayloadType.GPS_POSITION: np.dtype([("latitude", "<i4"), ("longitude", "<i4")]),
+    PayloadType.DOTBOT_DATA: np.dtype(
+        [("direction", "<i2"), ("locations", LH2_RAW_LOCATION_DTYPE, (2,))]
+    ),
+    PayloadType.CONTROL_MODE: np.dtype([("mode", "u1")]),
+    PayloadType.SAILBOT_DATA: np.dtype(
+        [("direction", "<u2"), ("latitude", "<i4"), ("longitude", "<i4")]
+    ),
+}
+
+
+def frames_to_array(frames: Iterable[bytes], payload_type: PayloadType) -> np.ndarray:
+    """Decodes frames of a single payload type in a NumPy structured array.
+
+    The columns are the header fields, payload_type and the values fields of
+    VALUES_DTYPES, locations of LH2 raw data being a subarray.
+    """
+    if payload_type not in VALUES_DTYPES:
+        raise ProtocolPayloadParserException(
+            f"Unsupported payload type '{payload_type.value}'"
+        )
+    dtype = np.dtype(
+        HEADER_DTYPE.descr
+        + [("payload_type", "u1")]
+        + VALUES_DTYPES[payload_type].descr
+    )
+    frames = list(frames)
+    for index, frame in enumerate(frames):
+        if len(frame) != dtype.itemsize:
+            raise ProtocolPayloadParserException(
+                f"Invalid payload: frame {index} length is {len(frame)} "
+                f"(expected: {dtype.itemsize})"
+            )
+    array = np.frombuffer(b"".join(frames), dtype=dtype)
+    for column, expected in (
+        ("version", PROTOCOL_VERSION),
+        ("payload_type", payload_type.value),
+    ):
+        invalid = np.flatnonzero(array[column] != expected)
+        if invalid.size:
+            raise ProtocolPayloadParserException(
+                f"Invalid payload: frame {invalid[0]} {column} is "
+                f"{array[column][invalid[0]]} (expected: {expected})"
+            )
+    return array
+
+
+def _check_version(version: int):
+    if version != PROTOCOL_VERSION:
+        raise ProtocolPayloadParserException(
+            f"Invalid header: Unsupported payload version '{version}' (expected: {PROTOCOL_VERSION})"
+        )
 
 
-@dataclass
+def _payload_type_entry(bytes_) -> PayloadTypeEntry:
+    """Returns the registered type of a frame after checking its length."""
+    if len(bytes_) < PAYLOAD_VALUES_OFFSET:
+        raise ProtocolPayloadParserException("Invalid payload: missing type")
+    entry = PAYLOAD_TYPES.get(bytes_[PAYLOAD_TYPE_OFFSET])
+    if entry is None:
+        raise ProtocolPayloadParserException(
+            f"Unsupported payload type '{bytes_[PAYLOAD_TYPE_OFFSET]}'"
+        )
+    length = len(bytes_) - PAYLOAD_VALUES_OFFSET
+    if length < entry.length or (length > entry.length and not entry.variable_length):
+        raise ProtocolPayloadParserException(
+            f"Invalid payload: {entry.payload_type.name} length is {length} "
+            f"(expected: {entry.length})"
+        )
+    return entry
+
+
+def _decode_values(entry: PayloadTypeEntry, bytes_) -> ProtocolData:
+    try:
+        return entry.decode(bytes_, PAYLOAD_VALUES_OFFSET)
+    except (ValueError, struct.error) as exc:
+        raise ProtocolPayloadParserException(f"Invalid payload: {exc}") from exc
+
+
+@dataclass(**_DATACLASS_SLOTS)
 class ProtocolPayload:
     """Manage a protocol complete payload (header + type + values)."""
 
     header: ProtocolHeader
-    payload_type: PayloadType
+    payload_type: Union[PayloadType, CustomPayloadType]
     values: ProtocolData
 
     def to_bytes(self, endian="little") -> bytes:
         """Converts a payload to a bytearray."""
+        if endian == "little":
+            buffer = bytearray(PAYLOAD_VALUES_OFFSET + self.values.size)
+            self.header.pack_into(buffer)
+            buffer[PAYLOAD_TYPE_OFFSET] = self.payload_type.value
+            self.values.pack_into(buffer, PAYLOAD_VALUES_OFFSET)
+            return buffer
         buffer = bytearray()
         for field in self.header.fields:
             buffer += int(field.value).to_bytes(
@@ -387,41 +800,90 @@ class ProtocolPayload:
     def from_bytes(bytes_: bytes):
         """Parse a bytearray to return a protocol payload instance."""
         try:
-            header = ProtocolHeader.from_bytes(bytes_[0:24])
-        except ValueError as exc:
+            header = ProtocolHeader.unpack_from(bytes_)
+        except (ValueError, struct.error) as exc:
             raise ProtocolPayloadParserException(f"Invalid header: {exc}") from exc
-        if header.version != PROTOCOL_VERSION:
-            raise ProtocolPayloadParserException(
-                f"Invalid header: Unsupported payload version '{header.version}' (expected: {PROTOCOL_VERSION})"
+        _check_version(header.version)
+        entry = _payload_type_entry(bytes_)
+        return ProtocolPayload(
+            header, entry.payload_type, _decode_values(entry, bytes_)
+        )
+
+    def fragment(self, max_length: int = PAYLOAD_MAX_LENGTH) -> List["ProtocolPayload"]:
+        """Splits a waypoints payload longer than max_length in fragments.
+
+        Other payloads are returned as is.
+        """
+        fragment_type = WAYPOINTS_FRAGMENT_TYPES.get(self.payload_type)
+        if (
+            fragment_type is None
+            or PAYLOAD_VALUES_OFFSET + self.values.size <= max_length
+        ):
+            return [self]
+        # pylint: disable=no-member
+        values: WaypointsData = self.values
+        fragment_class = PAYLOAD_TYPES[fragment_type.value].values_class
+        per_fragment = (
+            max_length - PAYLOAD_VALUES_OFFSET - fragment_class.STRUCT.size
+        ) // values.WAYPOINT_CLASS.STRUCT.size
+        if per_fragment < 1:
+            raise ValueError(f"Fragments cannot fit in {max_length} bytes")
+        waypoints = values.waypoints
+        count = -(-len(waypoints) // per_fragment)
+        if count > 255:
+            raise ValueError(f"Too many waypoints: {len(waypoints)}")
+        return [
+            ProtocolPayload(
+                dataclasses.replace(self.header),
+                fragment_type,
+                fragment_class(
+                    threshold=values.threshold,
+                    waypoints=waypoints[
+                        index * per_fragment : (index + 1) * per_fragment
+                    ],
+                    index=index,
+                    count=count,
+                ),
             )
-        payload_type = PayloadType(int.from_bytes(bytes_[24:25], "little"))
-        if payload_type == PayloadType.CMD_MOVE_RAW:
-            values = CommandMoveRaw.from_bytes(bytes_[25:30])
-        elif payload_type == PayloadType.CMD_RGB_LED:
-            values = CommandRgbLed.from_bytes(bytes_[25:29])
-        elif payload_type == PayloadType.LH2_RAW_DATA:
-            values = Lh2RawData.from_bytes(bytes_[25:45])
-        elif payload_type == PayloadType.LH2_LOCATION:
-            values = LH2Location.from_bytes(bytes_[25:37])
-        elif payload_type == PayloadType.ADVERTISEMENT:
-            values = Advertisement.from_bytes(None)
-        elif payload_type == PayloadType.GPS_POSITION:
-            values = GPSPosition.from_bytes(bytes_[25:33])
-        elif payload_type == PayloadType.DOTBOT_DATA:
-            values = DotBotData.from_bytes(bytes_[25:47])
-        elif payload_type == PayloadType.SAILBOT_DATA:
-            values = SailBotData.from_bytes(bytes_[25:35])
-        elif payload_type == PayloadType.CONTROL_MODE:
-            values = ControlMode.from_bytes(bytes_[25:26])
-        elif payload_type == PayloadType.LH2_WAYPOINTS:
-            values = LH2Waypoints.from_bytes(None)
-        elif payload_type == PayloadType.GPS_WAYPOINTS:
-            values = GPSWaypoints.from_bytes(None)
-        else:
+            for index in range(count)
+        ]
+
+    @staticmethod
+    def reassemble(fragments: Iterable["ProtocolPayload"]) -> "ProtocolPayload":
+        """Returns the waypoints payload made of fragments received in any order."""
+        fragments = list(fragments)
+        if not fragments or any(
+            fragment.payload_type not in WAYPOINTS_FRAGMENT_TYPES.values()
+            for fragment in fragments
+        ):
+            raise ProtocolPayloadParserException("Invalid fragments: not waypoints")
+        fragments.sort(key=lambda fragment: fragment.values.index)
+        first = fragments[0]
+        if [fragment.values.index for fragment in fragments] != list(
+            range(first.values.count)
+        ) or any(
+            fragment.payload_type != first.payload_type
+            or fragment.values.count != first.values.count
+            for fragment in fragments
+        ):
             raise ProtocolPayloadParserException(
-                f"Unsupported payload type '{payload_type.value}'"
+                f"Invalid fragments: {len(fragments)} of {first.values.count} received"
             )
-        return ProtocolPayload(header, payload_type, values)
+        payload_type = next(
+            waypoints_type
+            for waypoints_type, fragment_type in WAYPOINTS_FRAGMENT_TYPES.items()
+            if fragment_type == first.payload_type
+        )
+        return ProtocolPayload(
+            first.header,
+            payload_type,
+            PAYLOAD_TYPES[payload_type.value].values_class(
+                threshold=first.values.threshold,
+                waypoints=list(
+                    chain(*[fragment.values.waypoints for fragment in fragments])
+                ),
+            ),
+        )
 
     def __repr__(self):
         header_separators = [
@@ -443,7 +905,7 @@ class ProtocolPayload:
             for field in self.header.fields
         ]
         type_value = [
-            f" 0x{hexlify(int(PayloadType(self.payload_type).value).to_bytes(1, 'big')).decode():<3}"
+            f" 0x{hexlify(int(self.payload_type.value).to_bytes(1, 'big')).decode():<3}"
         ]
         values_values = [
             f" 0x{hexlify(int(field.value).to_bytes(field.length, 'big', signed=field.signed)).decode():<{4 * field.length - 1}}"
@@ -461,7 +923,7 @@ class ProtocolPayload:
             values = header_values + type_value
             return (
                 f" {' ' * 16}+{'+'.join(separators)}+\n"
-                f" {PayloadType(self.payload_type).name:<16}|{'|'.join(names)}|\n"
+                f" {self.payload_type.name:<16}|{'|'.join(names)}|\n"
                 f" {f'({num_bytes} Bytes)':<16}|{'|'.join(values)}|\n"
                 f" {' ' * 16}+{'+'.join(separators)}+\n"
                 f" {' ' * 16}+{'+'.join(values_separators)}+\n"
@@ -476,7 +938,98 @@ class ProtocolPayload:
         values = header_values + type_value + values_values
         return (
             f" {' ' * 16}+{'+'.join(separators)}+\n"
-            f" {PayloadType(self.payload_type).name:<16}|{'|'.join(names)}|\n"
+            f" {self.payload_type.name:<16}|{'|'.join(names)}|\n"
             f" {f'({num_bytes} Bytes)':<16}|{'|'.join(values)}|\n"
             f" {' ' * 16}+{'+'.join(separators)}+\n"
         )
+
+
+# Header fields read in place by ProtocolFrame
+_HEADER_DESTINATION = struct.Struct("<Q")
+_HEADER_SOURCE = struct.Struct("<8xQ")
+_HEADER_SWARM_ID = struct.Struct("<16xH")
+_HEADER_MSG_ID = struct.Struct("<20xI")
+_HEADER_VERSION_OFFSET = 19
+
+
+class ProtocolFrame:
+    """Read-only view of a received frame.
+
+    Header fields and payload type are read from the buffer, values and header
+    objects are decoded on first access. Version, payload type and length
+    are checked on creation. The buffer is not copied: a frame created from
+    a view returned by HDLCHandler.feed is only valid until the next feed, use
+    ProtocolFrame(bytes(data)) to keep it longer.
+    """
+
+    __slots__ = ("_entry", "_bytes", "_header", "_values")
+
+    def __init__(self, bytes_):
+        if len(bytes_) < PAYLOAD_TYPE_OFFSET:
+            raise ProtocolPayloadParserException(
+                f"Invalid header: {len(bytes_)} bytes (expected: {PAYLOAD_TYPE_OFFSET})"
+            )
+        _check_version(bytes_[_HEADER_VERSION_OFFSET])
+        self._entry = _payload_type_entry(bytes_)
+        self._bytes = bytes_
+        self._header: Optional[ProtocolHeader] = None
+        self._values: Optional[ProtocolData] = None
+
+    def __bytes__(self):
+        return bytes(self._bytes)
+
+    @property
+    def destination(self) -> int:
+        """Destination address."""
+        return _HEADER_DESTINATION.unpack_from(self._bytes)[0]
+
+    @property
+    def source(self) -> int:
+        """Source address."""
+        return _HEADER_SOURCE.unpack_from(self._bytes)[0]
+
+    @property
+    def swarm_id(self) -> int:
+        """Swarm identifier."""
+        return _HEADER_SWARM_ID.unpack_from(self._bytes)[0]
+
+    @property
+    def msg_id(self) -> int:
+        """Message identifier."""
+        return _HEADER_MSG_ID.unpack_from(self._bytes)[0]
+
+    @property
+    def version(self) -> int:
+        """Protocol version."""
+        return self._bytes[_HEADER_VERSION_OFFSET]
+
+    @property
+    def payload_type(self) -> Union[PayloadType, CustomPayloadType]:
+        """Payload type."""
+        return self._entry.payload_type
+
+    @property
+    def header(self) -> ProtocolHeader:
+        """Decoded header."""
+        if self._header is None:
+            try:
+                self._header = ProtocolHeader.unpack_from(self._bytes)
+            except ValueError as exc:
+                raise ProtocolPayloadParserException(f"Invalid header: {exc}") from exc
+        return self._header
+
+    @property
+    def application(self) -> ApplicationType:
+        """Application type."""
+        return self.header.application
+
+    @property
+    def values(self) -> ProtocolData:
+        """Decoded values."""
+        if self._values is None:
+            self._values = _decode_values(self._entry, self._bytes)
+        return self._values
+
+    def to_payload(self) -> ProtocolPayload:
+        """Returns the fully decoded payload."""
+        return ProtocolPayload(self.header, self.payload_type, self.values)
@@ -0,0 +1,155 @@
+"""Module implementing the scheduling of payloads sent to the gateway."""
+
+import itertools
+import time
+
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from dotbot.protocol import PayloadType, ProtocolPayload
+
+
+# Only the latest of these payloads matters, a queued one is replaced by a newer
+# one with the same destination and type.
+COALESCED_PAYLOAD_TYPES = (
+    PayloadType.CMD_MOVE_RAW,
+    PayloadType.CMD_RGB_LED,
+    PayloadType.LH2_LOCATION,
+)
+
+# Priority classes, lower values are transmitted first
+PRIORITY_CONTROL = 0
+PRIORITY_COMMAND = 1
+PRIORITY_LH2_ECHO = 2
+PRIORITY_WAYPOINTS = 3
+PAYLOAD_PRIORITIES = {
+    PayloadType.CONTROL_MODE: PRIORITY_CONTROL,
+    PayloadType.CMD_MOVE_RAW: PRIORITY_COMMAND,
+    PayloadType.CMD_RGB_LED: PRIORITY_COMMAND,
+    PayloadType.LH2_LOCATION: PRIORITY_LH2_ECHO,
+    PayloadType.LH2_WAYPOINTS: PRIORITY_WAYPOINTS,
+    PayloadType.GPS_WAYPOINTS: PRIORITY_WAYPOINTS,
+    PayloadType.LH2_WAYPOINTS_FRAGMENT: PRIORITY_WAYPOINTS,
+    PayloadType.GPS_WAYPOINTS_FRAGMENT: PRIORITY_WAYPOINTS,
+}
+# Payloads dropped when they don't fit in the airtime budget, the next LH2
+# location echo supersedes them anyway
+SHED_PRIORITIES = (PRIORITY_LH2_ECHO,)
+
+
+@dataclass
+class TransmitStatistics:
+    """Counters of the transmit scheduler."""
+
+    frames_sent: int = 0
+    coalesced: int = 0
+    shed: int = 0
+
+
+class TokenBucket:
+    """Token bucket limiting the rate of frames sent.
+
+    rate is in frames per second, burst is the number of frames that can be
+    sent at once, at least 1.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if rate <= 0:
+            raise ValueError(f"Invalid rate {rate}, must be positive")
+        if burst is not None and burst < 1:
+            raise ValueError(f"Invalid burst {burst}, must be at least 1")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate / 10)
+        self.tokens = self.burst
+        self._clock = clock
+        self._last = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def take(self, count: int) -> int:
+        """Takes up to count tokens, returns the number of tokens taken."""
+        self._refill()
+        taken = min(count, int(self.tokens))
+        self.tokens -= taken
+        return taken
+
+    def delay(self) -> float:
+        """Returns the time in seconds until a token is available."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class TransmitScheduler:
+    """Queue of payloads waiting to be transmitted.
+
+    Payloads with a type in COALESCED_PAYLOAD_TYPES replace the queued payload
+    with the same destination and type, keeping its position in the queue.
+    Other payloads are transmitted in FIFO order.
+
+    When frame_rate is set, payloads are released by priority class within a
+    frames per second budget, those in SHED_PRIORITIES are dropped when they
+    exceed it. Only LH2 location echoes are shed since they are superseded by
+    the next one, the other classes carry commands or state that are not sent
+    again and wait for their turn instead.
+    """
+
+    def __init__(
+        self,
+        frame_rate: float = 0,
+        burst: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._queue: Dict[Hashable, Tuple[ProtocolPayload, Future]] = {}
+        self._counter = itertools.count()
+        self.bucket = TokenBucket(frame_rate, burst, clock) if frame_rate else None
+        self.statistics = TransmitStatistics()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def push(self, payload: ProtocolPayload) -> Future:
+        """Queue a payload, returns a future resolved once it is transmitted."""
+        if payload.payload_type in COALESCED_PAYLOAD_TYPES:
+            key = (payload.header.destination, payload.payload_type)
+            if key in self._queue:
+                _, future = self._queue[key]
+                self._queue[key] = (payload, future)
+                self.statistics.coalesced += 1
+                return future
+        else:
+            key = next(self._counter)
+        future = Future()
+        self._queue[key] = (payload, future)
+        return future
+
+    def pop_ready(self) -> List[Tuple[ProtocolPayload, Future]]:
+        """Returns and removes the payloads that fit in the airtime budget."""
+        keys = sorted(
+            self._queue,
+            key=lambda key: PAYLOAD_PRIORITIES.get(
+                self._queue[key][0].payload_type, PRIORITY_COMMAND
+            ),
+        )
+        count = len(keys) if self.bucket is None else self.bucket.take(len(keys))
+        entries = [self._queue.pop(key) for key in keys[:count]]
+        for key in keys[count:]:
+            payload, future = self._queue[key]
+            if PAYLOAD_PRIORITIES.get(payload.payload_type) in SHED_PRIORITIES:
+                del self._queue[key]
+                future.cancel()
+                self.statistics.shed += 1
+        self.statistics.frames_sent += len(entries)
+        return entries
+
+    def delay(self) -> float:
+        """Returns the time in seconds until a queued payload can be sent."""
+        return 0.0 if self.bucket is None else self.bucket.delay()
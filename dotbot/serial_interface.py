@@ -1,9 +1,14 @@
 """Dotbot controller serial interface."""
 
+import asyncio
+import os
+import queue
 import threading
 import time
 
-from typing import Callable
+from concurrent.futures import Future
+from typing import Callable, Optional, Tuple
+from urllib.parse import urlsplit
 
 import serial
 
@@ -12,6 +17,10 @@ from dotbot.logger import LOGGER
 
 PAYLOAD_CHUNK_SIZE = 64
 PAYLOAD_CHUNK_DELAY = 0.002  # 2 ms
+READ_CHUNK_SIZE_DEFAULT = 4096
+READ_TIMEOUT_DEFAULT = 0.1  # 100 ms
+TX_QUEUE_SIZE_DEFAULT = 256
+SOCKET_URL_SCHEMES = ("tcp", "unix")
 
 
 class SerialInterfaceException(Exception):
@@ -21,37 +30,396 @@ class SerialInterfaceException(Exception):
 class SerialInterface(threading.Thread):
     """Bidirectional serial interface."""
 
-    def __init__(self, port: str, baudrate: int, callback: Callable):
+    def __init__(
+        self,
+        port: str,
+        baudrate: int,
+        callback: Callable,
+        read_chunk_size: int = READ_CHUNK_SIZE_DEFAULT,
+        read_timeout: float = READ_TIMEOUT_DEFAULT,
+        tx_queue_size: int = TX_QUEUE_SIZE_DEFAULT,
+    ):  # pylint: disable=too-many-arguments
         self.callback = callback
-        self.serial = serial.Serial(port, baudrate)
+        self.read_chunk_size = read_chunk_size
+        self.serial = serial.Serial(port, baudrate, timeout=read_timeout)
+        self._logger = LOGGER.bind(context=__name__)
+        self.closed = Future()
+        self._tx_queue = queue.Queue(maxsize=tx_queue_size)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
         super().__init__(daemon=True)
         self.start()
-        self._logger = LOGGER.bind(context=__name__)
         self._logger.info("Serial port thread started")
 
     def run(self):
-        """Listen continuously at each byte received on serial."""
+        """Listen continuously to chunks of bytes received on serial."""
         try:
             while 1:
-                byte = self.serial.read(1)
-                if byte is None:
-                    msg = "Serial port disconnected"
-                    self._logger.warning(msg)
-                    raise SerialInterfaceException(msg)
-                self.callback(byte)
-        except serial.serialutil.PortNotOpenError as exc:
-            self._logger.error(f"{exc}")
-            raise SerialInterfaceException(f"{exc}") from exc
-        except serial.serialutil.SerialException as exc:
+                # Wait for the first byte then read everything already received
+                data = self.serial.read(1)
+                if not data:
+                    # Read timeout
+                    continue
+                in_waiting = min(self.serial.in_waiting, self.read_chunk_size - 1)
+                if in_waiting > 0:
+                    data += self.serial.read(in_waiting)
+                self.callback(data)
+        except (serial.serialutil.SerialException, TypeError) as exc:
+            # pyserial raises TypeError when the port is closed during a read
+            if self.closed.done():
+                # Closed on purpose
+                return
             self._logger.error(f"{exc}")
+            self.closed.set_exception(SerialInterfaceException(f"{exc}"))
             raise SerialInterfaceException(f"{exc}") from exc
 
-    def write(self, bytes_):
-        """Write bytes on serial."""
-        # Send 64 bytes at a time
-        pos = 0
-        while (pos % PAYLOAD_CHUNK_SIZE) == 0 and pos < len(bytes_):
-            self.serial.write(bytes_[pos : pos + PAYLOAD_CHUNK_SIZE])
-            self.serial.flush()
-            pos += PAYLOAD_CHUNK_SIZE
-            time.sleep(PAYLOAD_CHUNK_DELAY)
+    def _write_loop(self):
+        """Write continuously the bytes queued for transmission."""
+        while 1:
+            item = self._tx_queue.get()
+            if item is None:
+                # Woken up by close()
+                return
+            bytes_, future = item
+            if self.closed.done():
+                future.set_exception(SerialInterfaceException("Serial port closed"))
+                continue
+            try:
+                # Send 64 bytes at a time
+                pos = 0
+                while pos < len(bytes_):
+                    self.serial.write(bytes_[pos : pos + PAYLOAD_CHUNK_SIZE])
+                    self.serial.flush()
+                    pos += PAYLOAD_CHUNK_SIZE
+                    time.sleep(PAYLOAD_CHUNK_DELAY)
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                # Keep the thread alive, the next bytes queued are still written
+                self._logger.error(f"{exc}")
+                future.set_exception(SerialInterfaceException(f"{exc}"))
+            else:
+                future.set_result(len(bytes_))
+
+    def close(self):
+        """Close the serial port, the reader and writer threads stop.
+
+        The futures of the bytes still queued for transmission raise
+        SerialInterfaceException.
+        """
+        if not self.closed.done():
+            self.closed.set_result(None)
+        self.serial.close()
+        if self._writer.is_alive():
+            # The writer fails the queued bytes before reaching the sentinel
+            self._tx_queue.put(None)
+            if threading.current_thread() is not self._writer:
+                self._writer.join()
+
+    def write(self, bytes_) -> Future:
+        """Queue bytes for transmission on serial without blocking.
+
+        The returned future is resolved once the bytes are written, use
+        asyncio.wrap_future to await it from a coroutine.
+        """
+        future = Future()
+        if self.closed.done():
+            future.set_exception(SerialInterfaceException("Serial port closed"))
+            return future
+        try:
+            self._tx_queue.put_nowait((bytes_, future))
+        except queue.Full:
+            msg = "Transmit queue full"
+            self._logger.warning(msg)
+            future.set_exception(SerialInterfaceException(msg))
+        return future
+
+
+class AsyncSerialInterface:
+    """Bidirectional serial interface driven by the asyncio event loop.
+
+    The serial file descriptor is watched with add_reader/add_writer so it
+    only works with event loops supporting them (e.g. not on Windows).
+    Received chunks are passed to the callback from the event loop.
+    """
+
+    def __init__(
+        self,
+        port: str,
+        baudrate: int,
+        callback: Callable,
+        read_chunk_size: int = READ_CHUNK_SIZE_DEFAULT,
+        tx_queue_size: int = TX_QUEUE_SIZE_DEFAULT,
+    ):
+        self.callback = callback
+        self.read_chunk_size = read_chunk_size
+        self.tx_queue_size = tx_queue_size
+        # With a timeout of 0, pyserial opens the port in non blocking mode
+        self.serial = serial.Serial(port, baudrate, timeout=0)
+        self._fd = self.serial.fileno()
+        self._loop = asyncio.get_running_loop()
+        self._logger = LOGGER.bind(context=__name__)
+        self.closed = self._loop.create_future()
+        self._tx_buffer = bytearray()
+        self._tx_futures = []
+        self._tx_written = 0
+        self._tx_paused = False
+        self._loop.add_reader(self._fd, self._on_readable)
+        self._logger.info("Serial port reader registered")
+
+    def _close(self, msg):
+        """Stop watching and close the serial port, then report the error."""
+        self._logger.error(msg)
+        self._loop.remove_reader(self._fd)
+        self._loop.remove_writer(self._fd)
+        self.serial.close()
+        error = SerialInterfaceException(msg)
+        for _, _, future in self._tx_futures:
+            if not future.done():
+                future.set_exception(error)
+        self._tx_futures = []
+        if not self.closed.done():
+            self.closed.set_exception(error)
+
+    def _on_readable(self):
+        """Read all bytes available and pass them to the callback."""
+        try:
+            data = os.read(self._fd, self.read_chunk_size)
+        except BlockingIOError:
+            return
+        except OSError as exc:
+            self._close(f"{exc}")
+            return
+        if not data:
+            self._close("Serial port disconnected")
+            return
+        self.callback(data)
+
+    def _on_writable(self):
+        """Write the next chunk of queued bytes."""
+        try:
+            written = os.write(self._fd, self._tx_buffer[:PAYLOAD_CHUNK_SIZE])
+        except BlockingIOError:
+            return
+        except OSError as exc:
+            self._close(f"{exc}")
+            return
+        del self._tx_buffer[:written]
+        self._tx_written += written
+        while self._tx_futures and self._tx_futures[0][0] <= self._tx_written:
+            _, length, future = self._tx_futures.pop(0)
+            if not future.done():
+                future.set_result(length)
+        # Leave some time to the gateway between chunks
+        self._loop.remove_writer(self._fd)
+        if self._tx_buffer:
+            self._tx_paused = True
+            self._loop.call_later(PAYLOAD_CHUNK_DELAY, self._resume_writing)
+
+    def _resume_writing(self):
+        self._tx_paused = False
+        if self._tx_buffer and not self.closed.done():
+            self._loop.add_writer(self._fd, self._on_writable)
+
+    def write(self, bytes_) -> asyncio.Future:
+        """Queue bytes for transmission on serial without blocking.
+
+        The returned future is resolved once the bytes are written.
+        """
+        future = self._loop.create_future()
+        if self.closed.done():
+            future.set_exception(SerialInterfaceException("Serial port closed"))
+            return future
+        if len(self._tx_futures) >= self.tx_queue_size:
+            msg = "Transmit queue full"
+            self._logger.warning(msg)
+            future.set_exception(SerialInterfaceException(msg))
+            return future
+        if not self._tx_buffer and not self._tx_paused:
+            self._loop.add_writer(self._fd, self._on_writable)
+        self._tx_buffer += bytes_
+        end = self._tx_written + len(self._tx_buffer)
+        self._tx_futures.append((end, len(bytes_), future))
+        return future
+
+    def close(self):
+        """Stop watching the serial port and close it."""
+        self._loop.remove_reader(self._fd)
+        self._loop.remove_writer(self._fd)
+        self.serial.close()
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+
+def parse_socket_url(port: str) -> Optional[Tuple[str, str]]:
+    """Returns the scheme and address of a socket URL, None for a serial port.
+
+    >>> parse_socket_url("tcp://localhost:5000")
+    ('tcp', 'localhost:5000')
+    >>> parse_socket_url("tcp://[::1]:5000")
+    ('tcp', '[::1]:5000')
+    >>> parse_socket_url("unix:///tmp/gateway.sock")
+    ('unix', '/tmp/gateway.sock')
+    >>> parse_socket_url("/dev/ttyACM0") is None
+    True
+    """
+    for scheme in SOCKET_URL_SCHEMES:
+        prefix = f"{scheme}://"
+        if port.startswith(prefix):
+            return scheme, port[len(prefix) :]
+    return None
+
+
+def _tcp_host_port(url: str) -> Tuple[str, int]:
+    """Returns the host and port of a TCP socket URL.
+
+    >>> _tcp_host_port("tcp://localhost:5000")
+    ('localhost', 5000)
+    >>> _tcp_host_port("tcp://[::1]:5000")
+    ('::1', 5000)
+    """
+    parts = urlsplit(url)
+    if parts.hostname is None or parts.port is None:
+        raise ValueError("expected tcp://host:port")
+    return parts.hostname, parts.port
+
+
+class _SocketProtocol(asyncio.Protocol):
+    """Protocol forwarding the events of a socket transport to its interface."""
+
+    def __init__(self, interface):
+        self.interface = interface
+
+    def connection_made(self, transport):
+        self.interface._connection_made(transport)  # pylint: disable=protected-access
+
+    def data_received(self, data):
+        self.interface.callback(data)
+
+    def connection_lost(self, exc):
+        self.interface._connection_lost(exc)  # pylint: disable=protected-access
+
+    def pause_writing(self):
+        self.interface._tx_paused = True  # pylint: disable=protected-access
+
+    def resume_writing(self):
+        self.interface._resume_writing()  # pylint: disable=protected-access
+
+
+class SocketInterface:
+    """Bidirectional interface with a gateway bridged on a TCP or UNIX socket.
+
+    The socket carries the raw HDLC byte stream, like ser2net does. Use the
+    open coroutine to connect, received chunks are passed to the callback from
+    the event loop. Bytes are sent in chunks paced like on a serial port, a
+    bridge forwards them as is to the gateway.
+    """
+
+    def __init__(self, url: str, callback: Callable, tx_queue_size: int):
+        self.url = url
+        self.callback = callback
+        self.tx_queue_size = tx_queue_size
+        self.transport: Optional[asyncio.Transport] = None
+        self._loop = asyncio.get_running_loop()
+        self._logger = LOGGER.bind(context=__name__, url=url)
+        self.closed = self._loop.create_future()
+        self._tx_buffer = bytearray()
+        self._tx_futures = []
+        self._tx_written = 0
+        self._tx_paused = False
+        self._tx_timer: Optional[asyncio.TimerHandle] = None
+
+    @classmethod
+    async def open(
+        cls,
+        url: str,
+        callback: Callable,
+        tx_queue_size: int = TX_QUEUE_SIZE_DEFAULT,
+    ) -> "SocketInterface":
+        """Connects to the socket, url is either tcp://host:port or unix://path."""
+        interface = cls(url, callback, tx_queue_size)
+        scheme, address = parse_socket_url(url)
+        try:
+            if scheme == "tcp":
+                host, port = _tcp_host_port(url)
+                await interface._loop.create_connection(
+                    lambda: _SocketProtocol(interface), host, port
+                )
+            else:
+                await interface._loop.create_unix_connection(
+                    lambda: _SocketProtocol(interface), address
+                )
+        except (OSError, ValueError, NotImplementedError) as exc:
+            raise SerialInterfaceException(f"Cannot connect to {url}: {exc}") from exc
+        return interface
+
+    def _connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        self._logger.info("Socket connected")
+
+    def _connection_lost(self, exc):
+        msg = f"{exc}" if exc is not None else "Socket disconnected"
+        error = SerialInterfaceException(msg)
+        if self._tx_timer is not None:
+            self._tx_timer.cancel()
+            self._tx_timer = None
+        for _, _, future in self._tx_futures:
+            if not future.done():
+                future.set_exception(error)
+        self._tx_futures = []
+        self._tx_buffer.clear()
+        if not self.closed.done():
+            self._logger.error(msg)
+            self.closed.set_exception(error)
+
+    def _resume_writing(self):
+        self._tx_paused = False
+        if self._tx_timer is None:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        """Hand the next chunk of queued bytes to the socket."""
+        self._tx_timer = None
+        if self._tx_paused or not self._tx_buffer:
+            return
+        chunk = bytes(self._tx_buffer[:PAYLOAD_CHUNK_SIZE])
+        del self._tx_buffer[:PAYLOAD_CHUNK_SIZE]
+        self._tx_written += len(chunk)
+        while self._tx_futures and self._tx_futures[0][0] <= self._tx_written:
+            _, length, future = self._tx_futures.pop(0)
+            if not future.done():
+                future.set_result(length)
+        # May pause writing when the socket buffer is full
+        self.transport.write(chunk)
+        if self._tx_buffer:
+            # Leave some time to the gateway between chunks
+            self._tx_timer = self._loop.call_later(
+                PAYLOAD_CHUNK_DELAY, self._write_chunk
+            )
+
+    def write(self, bytes_) -> asyncio.Future:
+        """Queue bytes for transmission on the socket without blocking.
+
+        The returned future is resolved once the bytes are handed to the socket,
+        it stays pending while the peer doesn't keep up.
+        """
+        future = self._loop.create_future()
+        if self.closed.done():
+            future.set_exception(SerialInterfaceException("Socket closed"))
+            return future
+        if len(self._tx_futures) >= self.tx_queue_size:
+            msg = "Transmit queue full"
+            self._logger.warning(msg)
+            future.set_exception(SerialInterfaceException(msg))
+            return future
+        self._tx_buffer += bytes_
+        end = self._tx_written + len(self._tx_buffer)
+        self._tx_futures.append((end, len(bytes_), future))
+        if self._tx_timer is None:
+            self._write_chunk()
+        return future
+
+    def close(self):
+        """Close the socket."""
+        if not self.closed.done():
+            self.closed.set_result(None)
+        if self.transport is not None:
+            self.transport.close()
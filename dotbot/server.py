@@ -1,5 +1,6 @@
 """Module for the web server application."""
 import asyncio
+import dataclasses
 import os
 from binascii import hexlify
 from typing import List
@@ -13,6 +14,10 @@ from dotbot import pydotbot_version
 from dotbot.logger import LOGGER
 from dotbot.models import (
     DotBotCalibrationStateModel,
+    DotBotGatewayModel,
+    DotBotHDLCStatisticsModel,
+    DotBotLinkStatisticsModel,
+    DotBotTransmitStatisticsModel,
     DotBotModel,
     DotBotQueryModel,
     DotBotAddressModel,
@@ -24,8 +29,6 @@ from dotbot.models import (
     DotBotNotificationModel,
 )
 from dotbot.protocol import (
-    PROTOCOL_VERSION,
-    ProtocolHeader,
     ProtocolPayload,
     PayloadType,
     CommandMoveRaw,
@@ -87,6 +90,66 @@ async def controller_dotbot_address_update(data: DotBotAddressModel):
     app.controller.header.destination = int(data.address, 16)
 
 
+@app.get(
+    path="/controller/hdlc/statistics",
+    response_model=DotBotHDLCStatisticsModel,
+    summary="Return the statistics of the controller HDLC receiver",
+    tags=["controller"],
+)
+async def controller_hdlc_statistics():
+    """Returns the HDLC receiver statistics."""
+    return DotBotHDLCStatisticsModel(
+        **dataclasses.asdict(app.controller.hdlc_statistics)
+    )
+
+
+@app.get(
+    path="/controller/gateways",
+    response_model=List[DotBotGatewayModel],
+    summary="Return the gateways and the state of their link",
+    tags=["controller"],
+)
+async def controller_gateways():
+    """Returns the gateways attached to the controller."""
+    return app.controller.get_gateways()
+
+
+@app.get(
+    path="/controller/transmit/statistics",
+    response_model=DotBotTransmitStatisticsModel,
+    summary="Return the statistics of the controller transmit scheduler",
+    tags=["controller"],
+)
+async def controller_transmit_statistics():
+    """Returns the transmit scheduler statistics."""
+    return DotBotTransmitStatisticsModel(
+        **dataclasses.asdict(app.controller.transmit_statistics)
+    )
+
+
+@app.get(
+    path="/controller/links/statistics",
+    response_model=List[DotBotLinkStatisticsModel],
+    summary="Return the round-trip time and loss statistics of each DotBot",
+    tags=["controller"],
+)
+async def controller_links_statistics():
+    """Returns the acknowledgment statistics of the requests, per DotBot."""
+    return [
+        DotBotLinkStatisticsModel(
+            address=address,
+            sent=statistics.sent,
+            acknowledged=statistics.acknowledged,
+            lost=statistics.lost,
+            loss=statistics.loss,
+            rtt_p50=statistics.rtt_percentile(50),
+            rtt_p90=statistics.rtt_percentile(90),
+            rtt_p99=statistics.rtt_percentile(99),
+        )
+        for address, statistics in sorted(app.controller.link_statistics.items())
+    ]
+
+
 @app.put(
     path="/controller/dotbots/{address}/{application}/move_raw",
     summary="Move the dotbot",
@@ -99,13 +162,7 @@ async def dotbots_move_raw(
     if address not in app.controller.dotbots:
         raise HTTPException(status_code=404, detail="No matching dotbot found")
 
-    header = ProtocolHeader(
-        destination=int(address, 16),
-        source=int(app.controller.settings.gw_address, 16),
-        swarm_id=int(app.controller.settings.swarm_id, 16),
-        application=ApplicationType(application),
-        version=PROTOCOL_VERSION,
-    )
+    header = app.controller.headers.get(address, application)
     payload = ProtocolPayload(
         header,
         PayloadType.CMD_MOVE_RAW,
@@ -129,13 +186,7 @@ async def dotbots_rgb_led(
     if address not in app.controller.dotbots:
         raise HTTPException(status_code=404, detail="No matching dotbot found")
 
-    header = ProtocolHeader(
-        destination=int(address, 16),
-        source=int(app.controller.settings.gw_address, 16),
-        swarm_id=int(app.controller.settings.swarm_id, 16),
-        application=ApplicationType(application),
-        version=PROTOCOL_VERSION,
-    )
+    header = app.controller.headers.get(address, application)
     payload = ProtocolPayload(
         header,
         PayloadType.CMD_RGB_LED,
@@ -155,13 +206,7 @@ async def dotbots_mode(address: str, application: int, data: DotBotControlModeMo
     if address not in app.controller.dotbots:
         raise HTTPException(status_code=404, detail="No matching dotbot found")
 
-    header = ProtocolHeader(
-        destination=int(address, 16),
-        source=int(app.controller.settings.gw_address, 16),
-        swarm_id=int(app.controller.settings.swarm_id, 16),
-        application=ApplicationType(application),
-        version=PROTOCOL_VERSION,
-    )
+    header = app.controller.headers.get(address, application)
     payload = ProtocolPayload(
         header,
         PayloadType.CONTROL_MODE,
@@ -185,13 +230,7 @@ async def dotbots_waypoints(
     if address not in app.controller.dotbots:
         raise HTTPException(status_code=404, detail="No matching dotbot found")
 
-    header = ProtocolHeader(
-        destination=int(address, 16),
-        source=int(app.controller.settings.gw_address, 16),
-        swarm_id=int(app.controller.settings.swarm_id, 16),
-        application=ApplicationType(application),
-        version=PROTOCOL_VERSION,
-    )
+    header = app.controller.headers.get(address, application)
     waypoints_list = waypoints.waypoints
     if ApplicationType(application) == ApplicationType.SailBot:
         if app.controller.dotbots[address].gps_position is not None:
@@ -234,7 +273,8 @@ async def dotbots_waypoints(
         )
     app.controller.dotbots[address].waypoints = waypoints_list
     app.controller.dotbots[address].waypoints_threshold = waypoints.threshold
-    app.controller.send_payload(payload)
+    for fragment in payload.fragment():
+        app.controller.send_payload(fragment)
     await app.controller.notify_clients(
         DotBotNotificationModel(cmd=DotBotNotificationCommand.RELOAD)
     )
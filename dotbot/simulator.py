@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+
+"""Gateway simulator emulating DotBots and SailBots over a pseudo terminal."""
+
+import asyncio
+import math
+import os
+import random
+import sys
+import time
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import click
+
+from dotbot import SWARM_ID_DEFAULT, pydotbot_version
+from dotbot.hdlc import HDLCHandler, hdlc_encode_many
+from dotbot.protocol import (
+    PROTOCOL_VERSION,
+    Advertisement,
+    ApplicationType,
+    ControlModeType,
+    DotBotData,
+    Lh2RawLocation,
+    PayloadType,
+    ProtocolHeader,
+    ProtocolPayload,
+    ProtocolPayloadParserException,
+    SailBotData,
+)
+
+
+SIMULATOR_DOTBOTS_DEFAULT = 10
+SIMULATOR_SAILBOTS_DEFAULT = 0
+SIMULATOR_RATE_DEFAULT = 10.0  # data payloads per second and per bot
+SIMULATOR_ADVERTISEMENT_RATE_DEFAULT = 2.0  # advertisements per second and per bot
+SIMULATOR_TICK_PERIOD = 0.01
+SIMULATOR_FIRST_ADDRESS = 0x1
+DOTBOT_MAX_SPEED = 0.1  # LH2 normalized distance per second
+DOTBOT_MAX_ROTATION = 180  # degrees per second
+SAILBOT_MAX_SPEED = 2.0  # meters per second
+SAILBOT_ORIGIN = (48.832313, 2.412689)
+BROADCAST_ADDRESS = 0xFFFFFFFFFFFFFFFF
+EARTH_RADIUS = 6371000.0
+
+
+@dataclass
+class SimulatedBot:  # pylint: disable=too-many-instance-attributes
+    """State of a simulated robot."""
+
+    address: int
+    application: ApplicationType = ApplicationType.DotBot
+    mode: ControlModeType = ControlModeType.MANUAL
+    direction: int = 0
+    x: float = 0.5
+    y: float = 0.5
+    latitude: float = SAILBOT_ORIGIN[0]
+    longitude: float = SAILBOT_ORIGIN[1]
+    left_speed: int = 0
+    right_speed: int = 0
+    rgb_led: List[int] = field(default_factory=lambda: [0, 0, 0])
+
+    def step(self, delay: float):
+        """Moves the robot according to its last move command."""
+        speed = (self.left_speed + self.right_speed) / 254
+        rotation = (self.left_speed - self.right_speed) / 254
+        self.direction = int(self.direction + rotation * DOTBOT_MAX_ROTATION * delay)
+        self.direction %= 360
+        heading = math.radians(self.direction)
+        if self.application == ApplicationType.SailBot:
+            distance = speed * SAILBOT_MAX_SPEED * delay
+            self.latitude += math.degrees(distance * math.cos(heading) / EARTH_RADIUS)
+            self.longitude += math.degrees(
+                distance
+                * math.sin(heading)
+                / (EARTH_RADIUS * math.cos(math.radians(self.latitude)))
+            )
+        else:
+            distance = speed * DOTBOT_MAX_SPEED * delay
+            self.x = min(1.0, max(0.0, self.x + distance * math.sin(heading)))
+            self.y = min(1.0, max(0.0, self.y - distance * math.cos(heading)))
+
+    def data(self) -> ProtocolPayload:
+        """Returns the payload periodically sent by the robot."""
+        header = ProtocolHeader(
+            BROADCAST_ADDRESS, self.address, 0, self.application, PROTOCOL_VERSION
+        )
+        if self.application == ApplicationType.SailBot:
+            return ProtocolPayload(
+                header,
+                PayloadType.SAILBOT_DATA,
+                SailBotData(
+                    direction=self.direction,
+                    latitude=int(self.latitude * 1e6),
+                    longitude=int(self.longitude * 1e6),
+                ),
+            )
+        # Raw LH2 data are not related to the simulated position, the controller
+        # cannot compute a position from them without a calibration anyway
+        return ProtocolPayload(
+            header,
+            PayloadType.DOTBOT_DATA,
+            DotBotData(
+                direction=self.direction,
+                locations=[
+                    Lh2RawLocation(random.getrandbits(64), index, 0)
+                    for index in range(2)
+                ],
+            ),
+        )
+
+    def advertisement(self) -> ProtocolPayload:
+        """Returns the advertisement payload of the robot."""
+        return ProtocolPayload(
+            ProtocolHeader(
+                BROADCAST_ADDRESS, self.address, 0, self.application, PROTOCOL_VERSION
+            ),
+            PayloadType.ADVERTISEMENT,
+            Advertisement(),
+        )
+
+    def handle_payload(self, payload: ProtocolPayload):
+        """Applies a command received from the controller."""
+        if payload.payload_type == PayloadType.CMD_MOVE_RAW:
+            self.left_speed = payload.values.left_y
+            self.right_speed = payload.values.right_y
+        elif payload.payload_type == PayloadType.CMD_RGB_LED:
+            self.rgb_led = [
+                payload.values.red,
+                payload.values.green,
+                payload.values.blue,
+            ]
+        elif payload.payload_type == PayloadType.CONTROL_MODE:
+            self.mode = ControlModeType(payload.values.mode)
+
+
+class GatewaySimulator:  # pylint: disable=too-many-instance-attributes
+    """Gateway speaking the PyDotBot protocol on behalf of simulated robots."""
+
+    def __init__(
+        self,
+        dotbots: int = SIMULATOR_DOTBOTS_DEFAULT,
+        sailbots: int = SIMULATOR_SAILBOTS_DEFAULT,
+        rate: float = SIMULATOR_RATE_DEFAULT,
+        advertisement_rate: float = SIMULATOR_ADVERTISEMENT_RATE_DEFAULT,
+        swarm_id: int = 0,
+    ):
+        self.bots: Dict[int, SimulatedBot] = {}
+        for index in range(dotbots + sailbots):
+            address = SIMULATOR_FIRST_ADDRESS + index
+            self.bots[address] = SimulatedBot(
+                address,
+                ApplicationType.DotBot if index < dotbots else ApplicationType.SailBot,
+                x=random.random(),
+                y=random.random(),
+                direction=random.randrange(360),
+            )
+        self.rate = rate
+        self.advertisement_rate = advertisement_rate
+        self.swarm_id = swarm_id
+        self.hdlc_handler = HDLCHandler()
+        self.handshake_done = False
+        self.received = Counter()
+        self.frames_sent = 0
+        self.bytes_dropped = 0
+        self.master: Optional[int] = None
+        self.slave: Optional[int] = None
+        self._cursors = {"data": 0, "advertisement": 0}
+        self._credits = {"data": 0.0, "advertisement": 0.0}
+
+    def open(self) -> str:
+        """Opens the pseudo terminal, returns the path of the controller side."""
+        import tty  # pylint: disable=import-outside-toplevel
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        return os.ttyname(self.slave)
+
+    def close(self):
+        """Closes the pseudo terminal."""
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = None
+
+    def handle_data(self, data: bytes) -> bytes:
+        """Handles bytes sent by the controller, returns the bytes to reply."""
+        reply = b""
+        if self.handshake_done is False and data:
+            # The controller starts by sending its protocol version
+            self.handshake_done = True
+            if data[0] == PROTOCOL_VERSION:
+                reply = bytes([PROTOCOL_VERSION])
+                data = data[1:]
+        for frame in self.hdlc_handler.feed(data):
+            try:
+                payload = ProtocolPayload.from_bytes(frame)
+            except ProtocolPayloadParserException:
+                self.received["invalid"] += 1
+                continue
+            self.received[payload.payload_type.name] += 1
+            if payload.header.destination == BROADCAST_ADDRESS:
+                bots = self.bots.values()
+            elif payload.header.destination in self.bots:
+                bots = [self.bots[payload.header.destination]]
+            else:
+                continue
+            for bot in bots:
+                bot.handle_payload(payload)
+        return reply
+
+    def _next_bots(self, kind: str, rate: float, delay: float) -> List[SimulatedBot]:
+        """Returns the bots, in turn, that have to send a payload of a kind."""
+        self._credits[kind] += len(self.bots) * rate * delay
+        count = int(self._credits[kind])
+        self._credits[kind] -= count
+        bots = list(self.bots.values())
+        selected = [
+            bots[(self._cursors[kind] + index) % len(bots)] for index in range(count)
+        ]
+        self._cursors[kind] = (self._cursors[kind] + count) % len(bots)
+        return selected
+
+    def tick(self, delay: float) -> bytearray:
+        """Advances the simulation, returns the HDLC frames to send."""
+        if not self.bots:
+            return bytearray()
+        for bot in self.bots.values():
+            bot.step(delay)
+        payloads = [
+            bot.advertisement()
+            for bot in self._next_bots("advertisement", self.advertisement_rate, delay)
+        ]
+        payloads += [bot.data() for bot in self._next_bots("data", self.rate, delay)]
+        for payload in payloads:
+            payload.header.swarm_id = self.swarm_id
+        self.frames_sent += len(payloads)
+        return hdlc_encode_many(payload.to_bytes() for payload in payloads)
+
+    def _write(self, data: bytes):
+        try:
+            written = os.write(self.master, data)
+        except BlockingIOError:
+            written = 0
+        # Nobody reads the other side fast enough
+        self.bytes_dropped += len(data) - written
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.master, 4096)
+        except (BlockingIOError, OSError):
+            return
+        reply = self.handle_data(data)
+        if reply:
+            self._write(reply)
+
+    async def run(self, duration: float = 0):
+        """Runs the simulation, forever if duration is 0."""
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.master, self._on_readable)
+        start = last = time.monotonic()
+        try:
+            while duration == 0 or last - start < duration:
+                await asyncio.sleep(SIMULATOR_TICK_PERIOD)
+                now = time.monotonic()
+                frames = self.tick(now - last)
+                last = now
+                if frames:
+                    self._write(frames)
+        finally:
+            loop.remove_reader(self.master)
+
+
+@click.command()
+@click.option(
+    "-d",
+    "--dotbots",
+    type=int,
+    default=SIMULATOR_DOTBOTS_DEFAULT,
+    help=f"Number of simulated DotBots. Defaults to {SIMULATOR_DOTBOTS_DEFAULT}",
+)
+@click.option(
+    "-s",
+    "--sailbots",
+    type=int,
+    default=SIMULATOR_SAILBOTS_DEFAULT,
+    help=f"Number of simulated SailBots. Defaults to {SIMULATOR_SAILBOTS_DEFAULT}",
+)
+@click.option(
+    "-r",
+    "--rate",
+    type=float,
+    default=SIMULATOR_RATE_DEFAULT,
+    help=f"Data payloads sent per second by each bot. Defaults to {SIMULATOR_RATE_DEFAULT}",
+)
+@click.option(
+    "-a",
+    "--advertisement-rate",
+    type=float,
+    default=SIMULATOR_ADVERTISEMENT_RATE_DEFAULT,
+    help=f"Advertisements sent per second by each bot. Defaults to {SIMULATOR_ADVERTISEMENT_RATE_DEFAULT}",
+)
+@click.option(
+    "--swarm-id",
+    type=str,
+    default=SWARM_ID_DEFAULT,
+    help=f"Swarm ID in hex. Defaults to {SWARM_ID_DEFAULT:>0{4}}",
+)
+@click.option(
+    "-l",
+    "--link",
+    type=click.Path(),
+    help="Create a symbolic link to the pseudo terminal at this path",
+)
+@click.option(
+    "--duration",
+    type=float,
+    default=0,
+    help="Duration of the simulation in seconds, 0 runs forever. Defaults to 0",
+)
+def main(
+    dotbots, sailbots, rate, advertisement_rate, swarm_id, link, duration
+):  # pylint: disable=too-many-arguments
+    """Gateway simulator, emulates DotBots and SailBots over a pseudo terminal."""
+    print(f"Welcome to the DotBots gateway simulator (version: {pydotbot_version()}).")
+    if sys.platform == "win32":
+        sys.exit("Error: the simulator requires a POSIX system")
+    simulator = GatewaySimulator(
+        dotbots, sailbots, rate, advertisement_rate, int(swarm_id, 16)
+    )
+    port = simulator.open()
+    if link is not None:
+        if os.path.islink(link):
+            os.unlink(link)
+        os.symlink(port, link)
+        port = link
+    print(f"Simulated gateway available on {port}")
+    try:
+        asyncio.run(simulator.run(duration))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.close()
+        if link is not None and os.path.islink(link):
+            os.unlink(link)
+    print(
+        f"{simulator.frames_sent} frames sent, {simulator.bytes_dropped} bytes "
+        f"dropped, received: {dict(simulator.received)}"
+    )
+
+
+if __name__ == "__main__":
+    main()  # pragma: nocover, pylint: disable=no-value-for-parameter
@@ -0,0 +1,178 @@
+"""Test module for the serial capture and replay."""
+
+import asyncio
+import time
+
+import pytest
+
+from dotbot.capture import (
+    CAPTURE_MAGIC,
+    CAPTURE_RECORD_HEADER,
+    CaptureDirection,
+    CaptureRecord,
+    CaptureWriter,
+    ReplayInterface,
+    read_capture,
+)
+from dotbot.controller import ControllerBase, ControllerSettings
+from dotbot.hdlc import hdlc_encode
+from dotbot.protocol import (
+    PROTOCOL_VERSION,
+    Advertisement,
+    PayloadType,
+    ProtocolHeader,
+    ProtocolPayload,
+)
+
+
+class ControllerTest(ControllerBase):
+    """Controller used to replay captures."""
+
+    def init(self):
+        pass
+
+    async def start(self):
+        pass
+
+
+def _write_capture(path, records):
+    writer = CaptureWriter(path)
+    for direction, data in records:
+        writer.write(direction, data)
+    writer.close()
+
+
+def test_capture_read_write(tmp_path):
+    """Check captured chunks are read back in order."""
+    path = str(tmp_path / "capture.bin")
+    _write_capture(
+        path, [(CaptureDirection.TX, b"\x09"), (CaptureDirection.RX, b"abc")]
+    )
+    # Captures are appended to in a new session
+    _write_capture(path, [(CaptureDirection.RX, b"")])
+    records = list(read_capture(path))
+    assert [(record.direction, record.data) for record in records] == [
+        (CaptureDirection.SESSION, b""),
+        (CaptureDirection.TX, b"\x09"),
+        (CaptureDirection.RX, b"abc"),
+        (CaptureDirection.SESSION, b""),
+        (CaptureDirection.RX, b""),
+    ]
+    assert records[1].timestamp <= records[2].timestamp
+    assert open(path, "rb").read().count(CAPTURE_MAGIC) == 1
+
+    # Truncated record at the end of the file
+    with open(path, "ab") as capture:
+        capture.write(b"\x00\x01")
+    assert len(list(read_capture(path))) == 5
+
+    invalid = tmp_path / "invalid.bin"
+    invalid.write_bytes(b"invalid")
+    with pytest.raises(ValueError):
+        list(read_capture(str(invalid)))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("speed,duration", [(0, 0), (10, 0.05)])
+async def test_replay_interface(tmp_path, speed, duration):
+    """Check received chunks are replayed at the requested speed."""
+    path = str(tmp_path / "capture.bin")
+    with open(path, "wb") as capture:
+        capture.write(CAPTURE_MAGIC)
+    records = [
+        CaptureRecord(0.0, CaptureDirection.RX, b"a"),
+        CaptureRecord(0.2, CaptureDirection.TX, b"b"),
+        CaptureRecord(0.5, CaptureDirection.RX, b"c"),
+    ]
+    with open(path, "ab") as capture:
+        for record in records:
+            capture.write(
+                CAPTURE_RECORD_HEADER.pack(
+                    record.timestamp, record.direction, len(record.data)
+                )
+                + record.data
+            )
+    received = []
+    start = time.monotonic()
+    replay = ReplayInterface(path, received.append, speed=speed)
+    assert await replay.write(b"ignored") == 7
+    await replay.closed
+    assert time.monotonic() - start >= duration
+    assert received == [b"a", b"c"]
+    assert replay.chunks_replayed == 2
+
+
+@pytest.mark.asyncio
+async def test_replay_sessions(tmp_path):
+    """Check the replay pace restarts with each session of a capture."""
+    path = str(tmp_path / "capture.bin")
+    with open(path, "wb") as capture:
+        capture.write(CAPTURE_MAGIC)
+        for timestamp, direction, data in (
+            (0.0, CaptureDirection.SESSION, b""),
+            (0.3, CaptureDirection.RX, b"a"),
+            (0.0, CaptureDirection.SESSION, b""),
+            (0.2, CaptureDirection.RX, b"b"),
+        ):
+            capture.write(CAPTURE_RECORD_HEADER.pack(timestamp, direction, len(data)))
+            capture.write(data)
+    received = []
+    start = time.monotonic()
+    replay = ReplayInterface(path, received.append, speed=10)
+    await replay.closed
+    assert time.monotonic() - start >= 0.05
+    assert received == [b"a", b"b"]
+
+
+@pytest.mark.asyncio
+async def test_replay_invalid_capture(tmp_path):
+    """Check replaying an invalid file closes the interface with an error."""
+    path = tmp_path / "invalid.bin"
+    path.write_bytes(b"invalid")
+    replay = ReplayInterface(str(path), lambda _: None)
+    with pytest.raises(ValueError):
+        await replay.closed
+    replay = ReplayInterface(str(path), lambda _: None)
+    replay.close()
+    await replay.closed
+
+
+@pytest.mark.asyncio
+async def test_controller_capture_replay(tmp_path):
+    """Check a capture of a gateway is replayed to the controller."""
+    payload = ProtocolPayload(
+        ProtocolHeader(0, 0x1234, 0, 0, PROTOCOL_VERSION),
+        PayloadType.ADVERTISEMENT,
+        Advertisement(),
+    )
+    source = str(tmp_path / "source.bin")
+    _write_capture(
+        source,
+        [
+            (
+                CaptureDirection.RX,
+                bytes([PROTOCOL_VERSION]) + hdlc_encode(payload.to_bytes()),
+            )
+        ],
+    )
+    capture = str(tmp_path / "capture.bin")
+    settings = ControllerSettings(
+        source,
+        115200,
+        "0",
+        "456",
+        "78",
+        handshake=True,
+        serial_transport="replay",
+        capture=capture,
+        replay_speed=0,
+    )
+    controller = ControllerTest(settings)
+    await asyncio.wait_for(controller._start_serial(), timeout=1)
+    assert "0000000000001234" in controller.dotbots
+    # The replayed session is captured as well
+    assert [record.direction for record in read_capture(capture)] == [
+        CaptureDirection.SESSION,
+        CaptureDirection.TX,
+        CaptureDirection.RX,
+    ]
@@ -1,10 +1,14 @@
 """Test module for controller base class."""
 
+import asyncio
+import os
+import sys
 import time
 
+from concurrent.futures import Future
 from dataclasses import dataclass
 from typing import List
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import pytest
 import serial
@@ -18,9 +22,21 @@ from dotbot.controller import (
     controller_factory,
     register_controller,
 )
-from dotbot.hdlc import hdlc_encode
-from dotbot.models import DotBotModel, DotBotLH2Position, DotBotGPSPosition
+from dotbot.hdlc import hdlc_decode, hdlc_encode, hdlc_encode_many
+from dotbot.models import (
+    DotBotModel,
+    DotBotLH2Position,
+    DotBotGPSPosition,
+    DotBotGatewayModel,
+    DotBotNotificationCommand,
+    DotBotNotificationModel,
+)
 from dotbot.protocol import (
+    Advertisement,
+    CommandMoveRaw,
+    CommandRgbLed,
+    ControlMode,
+    ControlModeType,
     ProtocolField,
     ProtocolPayload,
     ProtocolData,
@@ -29,6 +45,7 @@ from dotbot.protocol import (
     PayloadType,
     ApplicationType,
 )
+from dotbot.scheduler import TransmitScheduler
 
 
 @dataclass
@@ -118,6 +135,292 @@ async def test_controller_dont_send(_, __, serial_write):
     assert serial_write.call_count == 0
 
 
+@pytest.mark.asyncio
+@patch("dotbot.serial_interface.serial.Serial.write")
+@patch("dotbot.serial_interface.serial.Serial.open")
+@patch("dotbot.serial_interface.serial.Serial.flush")
+async def test_controller_send_payloads(_, __, serial_write):
+    """Check several payloads are sent with a single write to serial."""
+    settings = ControllerSettings("/dev/null", "115200", "0", "456", "78")
+    controller = ControllerTest(settings)
+    for address in ("0000000000000001", "0000000000000002"):
+        controller.dotbots.update(
+            {address: DotBotModel(address=address, last_seen=time.time())}
+        )
+    controller.serial = serial.Serial(settings.port, settings.baudrate)
+    payloads = [
+        ProtocolPayload(
+            ProtocolHeader(destination, 0, 0, 0, 0),
+            PayloadType.CMD_MOVE_RAW,
+            ProtocolDataTest(),
+        )
+        for destination in (1, 123, 2)
+    ]
+    controller.send_payloads(payloads)
+    assert serial_write.call_count == 1
+    assert serial_write.call_args_list[0].args[0] == hdlc_encode_many(
+        [payloads[0].to_bytes(), payloads[2].to_bytes()]
+    )
+    controller.send_payloads(payloads[1:2])
+    assert serial_write.call_count == 1
+
+
+class FakeSerial:
+    """Serial interface whose writes complete when the test decides."""
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self, bytes_):
+        self.writes.append((bytes_, Future()))
+        return self.writes[-1][1]
+
+
+def test_controller_coalesce_payloads():
+    """Check superseded move commands are dropped while a write is pending."""
+    settings = ControllerSettings("/dev/null", "115200", "0", "456", "78")
+    controller = ControllerTest(settings)
+    address = "0000000000000001"
+    controller.dotbots.update(
+        {address: DotBotModel(address=address, last_seen=time.time())}
+    )
+    controller.serial = FakeSerial()
+    moves = [
+        ProtocolPayload(
+            ProtocolHeader(1, 0, 0, 0, 0),
+            PayloadType.CMD_MOVE_RAW,
+            CommandMoveRaw(0, speed, 0, speed),
+        )
+        for speed in (10, 20, 30)
+    ]
+    mode = ProtocolPayload(
+        ProtocolHeader(1, 0, 0, 0, 0),
+        PayloadType.CONTROL_MODE,
+        ControlMode(ControlModeType.AUTO),
+    )
+    first = controller.send_payload(moves[0])
+    assert len(controller.serial.writes) == 1
+    second = controller.send_payload(moves[1])
+    controller.send_payload(mode)
+    third = controller.send_payload(moves[2])
+    # Still waiting for the first write to complete
+    assert len(controller.serial.writes) == 1
+    assert second is third
+    assert not first.done()
+    controller.serial.writes[0][1].set_result(4)
+    assert first.result() == 4
+    assert len(controller.serial.writes) == 2
+    assert controller.serial.writes[1][0] == hdlc_encode_many(
+        [mode.to_bytes(), moves[2].to_bytes()]
+    )
+    controller.serial.writes[1][1].set_result(12)
+    assert third.result() == 12
+    assert controller.transmit_statistics.coalesced == 1
+
+
+@pytest.mark.asyncio
+@patch("dotbot.serial_interface.serial.Serial.write")
+@patch("dotbot.serial_interface.serial.Serial.open")
+async def test_controller_frame_rate(_, serial_write):
+    """Check payloads exceeding the airtime budget are sent later."""
+    settings = ControllerSettings(
+        "/dev/null", "115200", "0", "456", "78", frame_rate=20
+    )
+    controller = ControllerTest(settings)
+    controller.gateways[0].tx_scheduler = TransmitScheduler(frame_rate=20, burst=1)
+    address = "0000000000000001"
+    controller.dotbots.update(
+        {address: DotBotModel(address=address, last_seen=time.time())}
+    )
+    controller.serial = serial.Serial(settings.port, settings.baudrate)
+    mode = ProtocolPayload(
+        ProtocolHeader(1, 0, 0, 0, 0),
+        PayloadType.CONTROL_MODE,
+        ControlMode(ControlModeType.AUTO),
+    )
+    first = controller.send_payload(mode)
+    second = controller.send_payload(mode)
+    assert first.done() and not second.done()
+    assert serial_write.call_count == 1
+    await asyncio.wait_for(asyncio.wrap_future(second), timeout=1)
+    assert serial_write.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_controller_multiple_gateways():
+    """Check payloads are routed through the gateway that last heard the bot."""
+    settings = ControllerSettings(["/dev/gw0", "/dev/gw1"], "115200", "0", "456", "78")
+    controller = ControllerTest(settings)
+    assert [gateway.port for gateway in controller.gateways] == settings.port
+    for gateway in controller.gateways:
+        gateway.serial = FakeSerial()
+    advertisement = ProtocolPayload(
+        ProtocolHeader(0, 0x2, 0, 0, PROTOCOL_VERSION),
+        PayloadType.ADVERTISEMENT,
+        Advertisement(),
+    )
+    controller.handle_byte(
+        hdlc_encode(advertisement.to_bytes()), gateway=controller.gateways[1]
+    )
+    assert "0000000000000002" in controller.dotbots
+    assert controller.routes["0000000000000002"] is controller.gateways[1]
+    assert controller.hdlc_statistics.frames_ok == 1
+    mode = ProtocolPayload(
+        ProtocolHeader(2, 0, 0, 0, 0),
+        PayloadType.CONTROL_MODE,
+        ControlMode(ControlModeType.AUTO),
+    )
+    controller.send_payload(mode)
+    assert controller.gateways[0].serial.writes == []
+    assert len(controller.gateways[1].serial.writes) == 1
+
+    # The bot moved to the area covered by the first gateway
+    controller.handle_byte(
+        hdlc_encode(advertisement.to_bytes()), gateway=controller.gateways[0]
+    )
+    controller.send_payload(mode)
+    assert len(controller.gateways[0].serial.writes) == 1
+    assert controller.hdlc_statistics.frames_ok == 2
+
+
+def test_controller_drops_frames_before_decoding():
+    """Check command echoes and frames from the gateway are not decoded."""
+    settings = ControllerSettings("/dev/null", "115200", "0", "456", "78")
+    controller = ControllerTest(settings)
+    echo = ProtocolPayload(
+        ProtocolHeader(0, 0x2, 0, 0, PROTOCOL_VERSION),
+        PayloadType.CMD_MOVE_RAW,
+        CommandMoveRaw(0, 66, 0, 66),
+    )
+    from_gateway = ProtocolPayload(
+        ProtocolHeader(0, 0, 0, 0, PROTOCOL_VERSION),
+        PayloadType.ADVERTISEMENT,
+        Advertisement(),
+    )
+    with patch.object(controller, "handle_received_payload") as handle_received:
+        with patch("dotbot.protocol.ProtocolHeader.unpack_from") as unpack_header:
+            controller.handle_byte(
+                hdlc_encode_many([echo.to_bytes(), from_gateway.to_bytes()])
+            )
+    handle_received.assert_not_called()
+    unpack_header.assert_not_called()
+    assert controller.routes["0000000000000002"] is controller.gateways[0]
+    assert controller.hdlc_statistics.frames_ok == 2
+
+
+@pytest.mark.asyncio
+async def test_controller_send_request():
+    """Check requests are stamped with a msg_id and resolved by their echo."""
+    settings = ControllerSettings("/dev/null", "115200", "0", "456", "78")
+    controller = ControllerTest(settings)
+    controller.dotbots["0000000000000001"] = DotBotModel(
+        address="0000000000000001", last_seen=time.time()
+    )
+    controller.serial = MagicMock()
+    header = controller.headers.get("0000000000000001")
+    futures = [
+        controller.send_request(
+            ProtocolPayload(
+                header, PayloadType.CONTROL_MODE, ControlMode(ControlModeType.AUTO)
+            )
+        )
+        for _ in range(2)
+    ]
+    # Payloads sent without send_request are not tracked
+    controller.send_payload(
+        ProtocolPayload(header, PayloadType.CMD_RGB_LED, CommandRgbLed(1, 2, 3))
+    )
+    # The cached header is not modified
+    assert header.msg_id == 0
+    sent = [
+        ProtocolPayload.from_bytes(hdlc_decode(call.args[0]))
+        for call in controller.serial.write.call_args_list
+    ]
+    assert [payload.header.msg_id for payload in sent] == [1, 2, 3]
+    assert len(controller.tracker) == 2
+    # Unknown destination
+    payload = ProtocolPayload(
+        controller.headers.get("0000000000000002"),
+        PayloadType.CONTROL_MODE,
+        ControlMode(ControlModeType.AUTO),
+    )
+    assert controller.send_request(payload) is None
+    # A dotbot frame with the same msg_id is not a reply
+    advertisement = ProtocolPayload(
+        ProtocolHeader(0, 1, 0, 0, PROTOCOL_VERSION, msg_id=1),
+        PayloadType.ADVERTISEMENT,
+        Advertisement(),
+    )
+    controller.handle_byte(hdlc_encode(advertisement.to_bytes()))
+    # The echo of the second request is received from the gateway
+    controller.handle_byte(hdlc_encode(sent[1].to_bytes()))
+    assert not futures[0].done()
+    assert futures[1].result() >= 0
+    statistics = controller.link_statistics["0000000000000001"]
+    assert (statistics.sent, statistics.acknowledged) == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_controller_gateway_link_change():
+    """Check clients are notified when the link with a gateway changes."""
+    settings = ControllerSettings("/dev/gw0", "115200", "0", "456", "78")
+    controller = ControllerTest(settings)
+    assert controller.get_gateways() == [
+        DotBotGatewayModel(port="/dev/gw0", connected=False)
+    ]
+    with patch.object(controller, "notify_clients") as notify:
+        controller.gateways[0].connected = True
+        controller._on_gateway_link_change(controller.gateways[0])
+        await asyncio.sleep(0)
+    assert notify.call_args.args[0] == DotBotNotificationModel(
+        cmd=DotBotNotificationCommand.GATEWAY,
+        data=DotBotGatewayModel(port="/dev/gw0", connected=True),
+    )
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires a POSIX system")
+@pytest.mark.asyncio
+@pytest.mark.parametrize("transport", ["thread", "asyncio"])
+async def test_controller_serial_handshake(transport):
+    """Check the handshake and reception of payloads on a pseudo terminal."""
+    master, slave = os.openpty()
+    settings = ControllerSettings(
+        os.ttyname(slave),
+        115200,
+        "0",
+        "456",
+        "78",
+        handshake=True,
+        serial_transport=transport,
+    )
+    controller = ControllerTest(settings)
+    payload = ProtocolPayload(
+        ProtocolHeader(0, 0x1234, 0, 0, PROTOCOL_VERSION),
+        PayloadType.ADVERTISEMENT,
+        Advertisement(),
+    )
+    os.set_blocking(master, False)
+
+    async def _read_master():
+        while 1:
+            try:
+                return os.read(master, 1)
+            except BlockingIOError:
+                await asyncio.sleep(0.01)
+
+    with patch.object(controller, "handle_received_payload") as handle_received:
+        task = asyncio.create_task(controller._start_serial())
+        assert await _read_master() == bytes([PROTOCOL_VERSION])
+        os.write(master, bytes([PROTOCOL_VERSION]) + hdlc_encode(payload.to_bytes()))
+        while not handle_received.called:
+            await asyncio.sleep(0.01)
+    assert handle_received.call_args.args[0] == payload
+    controller.serial.close()
+    await task
+    os.close(master)
+    os.close(slave)
+
+
 @patch("dotbot.serial_interface.serial.Serial.open")
 def test_controller_factory(_):
     settings = ControllerSettings("/dev/null", "115200", "123", "456", "78")
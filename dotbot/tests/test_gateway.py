@@ -0,0 +1,152 @@
+"""Test module for the serial gateway."""
+
+import asyncio
+import threading
+
+from concurrent.futures import Future
+from unittest.mock import patch
+
+import pytest
+import serial
+
+from dotbot.gateway import Gateway
+from dotbot.hdlc import HDLCState
+from dotbot.protocol import PROTOCOL_VERSION
+from dotbot.serial_interface import SerialInterfaceException
+
+
+class FakeSerialInterface:
+    """Serial interface closed when the test decides."""
+
+    def __init__(self, *_):
+        self.closed = Future()
+        self.written = []
+
+    def write(self, bytes_):
+        self.written.append(bytes_)
+        future = Future()
+        future.set_result(len(bytes_))
+        return future
+
+    def close(self):
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+
+class FakeSerialPort:
+    """pyserial port with nothing to read."""
+
+    in_waiting = 0
+
+    def __init__(self, *_, **__):
+        self._closed = threading.Event()
+
+    def read(self, _):
+        if self._closed.wait(0.01):
+            raise serial.SerialException("Port closed")
+        return b""
+
+    def write(self, bytes_):
+        return len(bytes_)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._closed.set()
+
+
+async def _wait_for(predicate):
+    while not predicate():
+        await asyncio.sleep(0.001)
+
+
+@pytest.mark.asyncio
+@patch("dotbot.gateway.RECONNECT_DELAY_MIN", 0.001)
+async def test_gateway_reconnect():
+    """Check the serial port is reopened when the link is lost."""
+    interfaces = [FakeSerialInterface(), FakeSerialInterface()]
+    links = []
+    gateway = Gateway("/dev/fake", 115200)
+    with patch(
+        "dotbot.gateway.SerialInterface",
+        side_effect=[
+            interfaces[0],
+            serial.SerialException("Device not found"),
+            interfaces[1],
+        ],
+    ):
+        task = asyncio.create_task(
+            gateway.run(
+                lambda _: None,
+                on_link_change=lambda gw: links.append(gw.connected),
+            )
+        )
+        await _wait_for(lambda: gateway.connected)
+        assert links == [True]
+        gateway.hdlc_handler.feed(b"\x7e\x01\x02")
+        interfaces[0].closed.set_exception(SerialInterfaceException("USB reset"))
+        await _wait_for(lambda: gateway.serial is interfaces[1] and gateway.connected)
+        assert links == [True, False, True]
+        assert gateway.link_ups == 2
+        # The partial frame received before the link was lost is dropped
+        assert gateway.hdlc_handler.state == HDLCState.IDLE
+        assert interfaces[1].written == [bytes([PROTOCOL_VERSION])]
+        gateway.serial.close()
+        await asyncio.wait_for(task, timeout=1)
+    assert links == [True, False, True, False]
+
+
+@pytest.mark.asyncio
+@patch("dotbot.gateway.RECONNECT_DELAY_MIN", 0.001)
+@patch("dotbot.serial_interface.serial.Serial", FakeSerialPort)
+async def test_gateway_reconnect_threads():
+    """Check the threads of the serial interface stop when the link is lost."""
+    threads = threading.active_count()
+    gateway = Gateway("/dev/fake", 115200)
+    task = asyncio.create_task(gateway.run(lambda _: None))
+    for link_ups in range(1, 4):
+        await _wait_for(lambda: gateway.connected and gateway.link_ups == link_ups)
+        gateway.serial.closed.set_exception(SerialInterfaceException("USB reset"))
+        await _wait_for(lambda: not gateway.connected)
+    await _wait_for(lambda: gateway.connected)
+    gateway.serial.close()
+    await asyncio.wait_for(task, timeout=1)
+    await asyncio.wait_for(
+        _wait_for(lambda: threading.active_count() == threads), timeout=1
+    )
+
+
+@pytest.mark.asyncio
+async def test_gateway_run_error_on_startup():
+    """Check errors are raised if the link was never established."""
+    gateway = Gateway("/dev/fake", 115200)
+    with patch(
+        "dotbot.gateway.SerialInterface",
+        side_effect=serial.SerialException("Device not found"),
+    ):
+        with pytest.raises(serial.SerialException):
+            await gateway.run(lambda _: None)
+    assert gateway.connected is False
+
+
+@pytest.mark.asyncio
+async def test_gateway_tcp():
+    """Check the handshake with a gateway bridged on a TCP socket."""
+    received = []
+
+    async def on_client(reader, writer):
+        assert await reader.readexactly(1) == bytes([PROTOCOL_VERSION])
+        writer.write(bytes([PROTOCOL_VERSION]) + b"~test~")
+
+    server = await asyncio.start_server(on_client, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    gateway = Gateway(f"tcp://127.0.0.1:{port}", 0)
+    task = asyncio.create_task(gateway.run(received.append, handshake=True))
+    await _wait_for(lambda: received)
+    assert gateway.connected is True
+    assert b"".join(received) == b"~test~"
+    gateway.serial.close()
+    await asyncio.wait_for(task, timeout=1)
+    server.close()
+    await server.wait_closed()
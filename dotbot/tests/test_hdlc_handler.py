@@ -1,8 +1,17 @@
 """Test module for HDLC handler class."""
 
+import random
+
 import pytest
 
-from dotbot.hdlc import HDLCDecodeException, HDLCState, HDLCHandler
+from dotbot import hdlc
+from dotbot.hdlc import (
+    HDLCDecodeException,
+    HDLCState,
+    HDLCHandler,
+    HDLCStatistics,
+    hdlc_encode,
+)
 
 
 def test_hdlc_handler_states():
@@ -74,3 +83,175 @@ def test_hdlc_handler_payload_too_short():
         handler.handle_byte(int(byte).to_bytes(1, "little"))
     payload = handler.payload
     assert payload == bytearray()
+
+
+def test_hdlc_handler_feed():
+    handler = HDLCHandler()
+    assert handler.feed(b"garbage~test\x88\x07~") == [b"test"]
+    assert handler.state == HDLCState.IDLE
+    assert handler.feed(b"~~test\x88\x07~~}^test}]\x06\x94~") == [
+        b"test",
+        b"~test}",
+    ]
+    assert handler.feed(b"") == []
+
+
+def test_hdlc_handler_feed_partial():
+    handler = HDLCHandler()
+    payloads = []
+    for chunk in (b"~te", b"st\x88", b"\x07~~}", b"^test}", b"]\x06\x94", b"~"):
+        # payloads are only valid until the next call to feed
+        payloads += [bytes(payload) for payload in handler.feed(chunk)]
+    assert payloads == [b"test", b"~test}"]
+
+
+def test_hdlc_handler_feed_zero_copy():
+    handler = HDLCHandler()
+    payloads = handler.feed(b"~test\x88\x07~~}^test}]\x06\x94~")
+    assert all(isinstance(payload, memoryview) for payload in payloads)
+    assert payloads[0].obj is payloads[1].obj
+    buffer = payloads[0].obj
+    assert handler.feed(b"~test\x88\x07~")[0].obj is buffer
+
+
+def test_hdlc_handler_feed_large_frames():
+    handler = HDLCHandler()
+    data = bytes(range(250)) * 8
+    payloads = handler.feed(hdlc_encode(data) + hdlc_encode(data[::-1]))
+    assert payloads == [data, data[::-1]]
+
+
+def test_hdlc_handler_frame_too_large():
+    handler = HDLCHandler(max_frame_size=8)
+    assert handler.feed(b"~0123456789~test\x88\x07~") == [b"test"]
+    assert handler.feed(b"~0123456789") == []
+    assert handler.state == HDLCState.IDLE
+    assert handler.feed(b"~test\x88\x07~") == [b"test"]
+    for byte in b"~0123456789~test\x88\x07~":
+        handler.handle_byte(int(byte).to_bytes(1, "little"))
+    assert handler.payload == b"test"
+
+
+def test_hdlc_handler_abort():
+    handler = HDLCHandler()
+    assert handler.feed(b"~garbage}~test\x88\x07~") == [b"test"]
+    assert handler.feed(b"~garbage}") == []
+    assert handler.feed(b"~test\x88\x07~") == [b"test"]
+    for byte in b"~garbage}~test\x88\x07~":
+        handler.handle_byte(int(byte).to_bytes(1, "little"))
+    assert handler.payload == b"test"
+
+
+def test_hdlc_handler_statistics():
+    handler = HDLCHandler(max_frame_size=8)
+    handler.feed(b"xx~test\x88\x07~y~test\x42\x42~~a~~0123456789~~bad}~")
+    assert handler.statistics == HDLCStatistics(
+        bytes_received=40,
+        bytes_discarded=3,
+        frames_ok=1,
+        fcs_errors=1,
+        short_frames=1,
+        oversize_frames=1,
+        aborted_frames=1,
+    )
+    handler.reset()
+    for byte in b"z~test\x88\x07~":
+        handler.handle_byte(int(byte).to_bytes(1, "little"))
+    _ = handler.payload
+    assert handler.statistics.bytes_received == 49
+    assert handler.statistics.bytes_discarded == 4
+    assert handler.statistics.frames_ok == 2
+
+
+def test_hdlc_handler_reset():
+    handler = HDLCHandler()
+    assert handler.feed(b"~tes") == []
+    handler.reset()
+    assert handler.state == HDLCState.IDLE
+    assert handler.output == bytearray()
+    assert handler.feed(b"t\x88\x07~") == []
+    assert handler.feed(b"test\x88\x07~") == [b"test"]
+
+
+def test_hdlc_handler_feed_invalid_frames():
+    handler = HDLCHandler()
+    assert handler.feed(b"~test\x42\x42~~a~~test\x88\x07~") == [b"test"]
+
+
+def test_hdlc_handler_feed_unknown_escape():
+    handler = HDLCHandler()
+    assert handler.feed(b"~}\x03" + hdlc_encode(b"test")) == [b"test"]
+    assert handler.statistics.fcs_errors == 0
+    # Escape sequence split between two chunks
+    frame = hdlc_encode(b"~test}")
+    assert handler.feed(frame[:2]) == []
+    assert handler.feed(frame[2:]) == [b"~test}"]
+    frame = hdlc_encode(b"~test")
+    assert handler.feed(frame[:2]) == []
+    assert handler.feed(b"}" + frame[2:7] + b"}\x03" + frame[7:]) == [b"~test"]
+
+
+def test_hdlc_handler_feed_matches_handle_byte():
+    """Check the payloads found by feed don't depend on the chunk boundaries."""
+    rng = random.Random(42)
+    payloads = [b"test", b"~test}", b"}}~~", b"", b"\x7d\x5e\x5d" * 20]
+    for _ in range(200):
+        stream = bytearray()
+        for _ in range(rng.randint(1, 8)):
+            if rng.random() < 0.7:
+                frame = hdlc_encode(rng.choice(payloads))
+                if rng.random() < 0.3:
+                    # Repeated escape bytes, only the last one is used
+                    frame = frame.replace(b"}", b"}}")
+                stream += frame
+            else:
+                # Noise rich in flag and escape bytes
+                stream += bytes(rng.choice(b"~}^]\x03a") for _ in range(5))
+        expected = []
+        handler = HDLCHandler(max_frame_size=64)
+        for byte in stream:
+            handler.handle_byte(int(byte).to_bytes(1, "little"))
+            if handler.state == HDLCState.READY:
+                payload = handler.payload
+                if payload:
+                    expected.append(bytes(payload))
+        received = []
+        handler = HDLCHandler(max_frame_size=64)
+        pos = 0
+        while pos < len(stream):
+            size = rng.randint(1, 16)
+            received += [bytes(p) for p in handler.feed(stream[pos : pos + size])]
+            pos += size
+        assert received == expected, stream
+
+
+@pytest.mark.skipif(hdlc.HDLC_LIB is None, reason="native HDLC library not built")
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"test",
+        b"~test}",
+        b"}^}]",
+        b"\x7e\x7d\x5e\x5d" * 16,
+        bytes(range(256)),
+        b"}\x03",
+        b"a}}^b}",
+    ],
+)
+def test_hdlc_native_matches_python(data):
+    assert hdlc._fcs_compute_native(
+        hdlc.HDLC_FCS_INIT, data
+    ) == hdlc._fcs_compute_python(hdlc.HDLC_FCS_INIT, data)
+    escaped = hdlc._escape_native(data)
+    assert escaped == hdlc._escape_python(data)
+    assert hdlc._unescape_native(escaped) == hdlc._unescape_python(escaped) == data
+    assert hdlc._unescape_native(data) == hdlc._unescape_python(data)
+
+
+def test_hdlc_decode_unknown_escape():
+    """Check unknown escape sequences are dropped from decoded frames."""
+    with pytest.raises(HDLCDecodeException, match="Invalid payload"):
+        hdlc.hdlc_decode(b"~}\x03~")
+    frame = hdlc_encode(b"test")
+    assert hdlc.hdlc_decode(frame[:3] + b"}\x03" + frame[3:]) == b"test"
@@ -0,0 +1,34 @@
+"""Test module for the keyboard controller."""
+
+from unittest.mock import patch
+
+import pytest
+
+from dotbot.controller import ControllerSettings
+from dotbot.keyboard import KeyboardController, keyboard
+from dotbot.protocol import CommandMoveRaw, PayloadType
+
+
+@pytest.mark.parametrize(
+    "keys,speeds",
+    [
+        ([keyboard.Key.up], (84, 84)),
+        ([keyboard.Key.up, keyboard.Key.left], (63, 84)),
+        ([keyboard.Key.up, keyboard.Key.right], (84, 63)),
+        ([keyboard.Key.down, keyboard.Key.left], (-63, -84)),
+        ([keyboard.Key.down, keyboard.Key.right, keyboard.Key.ctrl], (-100, -75)),
+    ],
+)
+def test_keyboard_refresh_speeds(keys, speeds):
+    """Check the move commands sent for the keys pressed can be encoded."""
+    settings = ControllerSettings("/dev/null", "115200", "0", "456", "78")
+    controller = KeyboardController(settings)
+    controller.init()
+    controller.active_keys = keys
+    with patch.object(controller, "send_payload") as send_payload:
+        controller.refresh_speeds()
+    payload = send_payload.call_args.args[0]
+    assert payload.payload_type == PayloadType.CMD_MOVE_RAW
+    assert payload.values == CommandMoveRaw(0, speeds[0], 0, speeds[1])
+    # Speeds must be integers to be packed
+    assert payload.to_bytes()
@@ -17,8 +17,10 @@ Options:
   -t, --type [joystick|keyboard]  Type of your controller. Defaults to
                                   'keyboard'
   -p, --port TEXT                 Linux users: path to port in '/dev' folder ;
-                                  Windows users: COM port. Defaults to
-                                  '/dev/ttyACM0'
+                                  Windows users: COM port ; tcp://host:port or
+                                  unix:///path for a gateway bridged on a
+                                  socket. Repeat the option to attach several
+                                  gateways. Defaults to '/dev/ttyACM0'
   -b, --baudrate INTEGER          Serial baudrate. Defaults to 1000000
   -d, --dotbot-address TEXT       Address in hex of the DotBot to control.
                                   Defaults to FFFFFFFFFFFFFFFF
@@ -32,6 +34,17 @@ Options:
   --log-level [debug|info|warning|error]
                                   Logging level. Defaults to info
   --log-output PATH               Filename where logs are redirected
+  --serial-transport [thread|asyncio|replay]
+                                  Serial transport implementation, 'asyncio'
+                                  requires a POSIX system, 'replay' replays the
+                                  capture file given as port. Defaults to
+                                  'thread'
+  --capture FILE                  Append the bytes received and sent on serial
+                                  to this capture file
+  --replay-speed FLOAT            Speed factor of the 'replay' transport, 0
+                                  replays as fast as possible. Defaults to 1
+  --frame-rate FLOAT              Maximum number of frames per second sent to
+                                  each gateway, 0 means no limit. Defaults to 0
   --handshake                     Perform a basic handshake with the gateway
                                   board on startup
   --help                          Show this message and exit.
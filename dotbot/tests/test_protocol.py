@@ -1,9 +1,27 @@
+import dataclasses
+import sys
+
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
 import pytest
 
 
+from dotbot.hdlc import HDLCHandler, hdlc_encode
 from dotbot.protocol import (
     PROTOCOL_VERSION,
     PayloadType,
+    ApplicationType,
+    PAYLOAD_TYPES,
+    VALUES_DTYPES,
+    frames_to_array,
+    CachedHeader,
+    CustomPayloadType,
+    HeaderCache,
+    ProtocolData,
+    ProtocolFrame,
+    ProtocolField,
     ProtocolPayload,
     ProtocolPayloadParserException,
     ProtocolHeader,
@@ -20,6 +38,10 @@ from dotbot.protocol import (
     ControlModeType,
     LH2Waypoints,
     GPSWaypoints,
+    GPSWaypointsFragment,
+    LH2WaypointsFragment,
+    PAYLOAD_MAX_LENGTH,
+    register_payload_type,
 )
 
 
@@ -186,7 +208,10 @@ from dotbot.protocol import (
                     0,
                 ),
                 PayloadType.LH2_WAYPOINTS,
-                LH2Waypoints(threshold=0, waypoints=[]),
+                LH2Waypoints(
+                    threshold=10,
+                    waypoints=[LH2Location(1000, 1000, 2), LH2Location(1000, 1000, 2)],
+                ),
             ),
             id="LH2Waypoints",
         ),
@@ -203,7 +228,13 @@ from dotbot.protocol import (
                     0,
                 ),
                 PayloadType.GPS_WAYPOINTS,
-                GPSWaypoints(threshold=0, waypoints=[]),
+                GPSWaypoints(
+                    threshold=10,
+                    waypoints=[
+                        GPSPosition(48856614, 2352221),
+                        GPSPosition(48856614, 2352221),
+                    ],
+                ),
             ),
             id="GPSWaypoints",
         ),
@@ -226,12 +257,12 @@ from dotbot.protocol import (
         ),
         pytest.param(
             b"\x11\x22\x22\x11\x11\x11\x11\x11\x12\x12\x12\x12\x12\x12\x12\x12\x00\x00\x00\x08\x00\x00\x00\x00\xff",
-            ValueError("255 is not a valid PayloadType"),
+            ProtocolPayloadParserException("Unsupported payload type '255'"),
             id="invalid payload",
         ),
         pytest.param(
-            b"\x11\x22\x22\x11\x11\x11\x11\x11\x12\x12\x12\x12\x12\x12\x12\x12\x00\x00\x00\x08\x00\x00\x00\x00\x0b",
-            ProtocolPayloadParserException("Unsupported payload type '11'"),
+            b"\x11\x22\x22\x11\x11\x11\x11\x11\x12\x12\x12\x12\x12\x12\x12\x12\x00\x00\x00\x08\x00\x00\x00\x00\x0d",
+            ProtocolPayloadParserException("Unsupported payload type '13'"),
             id="unsupported payload type",
         ),
         pytest.param(
@@ -260,6 +291,7 @@ def test_protocol_parser(payload, expected):
         assert protocol.header == expected.header
         assert protocol.payload_type == expected.payload_type
         assert protocol.values == expected.values
+        assert ProtocolPayload.from_bytes(memoryview(payload)) == protocol
 
 
 @pytest.mark.parametrize(
@@ -655,3 +687,473 @@ def test_payload_repr(payload, string, capsys):
     print(payload)
     out, _ = capsys.readouterr()
     assert out == string
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        CommandMoveRaw(-10, 127, -128, 0),
+        CommandRgbLed(255, 0, 128),
+        Lh2RawData(
+            [
+                Lh2RawLocation(0x123456789ABCDEF1, 0x01, -2),
+                Lh2RawLocation(0x0FEDCBA987654321, 0x02, 3),
+            ]
+        ),
+        LH2Location(500000, 250000, 0),
+        Advertisement(),
+        GPSPosition(-48856614, 2352221),
+        DotBotData(
+            direction=-45,
+            locations=[
+                Lh2RawLocation(0x123456789ABCDEF1, 0x01, -2),
+                Lh2RawLocation(0x0FEDCBA987654321, 0x02, 3),
+            ],
+        ),
+        SailBotData(direction=359, latitude=-48856614, longitude=2352221),
+        ControlMode(ControlModeType.AUTO),
+    ],
+)
+def test_data_struct_round_trip(values):
+    packed = values.to_bytes()
+    assert len(packed) == values.size == sum(field.length for field in values.fields)
+    assert values.from_bytes(packed) == values
+    # Unpacking at an offset gives the same result
+    assert values.unpack_from(b"\x00\x00" + packed, 2) == values
+
+
+def test_waypoints_packed_with_repeated_structs():
+    waypoints = LH2Waypoints(
+        threshold=10, waypoints=[LH2Location(1, 2, 3), LH2Location(4, 5, 6)]
+    )
+    assert waypoints.size == 2 + 2 * 12
+    assert waypoints.to_bytes() == (
+        b"\x02\x0a"
+        b"\x01\x00\x00\x00\x02\x00\x00\x00\x03\x00\x00\x00"
+        b"\x04\x00\x00\x00\x05\x00\x00\x00\x06\x00\x00\x00"
+    )
+    waypoints = GPSWaypoints(threshold=5, waypoints=[GPSPosition(-1, 1)])
+    assert waypoints.to_bytes() == b"\x01\x05\xff\xff\xff\xff\x01\x00\x00\x00"
+
+
+@dataclass
+class CustomData(ProtocolData):
+    """Data class without struct layout."""
+
+    value: int = 0
+
+    @property
+    def fields(self) -> List[ProtocolField]:
+        return [ProtocolField(self.value, "value", 2, signed=True)]
+
+
+def test_data_without_struct_packed_from_fields():
+    payload = ProtocolPayload(
+        ProtocolHeader(0x1122334455667788, 0x1222122212221221, 0x1442, 0, 1, 0),
+        PayloadType.CMD_MOVE_RAW,
+        CustomData(-2),
+    )
+    assert payload.to_bytes() == payload.to_bytes(endian="little")
+    assert payload.to_bytes()[25:] == b"\xfe\xff"
+    assert payload.to_bytes(endian="big")[25:] == b"\xff\xfe"
+
+
+@pytest.mark.parametrize(
+    "payload,message",
+    [
+        pytest.param(
+            b"\x11\x22\x22\x11\x11\x11\x11\x11\x12\x12\x12\x12",
+            "Invalid header: unpack_from requires a buffer of at least 24 bytes",
+            id="header",
+        ),
+        pytest.param(
+            b"\x11\x22\x22\x11\x11\x11\x11\x11\x12\x12\x12\x12\x12\x12\x12\x12\x00\x00\x00\x08\x00\x00\x00\x00",
+            "Invalid payload: missing type",
+            id="type",
+        ),
+        pytest.param(
+            b"\x11\x22\x22\x11\x11\x11\x11\x11\x12\x12\x12\x12\x12\x12\x12\x12\x00\x00\x00\x08\x00\x00\x00\x00\x03"
+            b"\x01\x00\x00\x00",
+            "Invalid payload: LH2_LOCATION length is 4 (expected: 12)",
+            id="values",
+        ),
+        pytest.param(
+            b"\x11\x22\x22\x11\x11\x11\x11\x11\x12\x12\x12\x12\x12\x12\x12\x12\x00\x00\x00\x08\x00\x00\x00\x00\x07"
+            b"\x01\x00",
+            "Invalid payload: CONTROL_MODE length is 2 (expected: 1)",
+            id="too long",
+        ),
+        pytest.param(
+            b"\x11\x22\x22\x11\x11\x11\x11\x11\x12\x12\x12\x12\x12\x12\x12\x12\x00\x00\x00\x08\x00\x00\x00\x00\x09"
+            b"\x01\x0a\x01\x00\x00\x00\x02\x00\x00\x00\xff",
+            "Invalid payload: 1 bytes after the 1 waypoints",
+            id="waypoints too long",
+        ),
+    ],
+)
+def test_protocol_parser_truncated(payload, message):
+    with pytest.raises(ProtocolPayloadParserException) as exc_info:
+        ProtocolPayload.from_bytes(payload)
+    assert str(exc_info.value).startswith(message)
+
+
+@dataclass
+class Temperature(ProtocolData):
+    """Third-party data class, a temperature in hundredths of degree."""
+
+    value: int = 0
+
+    @property
+    def fields(self) -> List[ProtocolField]:
+        return [ProtocolField(self.value, "temp.", 2, signed=True)]
+
+    @classmethod
+    def unpack_from(cls, bytes_, offset: int = 0) -> ProtocolData:
+        return cls(int.from_bytes(bytes_[offset : offset + 2], "little", signed=True))
+
+
+def test_register_payload_type():
+    temperature_type = CustomPayloadType(0x80, "TEMPERATURE")
+    register_payload_type(temperature_type, Temperature, 2)
+    try:
+        payload = ProtocolPayload(
+            ProtocolHeader(0x1122334455667788, 0x1222122212221221, 0x1442, 0),
+            temperature_type,
+            Temperature(-1250),
+        )
+        frame = payload.to_bytes()
+        assert frame[24:] == b"\x80\x1e\xfb"
+        assert ProtocolPayload.from_bytes(frame) == payload
+        assert str(payload).splitlines()[1].startswith(" TEMPERATURE ")
+        with pytest.raises(ValueError) as exc_info:
+            register_payload_type(temperature_type, Temperature, 2)
+        assert str(exc_info.value) == "Payload type '128' already registered"
+    finally:
+        del PAYLOAD_TYPES[temperature_type.value]
+
+
+def test_frame_decodes_values_on_access():
+    payload = ProtocolPayload(
+        ProtocolHeader(0x1122334455667788, 0x1222122212221221, 0x1442, 1, msg_id=42),
+        PayloadType.SAILBOT_DATA,
+        SailBotData(direction=45, latitude=48856614, longitude=2352221),
+    )
+    frame = ProtocolFrame(payload.to_bytes())
+    assert frame.destination == 0x1122334455667788
+    assert frame.source == 0x1222122212221221
+    assert frame.swarm_id == 0x1442
+    assert frame.msg_id == 42
+    assert frame.version == PROTOCOL_VERSION
+    assert frame.payload_type == PayloadType.SAILBOT_DATA
+    assert frame._values is None
+    assert frame.application == ApplicationType.SailBot
+    assert frame.values == payload.values
+    assert frame.values is frame.values
+    assert frame.to_payload() == payload
+    assert bytes(frame) == payload.to_bytes()
+
+
+def test_frame_outlives_hdlc_buffer():
+    payloads = [
+        ProtocolPayload(
+            ProtocolHeader(destination, 0x1222122212221221, 0x1442, 1),
+            PayloadType.SAILBOT_DATA,
+            SailBotData(direction=direction, latitude=48856614, longitude=2352221),
+        )
+        for destination, direction in ((1, 45), (2, 90))
+    ]
+    handler = HDLCHandler()
+    ((view, frame),) = [
+        (ProtocolFrame(data), ProtocolFrame(bytes(data)))
+        for data in handler.feed(hdlc_encode(payloads[0].to_bytes()))
+    ]
+    assert view.destination == 1
+    # The HDLC buffer is reused for the next frame, only the copy is kept
+    list(handler.feed(hdlc_encode(payloads[1].to_bytes())))
+    assert view.destination == 2
+    assert frame.destination == 1
+    assert frame.to_payload() == payloads[0]
+
+
+@pytest.mark.parametrize(
+    "payload,message",
+    [
+        pytest.param(
+            b"\x11\x22\x22\x11\x11\x11\x11\x11\x12\x12\x12\x12",
+            "Invalid header: 12 bytes (expected: 24)",
+            id="header",
+        ),
+        pytest.param(
+            b"\x11\x22\x22\x11\x11\x11\x11\x11\x12\x12\x12\x12\x12\x12\x12\x12\x00\x00\x00\x03\x00\x00\x00\x00\x0a",
+            f"Invalid header: Unsupported payload version '3' (expected: {PROTOCOL_VERSION})",
+            id="version",
+        ),
+        pytest.param(
+            b"\x11\x22\x22\x11\x11\x11\x11\x11\x12\x12\x12\x12\x12\x12\x12\x12\x00\x00\x00\x08\x00\x00\x00\x00\x0a",
+            "Invalid payload: SAILBOT_DATA length is 0 (expected: 10)",
+            id="length",
+        ),
+    ],
+)
+def test_frame_invalid(payload, message):
+    with pytest.raises(ProtocolPayloadParserException) as exc_info:
+        ProtocolFrame(payload)
+    assert str(exc_info.value) == message
+
+
+def test_frame_invalid_application():
+    frame = ProtocolFrame(
+        b"\x11\x22\x22\x11\x11\x11\x11\x11\x12\x12\x12\x12\x12\x12\x12\x12\x00\x00\xff\x08\x00\x00\x00\x00\x04"
+    )
+    assert frame.payload_type == PayloadType.ADVERTISEMENT
+    with pytest.raises(ProtocolPayloadParserException) as exc_info:
+        _ = frame.application
+    assert str(exc_info.value) == "Invalid header: 255 is not a valid ApplicationType"
+
+
+def test_values_dtypes_match_payload_lengths():
+    for payload_type, dtype in VALUES_DTYPES.items():
+        assert dtype.itemsize == PAYLOAD_TYPES[payload_type.value].length
+
+
+def test_frames_to_array():
+    payloads = [
+        ProtocolPayload(
+            ProtocolHeader(0xFFFFFFFFFFFFFFFF, source, 0x1442, 0, msg_id=source),
+            PayloadType.DOTBOT_DATA,
+            DotBotData(
+                direction=-source,
+                locations=[
+                    Lh2RawLocation(0x123456789ABCDEF1, 0x01, -2),
+                    Lh2RawLocation(0x0FEDCBA987654321, 0x02, source),
+                ],
+            ),
+        )
+        for source in range(1, 4)
+    ]
+    array = frames_to_array(
+        (payload.to_bytes() for payload in payloads), PayloadType.DOTBOT_DATA
+    )
+    assert len(array) == 3
+    assert array["source"].tolist() == [1, 2, 3]
+    assert array["msg_id"].tolist() == [1, 2, 3]
+    assert array["application"].tolist() == [0, 0, 0]
+    assert array["direction"].tolist() == [-1, -2, -3]
+    assert array["locations"]["bits"][:, 0].tolist() == [0x123456789ABCDEF1] * 3
+    assert array["locations"]["polynomial_index"][:, 1].tolist() == [2, 2, 2]
+    assert array["locations"]["offset"].tolist() == [[-2, 1], [-2, 2], [-2, 3]]
+
+    payload = ProtocolPayload(
+        ProtocolHeader(0xFFFFFFFFFFFFFFFF, 0x1234, 0, 1),
+        PayloadType.SAILBOT_DATA,
+        SailBotData(direction=359, latitude=-48856614, longitude=2352221),
+    )
+    array = frames_to_array([payload.to_bytes()], PayloadType.SAILBOT_DATA)
+    assert array[0]["application"] == ApplicationType.SailBot
+    assert array[0]["direction"] == 359
+    assert array[0]["latitude"] == -48856614
+    assert array[0]["longitude"] == 2352221
+    assert frames_to_array([], PayloadType.SAILBOT_DATA).dtype == array.dtype
+    assert isinstance(array, np.ndarray)
+
+
+@pytest.mark.parametrize(
+    "frames,payload_type,message",
+    [
+        pytest.param(
+            [],
+            PayloadType.LH2_WAYPOINTS,
+            "Unsupported payload type '8'",
+            id="unsupported",
+        ),
+        pytest.param(
+            [
+                ProtocolPayload(
+                    ProtocolHeader(), PayloadType.GPS_POSITION, GPSPosition(1, 2)
+                ).to_bytes()[:-1]
+            ],
+            PayloadType.GPS_POSITION,
+            "Invalid payload: frame 0 length is 32 (expected: 33)",
+            id="length",
+        ),
+        pytest.param(
+            [
+                ProtocolPayload(
+                    ProtocolHeader(), PayloadType.GPS_POSITION, GPSPosition(1, 2)
+                ).to_bytes(),
+                ProtocolPayload(
+                    ProtocolHeader(),
+                    PayloadType.CMD_MOVE_RAW,
+                    CommandMoveRaw(1, 2, 3, 4),
+                ).to_bytes()
+                + b"\x00\x00\x00\x00",
+            ],
+            PayloadType.GPS_POSITION,
+            "Invalid payload: frame 1 payload_type is 0 (expected: 5)",
+            id="payload type",
+        ),
+        pytest.param(
+            [
+                ProtocolPayload(
+                    ProtocolHeader(version=3), PayloadType.GPS_POSITION, GPSPosition()
+                ).to_bytes()
+            ],
+            PayloadType.GPS_POSITION,
+            f"Invalid payload: frame 0 version is 3 (expected: {PROTOCOL_VERSION})",
+            id="version",
+        ),
+    ],
+)
+def test_frames_to_array_invalid(frames, payload_type, message):
+    with pytest.raises(ProtocolPayloadParserException) as exc_info:
+        frames_to_array(frames, payload_type)
+    assert str(exc_info.value) == message
+
+
+@pytest.mark.parametrize(
+    "payload_type,values,fragment_type,per_fragment",
+    [
+        pytest.param(
+            PayloadType.LH2_WAYPOINTS,
+            LH2Waypoints(
+                threshold=10,
+                waypoints=[LH2Location(index, index, 0) for index in range(50)],
+            ),
+            PayloadType.LH2_WAYPOINTS_FRAGMENT,
+            18,
+            id="LH2",
+        ),
+        pytest.param(
+            PayloadType.GPS_WAYPOINTS,
+            GPSWaypoints(
+                threshold=5,
+                waypoints=[GPSPosition(index, -index) for index in range(300)],
+            ),
+            PayloadType.GPS_WAYPOINTS_FRAGMENT,
+            28,
+            id="GPS",
+        ),
+    ],
+)
+def test_waypoints_fragments(payload_type, values, fragment_type, per_fragment):
+    payload = ProtocolPayload(ProtocolHeader(0x1122, 0x3344), payload_type, values)
+    fragments = payload.fragment()
+    count = -(-len(values.waypoints) // per_fragment)
+    assert len(fragments) == count
+    for index, fragment in enumerate(fragments):
+        frame = fragment.to_bytes()
+        assert len(frame) <= PAYLOAD_MAX_LENGTH
+        assert fragment.payload_type == fragment_type
+        assert fragment.values.index == index
+        assert fragment.values.count == count
+        assert ProtocolPayload.from_bytes(frame) == fragment
+    # Fragments received in any order
+    received = [ProtocolPayload.from_bytes(f.to_bytes()) for f in fragments[::-1]]
+    assert ProtocolPayload.reassemble(received) == payload
+
+
+def test_waypoints_fragment_not_needed():
+    payload = ProtocolPayload(
+        ProtocolHeader(),
+        PayloadType.LH2_WAYPOINTS,
+        LH2Waypoints(threshold=10, waypoints=[LH2Location(1, 2, 3)] * 18),
+    )
+    assert len(payload.to_bytes()) == 243
+    assert payload.fragment() == [payload]
+    payload = ProtocolPayload(
+        ProtocolHeader(), PayloadType.CMD_RGB_LED, CommandRgbLed()
+    )
+    assert payload.fragment(max_length=10) == [payload]
+
+
+def test_waypoints_fragment_errors():
+    payload = ProtocolPayload(
+        ProtocolHeader(),
+        PayloadType.LH2_WAYPOINTS,
+        LH2Waypoints(threshold=10, waypoints=[LH2Location(1, 2, 3)] * 300),
+    )
+    with pytest.raises(ValueError) as exc_info:
+        payload.fragment(max_length=30)
+    assert str(exc_info.value) == "Fragments cannot fit in 30 bytes"
+    with pytest.raises(ValueError) as exc_info:
+        payload.fragment(max_length=41)
+    assert str(exc_info.value) == "Too many waypoints: 300"
+
+    fragments = payload.fragment()
+    with pytest.raises(ProtocolPayloadParserException) as exc_info:
+        ProtocolPayload.reassemble(fragments[1:])
+    assert str(exc_info.value) == "Invalid fragments: 16 of 17 received"
+    with pytest.raises(ProtocolPayloadParserException) as exc_info:
+        ProtocolPayload.reassemble([payload])
+    assert str(exc_info.value) == "Invalid fragments: not waypoints"
+    with pytest.raises(ProtocolPayloadParserException) as exc_info:
+        ProtocolPayload.reassemble([])
+    assert str(exc_info.value) == "Invalid fragments: not waypoints"
+    gps_fragment = ProtocolPayload(
+        ProtocolHeader(),
+        PayloadType.GPS_WAYPOINTS_FRAGMENT,
+        GPSWaypointsFragment(threshold=10, index=1, count=17),
+    )
+    with pytest.raises(ProtocolPayloadParserException) as exc_info:
+        ProtocolPayload.reassemble(fragments[:1] + [gps_fragment] + fragments[2:])
+    assert str(exc_info.value) == "Invalid fragments: 17 of 17 received"
+    assert isinstance(fragments[0].values, LH2WaypointsFragment)
+
+
+def test_header_cache():
+    headers = HeaderCache(0x1222122212221221, 0x1442)
+    header = headers.get("1122334455667788", ApplicationType.SailBot)
+    assert isinstance(header, CachedHeader)
+    assert headers.get("1122334455667788", 1) is header
+    assert headers.get("1122334455667788") is not header
+    expected = ProtocolHeader(0x1122334455667788, 0x1222122212221221, 0x1442, 1)
+    assert header == expected
+    assert expected == header
+    assert header != ProtocolHeader()
+    payload = ProtocolPayload(header, PayloadType.CMD_RGB_LED, CommandRgbLed(1, 2, 3))
+    assert (
+        payload.to_bytes()
+        == (
+            ProtocolPayload(expected, PayloadType.CMD_RGB_LED, CommandRgbLed(1, 2, 3))
+        ).to_bytes()
+    )
+
+    # Only msg_id is patched in the cached encoding
+    patched = header.with_msg_id(0x12345678)
+    assert header.msg_id == 0
+    assert (
+        patched.to_bytes()
+        == ProtocolHeader(
+            0x1122334455667788, 0x1222122212221221, 0x1442, 1, msg_id=0x12345678
+        ).to_bytes()
+    )
+    assert isinstance(patched, CachedHeader)
+
+    # Cached headers cannot be modified in place, only copied
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        header.application = ApplicationType.DotBot
+    assert header.application == ApplicationType.SailBot
+    replaced = dataclasses.replace(header, application=ApplicationType.DotBot)
+    assert (
+        replaced.to_bytes()
+        == ProtocolHeader(0x1122334455667788, 0x1222122212221221, 0x1442, 0).to_bytes()
+    )
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10), reason="requires slotted dataclasses")
+def test_decoded_objects_have_no_dict():
+    payload = ProtocolPayload(
+        ProtocolHeader(),
+        PayloadType.DOTBOT_DATA,
+        DotBotData(
+            direction=45,
+            locations=[Lh2RawLocation(1, 2, 3), Lh2RawLocation(4, 5, 6)],
+        ),
+    )
+    frame = ProtocolFrame(payload.to_bytes())
+    decoded = frame.to_payload()
+    for obj in (frame, decoded, decoded.header, decoded.values) + tuple(
+        decoded.values.locations
+    ):
+        assert not hasattr(obj, "__dict__")
+    assert not hasattr(HeaderCache(0, 0).get("1234"), "__dict__")
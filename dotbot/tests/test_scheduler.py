@@ -0,0 +1,186 @@
+"""Test module for the transmit scheduler."""
+
+import pytest
+
+from dotbot.protocol import (
+    CommandMoveRaw,
+    CommandRgbLed,
+    ControlMode,
+    ControlModeType,
+    LH2Location,
+    LH2Waypoints,
+    LH2WaypointsFragment,
+    PayloadType,
+    ProtocolHeader,
+    ProtocolPayload,
+)
+from dotbot.scheduler import TokenBucket, TransmitScheduler
+
+
+def _move(destination, speed):
+    return ProtocolPayload(
+        ProtocolHeader(destination, 0, 0, 0, 0),
+        PayloadType.CMD_MOVE_RAW,
+        CommandMoveRaw(0, speed, 0, speed),
+    )
+
+
+def _control_mode(destination):
+    return ProtocolPayload(
+        ProtocolHeader(destination, 0, 0, 0, 0),
+        PayloadType.CONTROL_MODE,
+        ControlMode(ControlModeType.AUTO),
+    )
+
+
+def test_scheduler_coalesce():
+    """Check a queued move command is replaced by a newer one."""
+    scheduler = TransmitScheduler()
+    first = scheduler.push(_move(1, 10))
+    led = scheduler.push(
+        ProtocolPayload(
+            ProtocolHeader(1, 0, 0, 0, 0),
+            PayloadType.CMD_RGB_LED,
+            CommandRgbLed(255, 0, 0),
+        )
+    )
+    other = scheduler.push(_move(2, 20))
+    second = scheduler.push(_move(1, 30))
+    assert second is first
+    assert led is not first and other is not first
+    assert len(scheduler) == 3
+    assert scheduler.statistics.coalesced == 1
+    entries = scheduler.pop_ready()
+    assert len(scheduler) == 0
+    # The newer command takes the position of the replaced one
+    assert [payload.values for payload, _ in entries] == [
+        CommandMoveRaw(0, 30, 0, 30),
+        CommandRgbLed(255, 0, 0),
+        CommandMoveRaw(0, 20, 0, 20),
+    ]
+    assert [future for _, future in entries] == [first, led, other]
+
+
+def test_scheduler_fifo():
+    """Check control mode payloads are never coalesced and sent first."""
+    scheduler = TransmitScheduler()
+    futures = [scheduler.push(_control_mode(1)) for _ in range(3)]
+    futures.append(scheduler.push(_move(1, 10)))
+    futures.append(scheduler.push(_control_mode(1)))
+    assert len(set(futures)) == 5
+    assert scheduler.statistics.coalesced == 0
+    assert [payload.payload_type for payload, _ in scheduler.pop_ready()] == [
+        PayloadType.CONTROL_MODE,
+        PayloadType.CONTROL_MODE,
+        PayloadType.CONTROL_MODE,
+        PayloadType.CONTROL_MODE,
+        PayloadType.CMD_MOVE_RAW,
+    ]
+
+
+class FakeClock:
+    """Clock advanced manually by the tests."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_scheduler_waypoints_fragments():
+    """Check waypoints fragments are sent last, after older waypoints."""
+    scheduler = TransmitScheduler()
+    scheduler.push(
+        ProtocolPayload(
+            ProtocolHeader(1, 0, 0, 0, 0),
+            PayloadType.LH2_WAYPOINTS,
+            LH2Waypoints(threshold=10, waypoints=[]),
+        )
+    )
+    for index in range(2):
+        scheduler.push(
+            ProtocolPayload(
+                ProtocolHeader(1, 0, 0, 0, 0),
+                PayloadType.LH2_WAYPOINTS_FRAGMENT,
+                LH2WaypointsFragment(threshold=10, index=index, count=2),
+            )
+        )
+    scheduler.push(
+        ProtocolPayload(
+            ProtocolHeader(1, 0, 0, 0, 0),
+            PayloadType.LH2_LOCATION,
+            LH2Location(1, 2, 3),
+        )
+    )
+    assert [
+        (payload.payload_type, getattr(payload.values, "index", None))
+        for payload, _ in scheduler.pop_ready()
+    ] == [
+        (PayloadType.LH2_LOCATION, None),
+        (PayloadType.LH2_WAYPOINTS, None),
+        (PayloadType.LH2_WAYPOINTS_FRAGMENT, 0),
+        (PayloadType.LH2_WAYPOINTS_FRAGMENT, 1),
+    ]
+
+
+def test_token_bucket():
+    """Check tokens are replenished at the configured rate."""
+    clock = FakeClock()
+    bucket = TokenBucket(10, burst=2, clock=clock)
+    assert bucket.take(5) == 2
+    assert bucket.take(1) == 0
+    assert bucket.delay() == pytest.approx(0.1)
+    clock.now = 0.25
+    assert bucket.take(5) == 2
+    clock.now = 10
+    assert bucket.tokens <= 2
+    assert bucket.take(1) == 1
+
+
+@pytest.mark.parametrize(
+    "rate,burst", [(0, None), (-10, None), (10, 0), (10, 0.5), (10, -1)]
+)
+def test_token_bucket_invalid(rate, burst):
+    """Check a bucket that would never release a frame is rejected."""
+    with pytest.raises(ValueError):
+        TokenBucket(rate, burst=burst)
+
+
+def test_scheduler_priorities():
+    """Check payloads are released by priority within the budget."""
+    clock = FakeClock()
+    scheduler = TransmitScheduler(frame_rate=10, burst=2, clock=clock)
+    waypoints = scheduler.push(
+        ProtocolPayload(
+            ProtocolHeader(1, 0, 0, 0, 0),
+            PayloadType.LH2_WAYPOINTS,
+            LH2Waypoints(threshold=10, waypoints=[]),
+        )
+    )
+    echoes = [
+        scheduler.push(
+            ProtocolPayload(
+                ProtocolHeader(destination, 0, 0, 0, 0),
+                PayloadType.LH2_LOCATION,
+                LH2Location(1, 2, 3),
+            )
+        )
+        for destination in (1, 2)
+    ]
+    scheduler.push(_move(1, 10))
+    scheduler.push(_control_mode(1))
+    assert [payload.payload_type for payload, _ in scheduler.pop_ready()] == [
+        PayloadType.CONTROL_MODE,
+        PayloadType.CMD_MOVE_RAW,
+    ]
+    # LH2 echoes didn't fit in the budget, the waypoints wait for their turn
+    assert all(future.cancelled() for future in echoes)
+    assert scheduler.statistics.shed == 2
+    assert len(scheduler) == 1
+    assert scheduler.pop_ready() == []
+    assert scheduler.delay() == pytest.approx(0.1)
+    clock.now = 0.1
+    entries = scheduler.pop_ready()
+    assert [future for _, future in entries] == [waypoints]
+    assert scheduler.statistics.frames_sent == 3
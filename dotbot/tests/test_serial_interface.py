@@ -0,0 +1,247 @@
+"""Test module for the serial interface."""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+from unittest.mock import MagicMock, PropertyMock, patch
+
+import pytest
+import serial
+
+from dotbot.serial_interface import (
+    PAYLOAD_CHUNK_DELAY,
+    AsyncSerialInterface,
+    SerialInterface,
+    SerialInterfaceException,
+    SocketInterface,
+)
+
+
+@patch("dotbot.serial_interface.SerialInterface.start")
+@patch("dotbot.serial_interface.serial.Serial")
+def test_serial_interface_read_chunks(serial_mock, _):
+    callback = MagicMock()
+    interface = SerialInterface("/dev/null", 115200, callback, read_chunk_size=4)
+    serial_mock.assert_called_once_with("/dev/null", 115200, timeout=0.1)
+    type(interface.serial).in_waiting = PropertyMock(side_effect=[2, 0, 10])
+    interface.serial.read.side_effect = [
+        b"~",
+        b"ab",
+        b"",  # timeout
+        b"c",
+        b"~",
+        b"def",
+        serial.serialutil.SerialException("disconnected"),
+    ]
+    with pytest.raises(SerialInterfaceException):
+        interface.run()
+    assert [call.args[0] for call in callback.call_args_list] == [
+        b"~ab",
+        b"c",
+        b"~def",
+    ]
+    assert interface.serial.read.call_args_list[-2].args[0] == 3
+
+
+@patch("dotbot.serial_interface.SerialInterface.start")
+@patch("dotbot.serial_interface.serial.Serial")
+def test_serial_interface_write(_, __):
+    interface = SerialInterface("/dev/null", 115200, MagicMock())
+    future = interface.write(bytes(100))
+    assert future.result(timeout=1) == 100
+    assert [call.args[0] for call in interface.serial.write.call_args_list] == [
+        bytes(64),
+        bytes(36),
+    ]
+    assert interface.serial.flush.call_count == 2
+
+    interface.serial.write.side_effect = serial.serialutil.SerialException("error")
+    with pytest.raises(SerialInterfaceException):
+        interface.write(b"test").result(timeout=1)
+
+    # The writer survives unexpected errors
+    interface.serial.write.side_effect = TypeError("bad buffer")
+    with pytest.raises(SerialInterfaceException):
+        interface.write(b"test").result(timeout=1)
+    interface.serial.write.side_effect = None
+    assert interface.write(b"test").result(timeout=1) == 4
+
+
+@patch("dotbot.serial_interface.SerialInterface.start")
+@patch("dotbot.serial_interface.serial.Serial")
+def test_serial_interface_write_queue_full(_, __):
+    interface = SerialInterface("/dev/null", 115200, MagicMock(), tx_queue_size=1)
+    event = threading.Event()
+    interface.serial.write.side_effect = lambda _: event.wait(1)
+    first = interface.write(b"first")
+    while interface._tx_queue.qsize() > 0:  # wait for the writer to pick it
+        time.sleep(0.001)
+    second = interface.write(b"second")
+    with pytest.raises(SerialInterfaceException) as exc:
+        interface.write(b"third").result(timeout=1)
+    assert str(exc.value) == "Transmit queue full"
+    event.set()
+    assert first.result(timeout=1) == 5
+    assert second.result(timeout=1) == 6
+
+
+@patch("dotbot.serial_interface.SerialInterface.start")
+@patch("dotbot.serial_interface.serial.Serial")
+def test_serial_interface_close(_, __):
+    interface = SerialInterface("/dev/null", 115200, MagicMock())
+    writing = threading.Event()
+    closed = threading.Event()
+
+    def write(_):
+        writing.set()
+        closed.wait(1)
+        raise serial.serialutil.SerialException("Port closed")
+
+    interface.serial.write.side_effect = write
+    interface.serial.close.side_effect = closed.set
+    first = interface.write(b"first")
+    writing.wait(1)
+    second = interface.write(b"second")
+    interface.close()
+    assert not interface._writer.is_alive()
+    for future in (first, second, interface.write(b"third")):
+        with pytest.raises(SerialInterfaceException):
+            future.result(timeout=1)
+    # Closing twice is harmless
+    interface.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires a POSIX system")
+@pytest.mark.asyncio
+async def test_async_serial_interface():
+    master, slave = os.openpty()
+    received = []
+    interface = AsyncSerialInterface(os.ttyname(slave), 115200, received.append)
+    os.write(master, b"~test\x88\x07~")
+    while not received:
+        await asyncio.sleep(0.01)
+    assert b"".join(received) == b"~test\x88\x07~"
+
+    data = bytes(range(100))
+    assert await asyncio.gather(interface.write(data), interface.write(b"end")) == [
+        100,
+        3,
+    ]
+    written = b""
+    while len(written) < 103:
+        written += os.read(master, 256)
+    assert written == data + b"end"
+
+    interface.close()
+    await interface.closed
+    with pytest.raises(SerialInterfaceException):
+        await interface.write(b"test")
+    os.close(master)
+    os.close(slave)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires a POSIX system")
+@pytest.mark.asyncio
+async def test_async_serial_interface_error():
+    """Check the serial port is closed when the link is lost."""
+    master, slave = os.openpty()
+    interface = AsyncSerialInterface(os.ttyname(slave), 115200, lambda _: None)
+    os.close(master)
+    with pytest.raises(SerialInterfaceException):
+        await asyncio.wait_for(interface.closed, timeout=1)
+    assert not interface.serial.is_open
+    os.close(slave)
+
+
+async def _socket_interface_roundtrip(url, clients):
+    """Exchange bytes with the peer of a socket interface."""
+    received = []
+    interface = await SocketInterface.open(url, received.append)
+    reader, writer = await clients.get()
+    writer.write(b"~test\x88\x07~")
+    while not received:
+        await asyncio.sleep(0.01)
+    assert b"".join(received) == b"~test\x88\x07~"
+
+    data = bytes(range(100))
+    assert await asyncio.gather(interface.write(data), interface.write(b"end")) == [
+        100,
+        3,
+    ]
+    assert await reader.readexactly(103) == data + b"end"
+
+    # The peer goes away
+    writer.close()
+    with pytest.raises(SerialInterfaceException):
+        await interface.closed
+    with pytest.raises(SerialInterfaceException):
+        await interface.write(b"test")
+    interface.close()
+
+
+@pytest.mark.asyncio
+async def test_socket_interface_tcp():
+    clients = asyncio.Queue()
+    server = await asyncio.start_server(
+        lambda reader, writer: clients.put_nowait((reader, writer)), "127.0.0.1", 0
+    )
+    port = server.sockets[0].getsockname()[1]
+    await _socket_interface_roundtrip(f"tcp://127.0.0.1:{port}", clients)
+    server.close()
+    await server.wait_closed()
+    with pytest.raises(SerialInterfaceException):
+        await SocketInterface.open(f"tcp://127.0.0.1:{port}", lambda _: None)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires a POSIX system")
+@pytest.mark.asyncio
+async def test_socket_interface_unix(tmp_path):
+    clients = asyncio.Queue()
+    path = str(tmp_path / "gateway.sock")
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: clients.put_nowait((reader, writer)), path
+    )
+    await _socket_interface_roundtrip(f"unix://{path}", clients)
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_socket_interface_flow_control():
+    """Check writes are queued while the socket buffer is full."""
+    interface = SocketInterface("tcp://test:1", lambda _: None, tx_queue_size=2)
+    interface._connection_made(MagicMock())
+    interface._tx_paused = True
+    first, second = interface.write(b"1"), interface.write(b"2")
+    with pytest.raises(SerialInterfaceException):
+        await interface.write(b"3")
+    assert not first.done() and not second.done()
+    interface._resume_writing()
+    assert await asyncio.gather(first, second) == [1, 1]
+    assert [call.args[0] for call in interface.transport.write.call_args_list] == [
+        b"12"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_socket_interface_chunks():
+    """Check bytes are sent to the socket in paced chunks."""
+    interface = SocketInterface("tcp://test:1", lambda _: None, tx_queue_size=2)
+    interface._connection_made(MagicMock())
+    first, second = interface.write(bytes(100)), interface.write(bytes(50))
+    # The first chunk is written right away
+    assert [call.args[0] for call in interface.transport.write.call_args_list] == [
+        bytes(64)
+    ]
+    assert not first.done()
+    start = time.monotonic()
+    assert await asyncio.gather(first, second) == [100, 50]
+    assert time.monotonic() - start >= 2 * PAYLOAD_CHUNK_DELAY
+    assert [call.args[0] for call in interface.transport.write.call_args_list] == [
+        bytes(64),
+        bytes(64),
+        bytes(22),
+    ]
@@ -15,11 +15,15 @@ from dotbot.models import (
     DotBotRgbLedCommandModel,
     DotBotCalibrationStateModel,
     DotBotControlModeModel,
+    DotBotGatewayModel,
+    DotBotHDLCStatisticsModel,
     DotBotGPSPosition,
     DotBotLH2Position,
 )
+from dotbot.hdlc import HDLCStatistics
 from dotbot.protocol import (
     ApplicationType,
+    HeaderCache,
     ProtocolHeader,
     ProtocolPayload,
     PayloadType,
@@ -32,6 +36,8 @@ from dotbot.protocol import (
     GPSPosition,
     GPSWaypoints,
 )
+from dotbot.scheduler import TransmitStatistics
+from dotbot.tracker import LinkStatistics
 from dotbot.server import app, web
 
 
@@ -53,6 +59,7 @@ def controller():
     app.controller.settings = MagicMock()
     app.controller.settings.gw_address = "0000"
     app.controller.settings.swarm_id = "0000"
+    app.controller.headers = HeaderCache(0, 0)
 
 
 @pytest.mark.asyncio
@@ -82,6 +89,83 @@ async def test_set_dotbot_address():
     assert app.controller.header.destination == int(new_address, 16)
 
 
+@pytest.mark.asyncio
+async def test_get_hdlc_statistics():
+    app.controller.hdlc_statistics = HDLCStatistics(
+        bytes_received=1000, bytes_discarded=10, frames_ok=20, fcs_errors=1
+    )
+    response = await client.get("/controller/hdlc/statistics")
+    assert response.status_code == 200
+    assert (
+        response.json()
+        == DotBotHDLCStatisticsModel(
+            bytes_received=1000,
+            bytes_discarded=10,
+            frames_ok=20,
+            fcs_errors=1,
+            short_frames=0,
+            oversize_frames=0,
+            aborted_frames=0,
+        ).model_dump()
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_gateways():
+    app.controller.get_gateways.return_value = [
+        DotBotGatewayModel(port="/dev/ttyACM0", connected=True),
+        DotBotGatewayModel(port="/dev/ttyACM1", connected=False),
+    ]
+    response = await client.get("/controller/gateways")
+    assert response.status_code == 200
+    assert response.json() == [
+        {"port": "/dev/ttyACM0", "connected": True},
+        {"port": "/dev/ttyACM1", "connected": False},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_get_transmit_statistics():
+    app.controller.transmit_statistics = TransmitStatistics(
+        frames_sent=100, coalesced=12, shed=3
+    )
+    response = await client.get("/controller/transmit/statistics")
+    assert response.status_code == 200
+    assert response.json() == {"frames_sent": 100, "coalesced": 12, "shed": 3}
+
+
+@pytest.mark.asyncio
+async def test_get_links_statistics():
+    app.controller.link_statistics = {
+        "4242": LinkStatistics(sent=5, acknowledged=3, lost=1, rtts=[0.2, 0.1, 0.3]),
+        "0001": LinkStatistics(sent=1),
+    }
+    response = await client.get("/controller/links/statistics")
+    assert response.status_code == 200
+    assert response.json() == [
+        {
+            "address": "0001",
+            "sent": 1,
+            "acknowledged": 0,
+            "lost": 0,
+            "loss": 0.0,
+            "rtt_p50": None,
+            "rtt_p90": None,
+            "rtt_p99": None,
+        },
+        {
+            "address": "4242",
+            "sent": 5,
+            "acknowledged": 3,
+            "lost": 1,
+            "loss": 25.0,
+            "rtt_p50": 0.2,
+            "rtt_p90": 0.3,
+            "rtt_p99": 0.3,
+        },
+    ]
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
     "dotbots,code,found",
@@ -422,6 +506,31 @@ async def test_set_dotbots_waypoints(
         app.controller.send_payload.assert_not_called()
 
 
+@pytest.mark.asyncio
+async def test_set_dotbots_waypoints_fragmented():
+    app.controller.dotbots = {
+        "4242": DotBotModel(
+            address="4242",
+            application=ApplicationType.DotBot,
+            swarm="0000",
+            last_seen=123.4,
+        ),
+    }
+    waypoints = [{"x": index / 100, "y": 0.5, "z": 0} for index in range(40)]
+    response = await client.put(
+        "/controller/dotbots/4242/0/waypoints",
+        json={"threshold": 10, "waypoints": waypoints},
+    )
+    assert response.status_code == 200
+    fragments = [call.args[0] for call in app.controller.send_payload.call_args_list]
+    assert [fragment.payload_type for fragment in fragments] == [
+        PayloadType.LH2_WAYPOINTS_FRAGMENT
+    ] * 3
+    payload = ProtocolPayload.reassemble(fragments)
+    assert payload.payload_type == PayloadType.LH2_WAYPOINTS
+    assert len(payload.values.waypoints) == 40
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
     "dotbots,result",
@@ -0,0 +1,135 @@
+"""Test module for the gateway simulator."""
+
+import os
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+from dotbot.hdlc import HDLCHandler, hdlc_encode
+from dotbot.protocol import (
+    PROTOCOL_VERSION,
+    ApplicationType,
+    CommandMoveRaw,
+    CommandRgbLed,
+    ControlMode,
+    ControlModeType,
+    PayloadType,
+    ProtocolHeader,
+    ProtocolPayload,
+)
+from dotbot.simulator import GatewaySimulator, main
+
+
+def _decode(frames):
+    return [ProtocolPayload.from_bytes(frame) for frame in HDLCHandler().feed(frames)]
+
+
+def test_simulator_tick():
+    """Check each bot sends its payloads at the configured rates."""
+    simulator = GatewaySimulator(
+        dotbots=3, sailbots=2, rate=10, advertisement_rate=1, swarm_id=0x42
+    )
+    payloads = _decode(simulator.tick(0.5))
+    # 25 data payloads and 2.5 advertisements
+    assert len(payloads) == 27
+    assert simulator.frames_sent == len(payloads)
+    counts = {}
+    for payload in payloads:
+        counts[payload.payload_type] = counts.get(payload.payload_type, 0) + 1
+        assert payload.header.swarm_id == 0x42
+        assert payload.header.source in simulator.bots
+        bot = simulator.bots[payload.header.source]
+        if payload.payload_type == PayloadType.SAILBOT_DATA:
+            assert bot.application == ApplicationType.SailBot
+        if payload.payload_type == PayloadType.DOTBOT_DATA:
+            assert bot.application == ApplicationType.DotBot
+    assert counts == {
+        PayloadType.ADVERTISEMENT: 2,
+        PayloadType.DOTBOT_DATA: 15,
+        PayloadType.SAILBOT_DATA: 10,
+    }
+    assert GatewaySimulator(dotbots=0).tick(1) == bytearray()
+
+
+def test_simulator_commands():
+    """Check commands received from the controller are applied to the bots."""
+    simulator = GatewaySimulator(dotbots=2, sailbots=1)
+    bot = simulator.bots[1]
+    reply = simulator.handle_data(
+        bytes([PROTOCOL_VERSION])
+        + hdlc_encode(
+            ProtocolPayload(
+                ProtocolHeader(1, 0, 0, 0, PROTOCOL_VERSION),
+                PayloadType.CMD_MOVE_RAW,
+                CommandMoveRaw(0, 100, 0, 100),
+            ).to_bytes()
+        )
+        + hdlc_encode(
+            ProtocolPayload(
+                ProtocolHeader(0xFFFFFFFFFFFFFFFF, 0, 0, 0, PROTOCOL_VERSION),
+                PayloadType.CMD_RGB_LED,
+                CommandRgbLed(255, 0, 0),
+            ).to_bytes()
+        )
+        + hdlc_encode(
+            ProtocolPayload(
+                ProtocolHeader(42, 0, 0, 0, PROTOCOL_VERSION),
+                PayloadType.CONTROL_MODE,
+                ControlMode(ControlModeType.AUTO),
+            ).to_bytes()
+        )
+        + hdlc_encode(b"invalid")
+    )
+    assert reply == bytes([PROTOCOL_VERSION])
+    assert simulator.received == {
+        "CMD_MOVE_RAW": 1,
+        "CMD_RGB_LED": 1,
+        "CONTROL_MODE": 1,
+        "invalid": 1,
+    }
+    assert (bot.left_speed, bot.right_speed) == (100, 100)
+    assert all(bot.rgb_led == [255, 0, 0] for bot in simulator.bots.values())
+    assert all(bot.mode == ControlModeType.MANUAL for bot in simulator.bots.values())
+    # Moving straight ahead
+    bot.direction = 90
+    x, y = bot.x, bot.y = 0.5, 0.5
+    bot.step(1)
+    assert bot.direction == 90
+    assert bot.x > x and bot.y == pytest.approx(y)
+    sailbot = simulator.bots[3]
+    sailbot.left_speed = sailbot.right_speed = 127
+    sailbot.direction = 0
+    latitude = sailbot.latitude
+    sailbot.step(1)
+    assert sailbot.latitude > latitude
+    assert simulator.handle_data(bytes([PROTOCOL_VERSION])) == b""
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires a POSIX system")
+@pytest.mark.asyncio
+async def test_simulator_pty():
+    """Check payloads are readable on the pseudo terminal."""
+    simulator = GatewaySimulator(dotbots=5, rate=100)
+    port = simulator.open()
+    fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    os.write(fd, bytes([PROTOCOL_VERSION]))
+    await simulator.run(duration=0.1)
+    data = os.read(fd, 65536)
+    assert data[0] == PROTOCOL_VERSION
+    assert len(_decode(data[1:])) > 0
+    os.close(fd)
+    simulator.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires a POSIX system")
+def test_simulator_main(tmp_path):
+    """Check the simulator command line."""
+    link = str(tmp_path / "gateway")
+    result = CliRunner().invoke(
+        main, ["--dotbots", "2", "--duration", "0.05", "--link", link]
+    )
+    assert result.exit_code == 0
+    assert f"Simulated gateway available on {link}" in result.output
+    assert "frames sent" in result.output
+    assert not os.path.exists(link)
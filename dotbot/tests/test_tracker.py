@@ -0,0 +1,97 @@
+"""Test module for the request tracker."""
+
+import pytest
+
+from dotbot.protocol import PayloadType
+from dotbot.tracker import MSG_ID_MAX, RequestTracker
+
+
+class FakeClock:
+    """Clock advanced manually by the tests."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_tracker_msg_ids():
+    """Check msg_ids are incremented per destination and skip 0."""
+    tracker = RequestTracker()
+    assert [tracker.next_msg_id(1) for _ in range(3)] == [1, 2, 3]
+    assert tracker.next_msg_id(2) == 1
+    tracker._msg_ids[1] = MSG_ID_MAX - 1
+    assert tracker.next_msg_id(1) == MSG_ID_MAX
+    assert tracker.next_msg_id(1) == 1
+
+
+def test_tracker_round_trip():
+    """Check a reply resolves the request with its round-trip time."""
+    clock = FakeClock()
+    tracker = RequestTracker(clock=clock)
+    future = tracker.expect(1, 42, PayloadType.CONTROL_MODE)
+    assert tracker.expect(1, 42, PayloadType.CONTROL_MODE) is future
+    clock.now = 1.0
+    tracker.sent(1, 42)
+    assert not future.done()
+    clock.now = 1.25
+    # Unknown requests are ignored
+    assert tracker.received(2, 42, PayloadType.CONTROL_MODE) is None
+    assert tracker.received(1, 41, PayloadType.CONTROL_MODE) is None
+    assert tracker.received(1, 42, PayloadType.CONTROL_MODE) == pytest.approx(0.25)
+    assert future.result() == pytest.approx(0.25)
+    assert len(tracker) == 0
+    # Duplicated reply
+    assert tracker.received(1, 42, PayloadType.CONTROL_MODE) is None
+    statistics = tracker.statistics[1]
+    assert (statistics.sent, statistics.acknowledged, statistics.lost) == (1, 1, 0)
+    assert statistics.rtt_percentile(50) == pytest.approx(0.25)
+
+
+def test_tracker_other_payload_type():
+    """Check a frame of another payload type with the same msg_id is no reply."""
+    tracker = RequestTracker(clock=FakeClock())
+    future = tracker.expect(1, 7, PayloadType.CONTROL_MODE)
+    tracker.sent(1, 7)
+    # The msg_id counter of the dotbot happens to match
+    assert tracker.received(1, 7, PayloadType.DOTBOT_DATA) is None
+    assert not future.done()
+    assert tracker.statistics[1].acknowledged == 0
+    assert len(tracker) == 1
+
+
+def test_tracker_untracked_payloads():
+    """Check payloads not registered with expect() are not counted."""
+    clock = FakeClock()
+    tracker = RequestTracker(timeout=2, clock=clock)
+    tracker.sent(1, 1)
+    tracker.sent(1, 2)
+    clock.now = 10
+    tracker.expire()
+    assert len(tracker) == 0
+    assert tracker.statistics == {}
+    assert tracker.received(1, 1, PayloadType.CONTROL_MODE) is None
+
+
+def test_tracker_expire():
+    """Check requests not acknowledged in time are lost."""
+    clock = FakeClock()
+    tracker = RequestTracker(timeout=2, clock=clock)
+    lost = tracker.expect(1, 1, PayloadType.CONTROL_MODE)
+    tracker.sent(1, 1)
+    never_sent = tracker.expect(1, 3, PayloadType.CONTROL_MODE)
+    clock.now = 1.0
+    acknowledged = tracker.expect(1, 4, PayloadType.LH2_WAYPOINTS)
+    tracker.sent(1, 4)
+    clock.now = 2.5
+    tracker.expire()
+    assert isinstance(lost.exception(), TimeoutError)
+    assert never_sent.cancelled()
+    assert len(tracker) == 1
+    assert tracker.received(1, 1, PayloadType.CONTROL_MODE) is None
+    assert tracker.received(1, 4, PayloadType.LH2_WAYPOINTS) == pytest.approx(1.5)
+    assert acknowledged.result() == pytest.approx(1.5)
+    statistics = tracker.statistics[1]
+    assert (statistics.sent, statistics.acknowledged, statistics.lost) == (2, 1, 1)
+    assert statistics.loss == pytest.approx(50)
@@ -0,0 +1,146 @@
+"""Module implementing the sequencing and acknowledgment tracking of payloads."""
+
+import time
+
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from dotbot.protocol import PayloadType
+
+
+MSG_ID_MAX = 0xFFFFFFFF
+REQUEST_TIMEOUT_DEFAULT = 2.0  # seconds
+RTT_HISTORY_SIZE = 1000
+
+
+@dataclass
+class LinkStatistics:
+    """Acknowledgment counters and last round-trip times of a destination."""
+
+    sent: int = 0
+    acknowledged: int = 0
+    lost: int = 0
+    rtts: Deque[float] = field(default_factory=lambda: deque(maxlen=RTT_HISTORY_SIZE))
+
+    @property
+    def loss(self) -> float:
+        """Returns the percentage of requests timed out."""
+        completed = self.acknowledged + self.lost
+        return 100 * self.lost / completed if completed else 0.0
+
+    def rtt_percentile(self, percentile: float) -> Optional[float]:
+        """Returns a percentile of the last round-trip times, in seconds.
+
+        >>> statistics = LinkStatistics(rtts=deque([0.4, 0.1, 0.3, 0.2]))
+        >>> statistics.rtt_percentile(50), statistics.rtt_percentile(100)
+        (0.2, 0.4)
+        >>> LinkStatistics().rtt_percentile(50) is None
+        True
+        """
+        if not self.rtts:
+            return None
+        rtts = sorted(self.rtts)
+        # Nearest rank
+        rank = max(1, -(-len(rtts) * percentile // 100))
+        return rtts[int(rank) - 1]
+
+
+@dataclass
+class _Request:
+    payload_type: PayloadType
+    created: float
+    future: Future
+    sent: Optional[float] = None
+
+
+class RequestTracker:
+    """Stamps payloads with a msg_id per destination and tracks their replies.
+
+    Only the requests registered with expect() are tracked. A request is
+    acknowledged by the first frame received from its destination, or echoed
+    to it, with the same msg_id and payload type. Requests sent and not
+    acknowledged within timeout are counted as lost.
+    """
+
+    def __init__(
+        self,
+        timeout: float = REQUEST_TIMEOUT_DEFAULT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.timeout = timeout
+        self._clock = clock
+        self._msg_ids: Dict[int, int] = {}
+        self._requests: Dict[Tuple[int, int], _Request] = {}
+        self.statistics: Dict[int, LinkStatistics] = {}
+
+    def __len__(self):
+        return len(self._requests)
+
+    def next_msg_id(self, destination: int) -> int:
+        """Returns the next msg_id of a destination, from 1 to MSG_ID_MAX."""
+        msg_id = self._msg_ids.get(destination, 0) % MSG_ID_MAX + 1
+        self._msg_ids[destination] = msg_id
+        return msg_id
+
+    def expect(
+        self, destination: int, msg_id: int, payload_type: PayloadType
+    ) -> Future:
+        """Returns a future resolved with the round-trip time of a request.
+
+        The future raises TimeoutError if the request is lost, it is cancelled
+        if the request is never sent.
+        """
+        request = self._requests.get((destination, msg_id))
+        if request is None:
+            request = _Request(payload_type, self._clock(), Future())
+            self._requests[(destination, msg_id)] = request
+        return request.future
+
+    def sent(self, destination: int, msg_id: int):
+        """Starts the round-trip time measurement of a tracked request."""
+        request = self._requests.get((destination, msg_id))
+        if request is None or request.sent is not None:
+            return
+        request.sent = self._clock()
+        self.statistics.setdefault(destination, LinkStatistics()).sent += 1
+
+    def received(
+        self, address: int, msg_id: int, payload_type: PayloadType
+    ) -> Optional[float]:
+        """Acknowledges the request matching a frame, returns its round-trip time."""
+        request = self._requests.get((address, msg_id))
+        if (
+            request is None
+            or request.sent is None
+            or request.payload_type != payload_type
+        ):
+            return None
+        del self._requests[(address, msg_id)]
+        rtt = self._clock() - request.sent
+        statistics = self.statistics[address]
+        statistics.acknowledged += 1
+        statistics.rtts.append(rtt)
+        if not request.future.done():
+            request.future.set_result(rtt)
+        return rtt
+
+    def expire(self):
+        """Drops the requests not acknowledged in time."""
+        now = self._clock()
+        for key, request in list(self._requests.items()):
+            if request.sent is not None:
+                if now - request.sent < self.timeout:
+                    continue
+                self.statistics[key[0]].lost += 1
+                if not request.future.done():
+                    request.future.set_exception(
+                        TimeoutError(f"No reply to msg_id {key[1]}")
+                    )
+            elif now - request.created < self.timeout:
+                continue
+            else:
+                # Replaced in the transmit queue by a newer payload
+                request.future.cancel()
+            del self._requests[key]
@@ -0,0 +1,52 @@
+"""Python script used to benchmark the controller reception path on a serial capture."""
+
+# pylint: disable=invalid-name
+
+import asyncio
+import os
+import sys
+import time
+
+from dotbot.capture import CaptureDirection, read_capture
+from dotbot.controller import ControllerBase, ControllerSettings
+from dotbot.logger import setup_logging
+
+
+class BenchmarkController(ControllerBase):
+    """Controller only decoding and handling the payloads received."""
+
+    def init(self):
+        pass
+
+    async def start(self):
+        pass
+
+
+async def benchmark(path):
+    """Feeds the chunks received in a capture to the controller, as fast as possible."""
+    controller = BenchmarkController(
+        ControllerSettings(path, 0, "0", "0", "0", serial_transport="replay")
+    )
+    chunks = [
+        record.data
+        for record in read_capture(path)
+        if record.direction == CaptureDirection.RX
+    ]
+    start = time.perf_counter()
+    for chunk in chunks:
+        controller.handle_byte(chunk)
+    elapsed = time.perf_counter() - start
+    frames = controller.hdlc_statistics.frames_ok
+    print(f"chunks:   {len(chunks)}")
+    print(f"bytes:    {controller.hdlc_statistics.bytes_received}")
+    print(f"frames:   {frames}")
+    print(f"dotbots:  {len(controller.dotbots)}")
+    print(f"duration: {elapsed:.3f}s ({frames / elapsed:.0f} frames/s)")
+
+
+if len(sys.argv) < 2:
+    print(f"Usage: {sys.argv[0]} <capture file>")
+    sys.exit(1)
+
+setup_logging(os.devnull, "error", [])
+asyncio.run(benchmark(sys.argv[1]))
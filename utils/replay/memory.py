@@ -0,0 +1,84 @@
+"""Python script used to measure the memory allocated to decode the payloads of a serial capture.
+
+The measure is done with the slotted protocol dataclasses, then in a
+subprocess with dataclasses keeping their fields in a __dict__ for comparison.
+"""
+
+# pylint: disable=invalid-name
+
+import dataclasses
+import subprocess
+import sys
+import tracemalloc
+
+NO_SLOTS = "--no-slots"
+
+if NO_SLOTS in sys.argv:
+    # Must be patched before the protocol dataclasses are created
+    _dataclass = dataclasses.dataclass
+
+    def _dataclass_without_slots(*args, slots=False, **kwargs):
+        # pylint: disable=unused-argument
+        return _dataclass(*args, **kwargs)
+
+    dataclasses.dataclass = _dataclass_without_slots
+
+# pylint: disable=wrong-import-position
+from dotbot.capture import CaptureDirection, read_capture  # noqa: E402
+from dotbot.hdlc import HDLCHandler  # noqa: E402
+from dotbot.protocol import (  # noqa: E402
+    ProtocolHeader,
+    ProtocolPayload,
+    ProtocolPayloadParserException,
+)
+
+
+def read_frames(path):
+    """Returns the valid frames received in a capture."""
+    handler = HDLCHandler()
+    frames = []
+    for record in read_capture(path):
+        if record.direction != CaptureDirection.RX:
+            continue
+        for frame in handler.feed(record.data):
+            try:
+                ProtocolPayload.from_bytes(frame)
+            except ProtocolPayloadParserException:
+                continue
+            frames.append(bytes(frame))
+    return frames
+
+
+def measure(frames):
+    """Prints the peak and retained memory of decoded payloads."""
+    tracemalloc.start()
+    # Peak allocation while decoding a single frame
+    peak = 0
+    for frame in frames:
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        ProtocolPayload.from_bytes(frame)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - start)
+    # Memory held by the decoded payloads kept alive
+    start, _ = tracemalloc.get_traced_memory()
+    payloads = [ProtocolPayload.from_bytes(frame) for frame in frames]
+    retained = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    slotted = not hasattr(ProtocolHeader(), "__dict__")
+    print("slotted dataclasses" if slotted else "dataclasses without slots")
+    print(f"  frames:             {len(payloads)}")
+    print(f"  peak per frame:     {peak} bytes")
+    print(f"  retained per frame: {retained / len(payloads):.0f} bytes")
+
+
+if len(sys.argv) < 2:
+    print(f"Usage: {sys.argv[0]} <capture file>")
+    sys.exit(1)
+
+valid_frames = read_frames(sys.argv[1])
+if not valid_frames:
+    print("No valid frame in the capture")
+    sys.exit(1)
+measure(valid_frames)
+if NO_SLOTS not in sys.argv:
+    subprocess.run([sys.executable, sys.argv[0], sys.argv[1], NO_SLOTS], check=True)